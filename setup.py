@@ -31,6 +31,6 @@ setup(name='fcm',
       ext_modules=[logicle_extension, munkres_extension],
       requires=['numpy (>=1.3.0)',
                 'scipy (>=0.12.0)',
-                'dpmix (>=0.1)',
+                'dpmix (>=0.3)',
                 'matplotlib (>=1.0)'],
       )
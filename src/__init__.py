@@ -1,38 +1,60 @@
 """setup all things exported from FCM
 """
 
-from fcm.core import FCMdata, FCMcollection
+from fcm.core import FCMdata, FCMcollection, LazyFCMcollection
 from fcm.core import Annotation
 from fcm.core import PolyGate, points_in_poly, QuadGate, IntervalGate, ThresholdGate
-from fcm.core import generate_f_score_gate
+from fcm.core import BoxGate, RectGate, EllipseGate
+from fcm.core import GateExpression, AndGate, OrGate, NotGate
+from fcm.core import generate_f_score_gate, f_score_thresholds
+from fcm.core import GatingPlan, apply_gates, GridIndex
 from fcm.core import BadFCMPointDataTypeError, UnimplementedFcsDataMode
-from fcm.core import CompensationError
+from fcm.core import CompensationError, CollectionError
 from fcm.core import load_compensate_matrix, compensate, gen_spill_matrix
+from fcm.core import CompensationCache, estimate_spill
 from fcm.io import FCSreader, loadFCS, loadMultipleFCS, FlowjoWorkspace, load_flowjo_xml, export_fcs
+from fcm.io import save_mixture, load_mixture
 from fcm.core import Subsample, SubsampleFactory, DropChannel, RandomSubsample, AnomalySubsample, BiasSubsample
+from fcm.core import StratifiedSubsample, reservoir_sample
 from fcm.core import logicle, hyperlog
 
 __all__ = [
     # Objects
     'FCMdata',
     'FCMcollection',
+    'LazyFCMcollection',
     'PolyGate',
     'QuadGate',
     'IntervalGate',
     'ThresholdGate',
+    'BoxGate',
+    'RectGate',
+    'EllipseGate',
+    'GateExpression',
+    'AndGate',
+    'OrGate',
+    'NotGate',
+    'GatingPlan',
+    'GridIndex',
     'FCSreader',
     'Annotation',
     'FlowjoWorkspace',
+    'CompensationCache',
     # Exceptions
     'BadFCMPointDataTypeError',
     'UnimplementedFcsDataMode',
     'CompensationError',
+    'CollectionError',
     # functions
     'generate_f_score_gate',
+    'f_score_thresholds',
+    'apply_gates',
     'logicle',
     'hyperlog',
     'loadFCS',
     'loadMultipleFCS',
     'load_compensate_matrix',
     'load_flowjo_xml',
+    'save_mixture',
+    'load_mixture',
 ]
@@ -3,12 +3,19 @@ Core objects and methods for working with flow cytometry data
 """
 
 from fcm.core.fcmdata import FCMdata
-from fcm.core.fcmcollection import FCMcollection
+from fcm.core.fcmcollection import FCMcollection, LazyFCMcollection
 from fcm.core.annotation import Annotation
 from fcm.core.fcmexceptions import BadFCMPointDataTypeError, UnimplementedFcsDataMode
-from fcm.core.fcmexceptions import CompensationError
+from fcm.core.fcmexceptions import CompensationError, CollectionError
 from fcm.core.transforms import logicle, hyperlog, productlog
 from fcm.core.gate import PolyGate, points_in_poly, QuadGate, IntervalGate, ThresholdGate
-from fcm.core.gate import generate_f_score_gate
+from fcm.core.gate import BoxGate, RectGate, EllipseGate
+from fcm.core.gate import GateExpression, AndGate, OrGate, NotGate
+from fcm.core.gate import generate_f_score_gate, f_score_thresholds
+from fcm.core.gating import GatingPlan, apply_gates
+from fcm.core.gridindex import GridIndex
 from fcm.core.subsample import Subsample, SubsampleFactory, DropChannel, RandomSubsample, AnomalySubsample, BiasSubsample
+from fcm.core.subsample import StratifiedSubsample, sample_indices, reservoir_sample
 from fcm.core.compensate import load_compensate_matrix, compensate, gen_spill_matrix, get_spill
+from fcm.core.compensate import CompensationCache
+from fcm.core.spillover import estimate_spill
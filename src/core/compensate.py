@@ -1,7 +1,11 @@
-from numpy import reshape, max, loadtxt, eye
-from numpy.linalg import solve, inv
+from numpy import reshape, max, loadtxt, asarray, empty, empty_like, dot
+from numpy import result_type
+from numpy.linalg import inv
+from collections import OrderedDict
+from threading import Lock
 from fcmexceptions import CompensationError
 from tree import CompensationNode
+from spillover import estimate_spill
 from StringIO import StringIO
 
 
@@ -19,9 +23,93 @@ def get_spill(text):
     return S, markers
 
 
-def compensate(fcm, S=None, markers=None, comp=False, scale=False):
+class CompensationCache(object):
+
+    """
+    Cache of factorized spillover matrices.
+
+    Every tube of a panel usually shares the same spillover matrix, so the
+    inverse is computed once per (matrix, marker order) and reused.  Pass one
+    cache to every call of compensate (FCMcollection.compensate does this for
+    you) to share the factorization between samples.  The cache can be
+    shared between threads; a pickled copy, as sent to a process pool,
+    starts empty.
+    """
+
+    def __init__(self, maxsize=32):
+        """
+        maxsize = number of factorized matrices to keep
+        """
+        self.maxsize = maxsize
+        self._factors = OrderedDict()
+        self._lock = Lock()
+
+    def __getstate__(self):
+        # the lock can not be pickled, and each process factors for itself
+        return {'maxsize': self.maxsize}
+
+    def __setstate__(self, state):
+        self.__init__(state['maxsize'])
+
+    def __len__(self):
+        return len(self._factors)
+
+    def clear(self):
+        """remove all cached factorizations"""
+        with self._lock:
+            self._factors.clear()
+
+    def get(self, spill, markers=None, comp=False, scale=False):
+        """return the matrix X such that data * X compensates data"""
+        spill = asarray(spill, dtype='double')
+        if markers is None:
+            markers = ()
+        key = (spill.shape, spill.tostring(), tuple(markers), comp, scale)
+        with self._lock:
+            try:
+                factor = self._factors.pop(key)
+            except KeyError:
+                factor = _factorize(spill, comp, scale)
+                while len(self._factors) >= self.maxsize > 0:
+                    self._factors.popitem(last=False)
+            if self.maxsize > 0:
+                self._factors[key] = factor
+        return factor
+
+    def apply(self, data, spill, markers=None, comp=False, scale=False,
+              out=None, cols=None, blocksize=65536):
+        """
+        compensate the columns cols of data (all columns if None), writing
+        the compensated values into the same columns of out.  out defaults
+        to data, overwriting it.
+        """
+        factor = self.get(spill, markers, comp, scale)
+        if out is None:
+            out = data
+        if cols is None:
+            cols = slice(None)
+        n = data.shape[0]
+        k = factor.shape[0]
+        buf = empty((min(blocksize, n), k),
+                    dtype=result_type(data.dtype, factor.dtype))
+        for start in range(0, n, blocksize):
+            stop = min(start + blocksize, n)
+            blk = buf[:stop - start]
+            dot(data[start:stop, cols], factor, out=blk)
+            out[start:stop, cols] = blk
+        return out
+
+
+default_cache = CompensationCache()
+
+
+def compensate(fcm, S=None, markers=None, comp=False, scale=False,
+               cache=None):
     """Compensate data given spillover matrix S and markers to compensate
     If S, markers is not given, will look for fcm.annotate.text['SPILL']
+    cache is the CompensationCache to factor S with, defaults to a module
+    wide cache.  The compensated data is written straight into the buffer
+    of the new view, the current view is left unchanged.
     """
     if S is None and markers is not None:
         msg = 'Attempted compnesation on markers without spillover matrix'
@@ -30,26 +118,35 @@ def compensate(fcm, S=None, markers=None, comp=False, scale=False):
         S, m = get_spill(fcm.notes.text['spill'])
         if markers is None:
             markers = m
+    if cache is None:
+        cache = default_cache
     idx = fcm.name_to_index(markers)
 
-    c = _compensate(fcm.view()[:, idx], S, comp, scale)
-    new = fcm.view().copy()
-    new[:, idx] = c
+    data = fcm.view()
+    new = empty_like(data)
+    # only the channels left uncompensated are copied over
+    done = set(asarray(idx).ravel())
+    for i in range(data.shape[1]):
+        if i not in done:
+            new[:, i] = data[:, i]
+    cache.apply(data, S, markers, comp, scale, out=new, cols=idx)
     node = CompensationNode('', fcm.get_cur_node, new, markers, S)
     fcm.add_view(node)
     return new
 
 
-def _compensate(data, spill, comp=False, scale=False):
+def _factorize(spill, comp=False, scale=False):
     if scale and not comp:
         spill = spill / max(spill)
     if comp:
-        spill = inv(spill)
+        return spill.copy()
 
-    # return dot(data,spill)
-    # return solve(spill,data.T).T
+    # solve(spill.T, data.T).T == dot(data, inv(spill))
+    return inv(spill)
 
-    return solve(spill.T, data.T).T
+
+def _compensate(data, spill, comp=False, scale=False):
+    return dot(data, _factorize(spill, comp, scale))
 
 
 def gen_spill_matrix(tubes, unstained):
@@ -59,43 +156,11 @@ def gen_spill_matrix(tubes, unstained):
     channel short name, and a FCMData object corresponding to the unstained
     beads.
     returns a list of channel short names, and an a spillover matrix
+
+    see fcm.core.spillover.estimate_spill for robust statistics and gating
+    of the controls
     """
-    names = {}
-    files = {}
-    for j in tubes.keys():
-        data = tubes[j]
-        files[j] = data
-        d = None
-        try:
-            # look up which channel we actually are.
-            for m, n in data.notes.text.iteritems():
-                if m.startswith('p') and m.endswith('n'):
-                    if j == n:
-                        d = int(m[1:-1]) - 1
-                        names[d] = j
-                elif m.startswith('p') and m.endswith('s'):
-                    if j == n:
-                        d = int(m[1:-1]) - 1
-                        names[d] = j
-        except KeyError:
-            pass
-        except AttributeError:
-            pass
-
-        if d is None:
-            raise ValueError('Cant look up the channel name')
-
-    idxs = sorted(names.keys())
-    base = unstained[:, idxs].mean(0)
-    spill = eye(len(idxs))
-    for k, d in enumerate(idxs):
-
-        data = files[names[d]]
-        norm = (data[:, idxs].mean(0) - base)[k]
-
-        spill[k, :] = (data[:, idxs].mean(0) - base) / norm
-
-    return [names[i] for i in idxs], spill
+    return estimate_spill(tubes, unstained, stat='mean')
 
 
 def load_compensate_matrix(file_name):
@@ -5,6 +5,16 @@ All operations will be performed on each FCMData in the collection.
 
 from UserDict import DictMixin
 from annotation import Annotation
+from compensate import CompensationCache
+from fcmexceptions import CollectionError
+from collections import OrderedDict
+from multiprocessing import Pool
+from multiprocessing.pool import ThreadPool
+import traceback
+import tempfile
+import pickle
+import os
+import shutil
 import numpy
 from functools import reduce
 
@@ -18,13 +28,24 @@ class FCMcollection(DictMixin):
     tree = tree of operations
     """
 
-    def __init__(self, name, fcms=None, notes=None):
+    def __init__(self, name, fcms=None, notes=None, workers=None,
+                 executor='thread'):
         """
         Initialize with fcm collection and notes.
+
+        workers = number of samples processed at once, None or 1 for one
+            at a time
+        executor = 'thread' (a thread pool, for numpy and C work that
+            releases the GIL), 'process' (a process pool, for model fitting)
+            or a pool object with a map method
+
+        workers and executor can also be given to each operation.
         """
         #  - how is this done in fcmdata?
         self.fcmdict = {}
         self.name = name
+        self.workers = workers
+        self.executor = executor
         if fcms is not None:
             for fcm in fcms:
                 self.fcmdict[fcm.name] = fcm
@@ -96,14 +117,79 @@ class FCMcollection(DictMixin):
         result_dict[self.name] = results
         return result_dict
 
+    def _map(self, method, args, kwargs, target=None):
+        """
+        call method on every fcs object (or target.method(fcs, ...) when
+        target is given) in key order, on the collection's workers.
+
+        returns an OrderedDict of the results keyed by sample name, raising
+        a CollectionError holding every failure after the others finish
+        """
+        workers = kwargs.pop('workers', self.workers)
+        executor = kwargs.pop('executor', self.executor)
+        keys = sorted(self.keys())
+        # fcs objects modified in another process are sent back
+        send_back = target is None and (
+            executor == 'process' or (hasattr(executor, 'map') and
+                                      not isinstance(executor, ThreadPool)))
+
+        if hasattr(executor, 'map'):
+            pool = executor
+        elif workers is None or workers <= 1:
+            pool = None
+        elif executor == 'thread':
+            pool = ThreadPool(workers)
+        elif executor == 'process':
+            pool = Pool(workers)
+        else:
+            raise ValueError('executor should be "thread", "process" or '
+                             'a pool, received "%s"' % str(executor))
+
+        results = OrderedDict()
+        errors = {}
+        try:
+            for batch in self._batches(keys, workers):
+                jobs = []
+                for key in batch:
+                    if target is None:
+                        jobs.append((key, self[key], method, args, kwargs,
+                                     send_back))
+                    else:
+                        jobs.append((key, target, method,
+                                     (self[key],) + tuple(args), kwargs,
+                                     send_back))
+                if pool is None:
+                    done = [_call(i) for i in jobs]
+                else:
+                    done = pool.map(_call, jobs, 1)
+                del jobs
+
+                for key, rslt, error in done:
+                    if error is not None:
+                        errors[key] = error
+                    elif send_back:
+                        self[key].__setstate__(rslt.__getstate__())
+                        results[key] = self[key]
+                    else:
+                        results[key] = rslt
+        finally:
+            if pool is not None and pool is not executor:
+                pool.close()
+                pool.join()
+        if errors:
+            raise CollectionError(errors, results)
+        return results
+
+    def _batches(self, keys, workers):
+        """yield the keys in the groups they are processed in"""
+        yield keys
+
     def log(self, *args, **kwargs):
         """
         apply log transform the fcs objects in the collection
         """
 
-        # TODO make it atomic?
-        for i in self.fcmdict:
-            self.fcmdict[i].log(*args, **kwargs)
+        self._map('log', args, kwargs)
         return self
 
     def logicle(self, *args, **kwargs):
@@ -111,25 +197,24 @@ class FCMcollection(DictMixin):
         apply logicle transform to the fcs objects in the collection
         """
 
-        # TODO make it atomic?
-        for i in self.fcmdict:
-            self.fcmdict[i].logicle(*args, **kwargs)
+        self._map('logicle', args, kwargs)
         return self
 
     def compensate(self, *args, **kwargs):
         """
-        apply compensation to the fcs objects in a collection
+        apply compensation to the fcs objects in a collection, sharing one
+        factorized spillover matrix between them
         """
-        for i in self.fcmdict:
-            self.fcmdict[i].compensate(*args, **kwargs)
+        if 'cache' not in kwargs:
+            kwargs['cache'] = CompensationCache()
+        self._map('compensate', args, kwargs)
         return self
 
     def gate(self, *args, **kwargs):
         """
         apply a gate to the fcs objects in a collection
         """
-        for i in self.fcmdict:
-            self.fcmdict[i].gate(*args, **kwargs)
+        self._map('gate', args, kwargs)
         return self
 
     def summary(self):
@@ -138,34 +223,236 @@ class FCMcollection(DictMixin):
         """
 
         return '\n'.join(
-            ['%s:\n%s' % (i, self.fcmdict[i].summary()) for i in self.fcmdict])
+            ['%s:\n%s' % (i, self[i].summary()) for i in self.keys()])
 
-    def classify(self, mixture):
+    def classify(self, mixture, **kwargs):
         """
-        classify each fcs object in the collection using a mixture model
+        classify each fcs object in the collection using a mixture model.
+        each object is scored in blocks, posterior=True, entropy=True and
+        memory are passed on to mixture.classify
         """
 
-        rslt = {}
-        for i in self.fcmdict:
-            rslt[i] = mixture.classify(self.fcmdict[i])
-        return rslt
+        return self._map('classify', (), kwargs, mixture)
 
     def fit(self, model, *args, **kwargs):
         """
         fit a mixture model to each fcs object in a collection
         """
 
-        rslt = {}
-        for i in self.fcmdict:
-            rslt[i] = model.fit(self.fcmdict[i], *args, **kwargs)
-        return rslt
+        return self._map('fit', args, kwargs, model)
 
     def to_list(self):
         """
         return a list of the fcmdata objects contained in the collection
         """
 
-        return [self.fcmdict[i] for i in self.fcmdict]
+        return [self[i] for i in self.keys()]
+
+
+class LazyFCMcollection(FCMcollection):
+
+    """
+    A collection of fcs files loaded the first time they are used.
+
+    Samples are kept in memory up to a memory budget, beyond it the least
+    recently used ones are dropped, and those holding processed views
+    (anything beyond the loaded data) are pickled to a cache directory to be
+    restored from there.  Collection wide operations stream through the
+    samples, holding only the samples being worked on at once.
+    """
+
+    def __init__(self, name, paths, notes=None, memory=None, cache_dir=None,
+                 loader=None, workers=None, executor='thread', **kwargs):
+        """
+        paths = list of fcs file paths, or dictionary of paths keyed by
+            sample name (file names without their extension by default)
+        memory = number of bytes of sample data kept in memory, None for no
+            limit
+        cache_dir = directory processed samples are spilled to, a temporary
+            directory (removed by close) by default
+        loader = function loading a path, loadFCS by default
+        kwargs = keyword arguments passed on to the loader
+        """
+        super(LazyFCMcollection, self).__init__(
+            name, notes=notes, workers=workers, executor=executor)
+        if isinstance(paths, dict):
+            self.paths = dict(paths)
+        else:
+            self.paths = {}
+            for path in paths:
+                key = os.path.splitext(os.path.basename(path))[0]
+                if key in self.paths:
+                    raise ValueError('two files named %s' % key)
+                self.paths[key] = path
+        self.fcmdict = OrderedDict()  # loaded samples, least recent first
+        self.memory = memory
+        self.cache_dir = cache_dir
+        self.loader = loader
+        self.load_kwargs = kwargs
+        self.spilled = {}
+        self._spilled_state = {}  # tree of each sample when spilled
+        self._pinned = set()
+        self._own_dir = False
+
+    def keys(self):
+        """
+        D.keys() -> list of D's keys
+        """
+        return list(self.paths.keys())
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.paths)
+
+    def __contains__(self, key):
+        return key in self.paths
+
+    def __getitem__(self, item):
+        """return the sample item, loading it if needed"""
+        if item in self.fcmdict:
+            fcm = self.fcmdict.pop(item)
+        elif item in self.spilled:
+            with open(self.spilled[item], 'rb') as fh:
+                fcm = pickle.load(fh)
+        elif item in self.paths:
+            fcm = self._load(self.paths[item])
+        else:
+            raise KeyError(item)
+        self.fcmdict[item] = fcm
+        self._evict()
+        return fcm
+
+    def __setitem__(self, key, value):
+        """add value as sample key, it is spilled if evicted"""
+        self.paths[key] = None
+        self._discard(key)
+        self.fcmdict[key] = value
+        self._evict()
+
+    def __delitem__(self, key):
+        del self.paths[key]
+        self.fcmdict.pop(key, None)
+        self._discard(key)
+
+    def __getattr__(self, name):
+        if name in self.__dict__.get('paths', {}):
+            return self[name]
+        raise AttributeError("'%s' has no attribue '%s'" %
+                             (str(self.__class__), name))
+
+    def _load(self, path):
+        if self.loader is None:
+            from fcm.io import loadFCS
+            return loadFCS(path, **self.load_kwargs)
+        return self.loader(path, **self.load_kwargs)
+
+    def _discard(self, key):
+        if key in self.spilled:
+            os.remove(self.spilled.pop(key))
+            del self._spilled_state[key]
+
+    def _spill(self, key, fcm):
+        if self.cache_dir is None:
+            self.cache_dir = tempfile.mkdtemp(prefix='fcm')
+            self._own_dir = True
+        elif not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir)
+        if key not in self.spilled:
+            fd, path = tempfile.mkstemp(prefix='%s_' % self.name,
+                                        suffix='.pkl', dir=self.cache_dir)
+            os.close(fd)
+            self.spilled[key] = path
+        with open(self.spilled[key], 'wb') as fh:
+            pickle.dump(fcm, fh, pickle.HIGHEST_PROTOCOL)
+        self._spilled_state[key] = _tree_state(fcm)
+
+    def close(self):
+        """
+        remove the spilled samples, and the cache directory if the
+        collection made it.  processed samples not in memory are lost.
+        """
+        spilled = self.__dict__.get('spilled', {})
+        for key in list(spilled):
+            path = spilled.pop(key)
+            if os.path.exists(path):
+                os.remove(path)
+        self.__dict__.get('_spilled_state', {}).clear()
+        if self.__dict__.get('_own_dir'):
+            shutil.rmtree(self.cache_dir, ignore_errors=True)
+            self.cache_dir = None
+            self._own_dir = False
+
+    def __del__(self):
+        self.close()
+
+    def nbytes(self):
+        """number of bytes of data held by the loaded samples"""
+        return sum(_nbytes(i) for i in self.fcmdict.values())
+
+    def _evict(self):
+        if self.memory is None:
+            return
+        sizes = [(key, _nbytes(self.fcmdict[key])) for key in self.fcmdict]
+        used = sum(i[1] for i in sizes)
+        for key, size in sizes[:-1]:  # always keep the most recent
+            if used <= self.memory:
+                break
+            if key in self._pinned:
+                continue
+            fcm = self.fcmdict.pop(key)
+            # processed samples are spilled again only if their tree changed
+            if (self.paths[key] is None or len(fcm.tree.nodes) > 1) and \
+                    self._spilled_state.get(key) != _tree_state(fcm):
+                self._spill(key, fcm)
+            used -= size
+
+    def _batches(self, keys, workers):
+        size = max(workers or 1, 1)
+        try:
+            for i in range(0, len(keys), size):
+                self._pinned = set(keys[i:i + size])
+                yield keys[i:i + size]
+                self._pinned = set()
+        finally:
+            self._pinned = set()
+            self._evict()
+
+    def load(self, keys=None):
+        """load the samples keys (all by default), returns self"""
+        if keys is None:
+            keys = self.keys()
+        for key in keys:
+            self[key]
+        return self
+
+
+def _nbytes(fcm):
+    """number of bytes of the arrays held by the nodes of a fcs object"""
+    total = 0
+    for node in fcm.tree.nodes.values():
+        for value in node.__dict__.values():
+            if isinstance(value, numpy.ndarray):
+                total += value.nbytes
+    return total
+
+
+def _tree_state(fcm):
+    """the node names and current node of a fcs object's tree"""
+    return sorted(fcm.tree.nodes), fcm.tree.current.name
+
+
+def _call(job):
+    """run one sample's share of FCMcollection._map"""
+    key, obj, method, args, kwargs, send_back = job
+    try:
+        rslt = getattr(obj, method)(*args, **kwargs)
+    except Exception as e:
+        return key, None, (e, traceback.format_exc())
+    if send_back:
+        return key, obj, None
+    return key, rslt, None
 
 
 if __name__ == '__main__':
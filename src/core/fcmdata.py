@@ -10,7 +10,7 @@ from transforms import log_transform as _log
 from tree import Tree
 from fcm.core.compensate import compensate
 from fcm.core.subsample import Subsample, RandomSubsample, AnomalySubsample
-from fcm.core.subsample import BiasSubsample
+from fcm.core.subsample import BiasSubsample, StratifiedSubsample
 #from fcm.io.export_to_fcs import export_fcs
 from subsample import DropChannel, AddChannel
 
@@ -252,8 +252,20 @@ class FCMdata(object):
     def gate(self, g, chan=None):
         """return gated region of fcm data"""
 
+        if chan is None:
+            # gating plans always use the channels of their gates
+            return g.gate(self)
         return g.gate(self, chan)
 
+    def grid_index(self, chan, bins=256):
+        """
+        return the grid index of the current view over two channels, cached
+        on the current node for repeated gating
+        """
+        chan = [self.name_to_index(i) if isinstance(i, basestring) else i
+                for i in chan]
+        return self.current_node.grid_index(chan, bins)
+
     def subsample(self, s, model='random', *args, **kwargs):
         """return subsampled/sliced fcm data"""
         if isinstance(s, Subsample):
@@ -263,17 +275,21 @@ class FCMdata(object):
             return r.subsample(self)
         else:
             if model == 'random':
-                r = RandomSubsample(s)
+                r = RandomSubsample(s, *args, **kwargs)
+                return r.subsample(self)
+            elif model == 'stratified':
+                r = StratifiedSubsample(s, *args, **kwargs)
+                return r.subsample(self)
             elif model == 'anomaly':
                 r = AnomalySubsample(s, *args, **kwargs)
             elif model == 'bias':
                 r = BiasSubsample(s, *args, **kwargs)
             return r.subsample(self, *args, **kwargs)
 
-    def compensate(self, sidx=None, spill=None):
+    def compensate(self, sidx=None, spill=None, cache=None):
         """Compensate the fcm data"""
 
-        compensate(self, S=spill, markers=sidx)
+        compensate(self, S=spill, markers=sidx, cache=cache)
         return self
 
     def get_cur_node(self):
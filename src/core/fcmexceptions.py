@@ -42,3 +42,20 @@ class UnimplementedFcsDataMode(Exception):
         self.mode = mode
         self.message = "Currently fcs data stored as type \'%s\' is unsupported" % mode
         self.args = (mode,)
+
+
+class CollectionError(Exception):
+
+    """Exception raised when an operation fails on members of a collection
+
+    errors: dictionary of (exception, formatted traceback) keyed by the
+        names of the failed members
+    results: results of the members that succeeded
+    """
+
+    def __init__(self, errors, results=None):
+        self.errors = errors
+        self.results = results
+        self.message = "failed on %d sample(s): %s" % (
+            len(errors), ', '.join(str(i) for i in sorted(errors)))
+        self.args = (self.message,)
@@ -1,5 +1,6 @@
 import numpy
-from tree import GatingNode
+from multiprocessing.pool import ThreadPool
+from tree import GatingNode, QuadrantNode
 from matplotlib.path import Path
 
 
@@ -23,6 +24,15 @@ class Filter(object):
         """do the actual gating here."""
         pass
 
+    def __and__(self, other):
+        return AndGate([self, other])
+
+    def __or__(self, other):
+        return OrGate([self, other])
+
+    def __invert__(self):
+        return NotGate([self])
+
     def __repr__(self):
         return "%s(%s,%s,%s)" % (self.__class__,
                                  str(self.vert),
@@ -39,21 +49,30 @@ class PolyGate(Filter):
     An object representing a polygonal gatable region
     """
 
-    def gate(self, fcm, chan=None, invert=False, name=None):
+    def gate(self, fcm, chan=None, invert=False, name=None, index=None):
         """
         return gated region of FCM data
+
+        index = GridIndex of the current view over chan (see
+            FCMdata.grid_index), so only events near the polygon edges
+            are tested.  an index built from another node, or from data
+            since replaced, is rebuilt for the current view.
         """
         if chan is None:
             chan = self.chan
-        if isinstance(chan, tuple):
-            chan = list(chan)
-        for i, j in enumerate(chan):
-            if isinstance(j, str):
-                chan[i] = fcm.name_to_index(j)
+        chan = channel_indices(fcm, chan)
 
         if name is None:
             name = self.name
-        idxs = points_in_poly(self.vert, fcm.view()[:, chan])
+        if index is not None:
+            if index.chan is not None and index.chan != list(chan):
+                raise ValueError('grid index is over channels %s, not %s' %
+                                 (str(index.chan), str(chan)))
+            if not fcm.current_node.indexed_by(index):
+                index = fcm.current_node.grid_index(chan, index.bins)
+            idxs = index.mask(self.vert)
+        else:
+            idxs = self.mask(fcm.view()[:, chan])
 
         if invert:
             idxs = numpy.invert(idxs)
@@ -62,6 +81,9 @@ class PolyGate(Filter):
         fcm.add_view(node)
         return fcm
 
+    def mask(self, x):
+        return points_in_poly(self.vert, x)
+
 
 class QuadGate(Filter):
 
@@ -91,33 +113,20 @@ class QuadGate(Filter):
                 'name must be empty or contain 4 items: name is %s' %
                 str(name))
 
-        # I (+,+), II (-,+), III (-,-), and IV (+,-)
-        x = fcm.view()[:, chan[0]]
-        y = fcm.view()[:, chan[1]]
-        quad = {}
-        quad[1] = (x > self.vert[0]) & (y > self.vert[1])  # (+,+)
-        quad[2] = (x < self.vert[0]) & (y > self.vert[1])  # (-,+)
-        quad[3] = (x < self.vert[0]) & (y < self.vert[1])  # (-,-)
-        quad[4] = (x > self.vert[0]) & (y < self.vert[1])  # (+,-)
+        labels = self.labels(fcm.view()[:, channel_indices(fcm, chan)])
+        counts = numpy.bincount(labels, minlength=5)
         root = fcm.get_cur_node()
         cname = root.name
 
         if name is "":
-            name = ["q%d" % i for i in quad.keys()]
+            name = ["q%d" % i for i in range(1, 5)]
 
         if _full:
             nodes = []
-        for i in quad.keys():
-            if not self.allow_empty:
-                if True in quad[i]:
-                    fcm.tree.visit(cname)
-                    node = GatingNode(name[i - 1], root, quad[i])
-                    fcm.add_view(node)
-                    if _full:
-                        nodes.append(node)
-            else:
+        for i in range(1, 5):
+            if self.allow_empty or counts[i] > 0:
                 fcm.tree.visit(cname)
-                node = GatingNode(name[i - 1], root, quad[i])
+                node = QuadrantNode(name[i - 1], root, labels, i)
                 fcm.add_view(node)
                 if _full:
                     nodes.append(node)
@@ -126,6 +135,32 @@ class QuadGate(Filter):
         else:
             return fcm
 
+    def labels(self, x):
+        """
+        return an uint8 array labeling each event of x by its quadrant,
+        I (+,+), II (-,+), III (-,-), and IV (+,-), or 0 for events on
+        either dividing line
+        """
+        sx = (x[:, 0] > self.vert[0]).view('int8') - \
+            (x[:, 0] < self.vert[0]).view('int8')
+        sy = (x[:, 1] > self.vert[1]).view('int8') - \
+            (x[:, 1] < self.vert[1]).view('int8')
+        sx *= 3
+        sx += sy
+        sx += 4
+        return _QUADRANT_LUT[sx]
+
+    def quadrants(self, x):
+        """
+        return a dictionary of boolean indexes of the events of x in
+        quadrants I (+,+), II (-,+), III (-,-), and IV (+,-)
+        """
+        labels = self.labels(x)
+        return dict((i, labels == i) for i in range(1, 5))
+
+# quadrant of 3 * sign(x) + sign(y) + 4
+_QUADRANT_LUT = numpy.array([3, 0, 2, 0, 0, 0, 4, 0, 1], dtype='uint8')
+
 
 class IntervalGate(Filter):
 
@@ -143,17 +178,20 @@ class IntervalGate(Filter):
         if name is None:
             name = self.name
 
-        assert(len(self.chan) == 1)
-        assert(len(self.vert) == 2)
-        assert(self.vert[1] >= self.vert[0])
-
-        x = fcm.view()[:, chan[0]]
-        idxs = numpy.logical_and(x > self.vert[0], x < self.vert[1])
+        idxs = self.mask(fcm.view()[:, channel_indices(fcm, chan)])
 
         node = GatingNode(name, fcm.get_cur_node(), idxs)
         fcm.add_view(node)
         return fcm
 
+    def mask(self, x):
+        assert(len(self.chan) == 1)
+        assert(len(self.vert) == 2)
+        assert(self.vert[1] >= self.vert[0])
+
+        return numpy.logical_and(x[:, 0] > self.vert[0],
+                                 x[:, 0] < self.vert[1])
+
 
 class ThresholdGate(Filter):
 
@@ -184,26 +222,282 @@ class ThresholdGate(Filter):
         if chan is None:
             chan = self.chan
 
-        x = fcm.view()[:, chan]
+        idxs = self.mask(fcm.view()[:, channel_indices(fcm, chan)], op)
+
+        if name is None:
+            name = self.name
+
+        node = GatingNode(name, fcm.get_cur_node(), idxs)
+        fcm.add_view(node)
+        return fcm
+
+    def mask(self, x, op=None):
         if op is None:
             op = self.op
 
         if op == 'g':
-            idxs = numpy.greater(x, self.vert)
+            return numpy.greater(x[:, 0], self.vert)
         elif op == 'l':
-            idxs = numpy.less(x, self.vert)
+            return numpy.less(x[:, 0], self.vert)
         else:
             raise ValueError(
                 'op should be "g" or "l", received "%s"' %
                 str(op))
 
+
+class BoxGate(Filter):
+
+    """
+    An object representing a (hyper)rectangular gatable region in any number
+    of channels.  Like the other gates, events on the boundary are outside.
+    """
+
+    def __init__(self, vert, channels, name=None):
+        """
+        vert = pair of corners (lower bounds, upper bounds), one value per
+            channel in each
+        channels = indices of channels to gate on.
+        """
+        super(BoxGate, self).__init__(vert, channels, name)
+        if len(vert) != 2:
+            raise ValueError('vert should be a pair of corners')
+        if len(vert[0]) != len(vert[1]) or \
+                len(vert[0]) != len(_chan_list(channels)):
+            raise ValueError('corners need one value per channel')
+
+    def gate(self, fcm, chan=None, invert=False, name=None):
+        """
+        return the events of FCM data inside the box
+        """
+        if chan is None:
+            chan = self.chan
+
+        if name is None:
+            name = self.name
+
+        idxs = self.mask(fcm.view()[:, channel_indices(fcm, chan)])
+
+        if invert:
+            idxs = numpy.invert(idxs)
+
+        node = GatingNode(name, fcm.get_cur_node(), idxs)
+        fcm.add_view(node)
+        return fcm
+
+    def mask(self, x):
+        lo = numpy.minimum(self.vert[0], self.vert[1])
+        hi = numpy.maximum(self.vert[0], self.vert[1])
+        rslt = numpy.ones(x.shape[0], dtype=bool)
+        tmp = numpy.empty(x.shape[0], dtype=bool)
+        for k in range(len(lo)):
+            rslt &= numpy.greater(x[:, k], lo[k], tmp)
+            rslt &= numpy.less(x[:, k], hi[k], tmp)
+        return rslt
+
+
+class RectGate(BoxGate):
+
+    """
+    An object representing a rectangular gatable region in two channels
+    """
+
+    def __init__(self, vert, channels, name=None):
+        """
+        vert = pair of opposite corners (x, y) of the rectangle
+        channels = indices of the two channels to gate on.
+        """
+        if len(_chan_list(channels)) != 2:
+            raise ValueError('RectGate gates on two channels')
+        super(RectGate, self).__init__(vert, channels, name)
+
+
+class EllipseGate(Filter):
+
+    """
+    An object representing an elliptical (ellipsoidal) gatable region, the
+    events closer than a Mahalanobis distance to a center
+    """
+
+    def __init__(self, vert, cov, channels, distance=1.0, name=None):
+        """
+        vert = center of the ellipse
+        cov = covariance matrix giving the shape of the ellipse
+        channels = indices of channels to gate on.
+        distance = Mahalanobis distance of the ellipse boundary from vert
+        """
+        super(EllipseGate, self).__init__(vert, channels, name)
+        self.cov = numpy.asarray(cov, dtype='d')
+        self.distance = distance
+        self.inv = numpy.linalg.inv(self.cov)
+
+    def gate(self, fcm, chan=None, invert=False, name=None):
+        """
+        return the events of FCM data inside the ellipse
+        """
+        if chan is None:
+            chan = self.chan
+
+        if name is None:
+            name = self.name
+
+        idxs = self.mask(fcm.view()[:, channel_indices(fcm, chan)])
+
+        if invert:
+            idxs = numpy.invert(idxs)
+
+        node = GatingNode(name, fcm.get_cur_node(), idxs)
+        fcm.add_view(node)
+        return fcm
+
+    def mask(self, x, blocksize=65536):
+        rslt = numpy.empty(x.shape[0], dtype=bool)
+        center = numpy.asarray(self.vert, dtype='d')
+        bound = self.distance * self.distance
+        for i in range(0, x.shape[0], blocksize):
+            d = x[i:i + blocksize] - center
+            q = numpy.dot(d, self.inv)
+            q *= d
+            numpy.less(q.sum(1), bound, rslt[i:i + blocksize])
+        return rslt
+
+
+class GateExpression(Filter):
+
+    """
+    A boolean combination of gates built with &, | and ~.
+
+    The channels of all the gates are gathered from the data once and every
+    gate is evaluated on its columns of that array, combining the masks in
+    place, so the expression adds a single gating node.  subclasses define
+    _eval, and only gates with a mask (not QuadGates) can be combined.
+    """
+
+    op = None
+
+    def __init__(self, gates, name=None):
+        """
+        gates = list of Filters combined by the expression
+        """
+        if not hasattr(self, '_eval'):
+            raise TypeError("use AndGate, OrGate or NotGate")
+        for g in gates:
+            if not hasattr(g, 'mask'):
+                raise TypeError("%s can not be combined with other gates" %
+                                g.__class__.__name__)
+        self.gates = []
+        for g in gates:
+            if type(g) is type(self) and not g.name:
+                self.gates.extend(g.gates)
+            else:
+                self.gates.append(g)
+        self.vert = None
+        self.chan = []
+        for g in self.gates:
+            for c in _chan_list(g.chan):
+                if c not in self.chan:
+                    self.chan.append(c)
+        # columns of each gate within self.chan
+        self.cols = [[self.chan.index(c) for c in _chan_list(g.chan)]
+                     for g in self.gates]
+        if name is None:
+            self.name = ""
+        else:
+            self.name = name
+
+    def gate(self, fcm, chan=None, name=None):
+        """
+        return the events of fcm selected by the expression
+        """
+        if chan is None:
+            chan = self.chan
+
         if name is None:
             name = self.name
 
+        idxs = self.mask(fcm.view()[:, channel_indices(fcm, chan)])
+
         node = GatingNode(name, fcm.get_cur_node(), idxs)
         fcm.add_view(node)
         return fcm
 
+    def mask(self, x):
+        """boolean index of the events of x, which holds self.chan"""
+        return self._eval(x, range(x.shape[1]))
+
+    def _masks(self, x, cols):
+        """yield the mask of each gate, cols are the columns of x for chan"""
+        for g, gcols in zip(self.gates, self.cols):
+            gcols = [cols[i] for i in gcols]
+            if isinstance(g, GateExpression):
+                yield g._eval(x, gcols)
+            else:
+                yield g.mask(_take_columns(x, gcols))
+
+    def __repr__(self):
+        return "(%s)" % (" %s " % self.op).join(repr(g) for g in self.gates)
+
+
+class AndGate(GateExpression):
+
+    """events inside all of the gates"""
+
+    op = '&'
+
+    def _eval(self, x, cols):
+        masks = self._masks(x, cols)
+        rslt = next(masks)
+        for m in masks:
+            rslt &= m
+        return rslt
+
+
+class OrGate(GateExpression):
+
+    """events inside any of the gates"""
+
+    op = '|'
+
+    def _eval(self, x, cols):
+        masks = self._masks(x, cols)
+        rslt = next(masks)
+        for m in masks:
+            rslt |= m
+        return rslt
+
+
+class NotGate(GateExpression):
+
+    """events outside of a gate"""
+
+    def _eval(self, x, cols):
+        rslt = next(self._masks(x, cols))
+        return numpy.logical_not(rslt, rslt)
+
+    def __invert__(self):
+        return self.gates[0]
+
+    def __repr__(self):
+        return "~%s" % repr(self.gates[0])
+
+
+def _chan_list(chan):
+    if isinstance(chan, (basestring, int, numpy.integer)):
+        return [chan]
+    return list(chan)
+
+
+def _take_columns(x, cols):
+    """columns cols of x, as a view when they are consecutive"""
+    if list(cols) == list(range(cols[0], cols[0] + len(cols))):
+        return x[:, cols[0]:cols[0] + len(cols)]
+    return x[:, cols]
+
+
+def channel_indices(fcm, chan):
+    """return the list of column indices of fcm for the channels chan"""
+    return [fcm.name_to_index(i) if isinstance(i, basestring) else i
+            for i in _chan_list(chan)]
+
 
 def generate_f_score_gate(
         neg_smaple,
@@ -217,16 +511,8 @@ def generate_f_score_gate(
     position from aproximate f-score calculation
     """
 
-    neg_hist, bins = numpy.histogram(neg_smaple[:, chan], 1000, normed=True)
-    pos_hist, bins = numpy.histogram(pos_sample[:, chan], bins, normed=True)
-
-    xs = (bins[1:] + bins[:-1]) / 2.0
-
-    x0 = numpy.argmax(neg_hist)
-
-    dfa = diff_pseudo_f1(neg_hist[x0:], pos_hist[x0:], beta=beta, theta=theta)
-
-    f_cutoff = xs[x0 + numpy.argmax(dfa)]
+    f_cutoff = f_score_thresholds(neg_smaple, pos_sample, chan, beta=beta,
+                                  theta=theta)[0, 0]
 
     if high:
         return ThresholdGate(f_cutoff, chan, 'g')
@@ -234,18 +520,109 @@ def generate_f_score_gate(
         return ThresholdGate(f_cutoff, chan, 'l')
 
 
+def f_score_thresholds(neg_samples, pos_samples, chan, beta=1, theta=2,
+                       bins=1000):
+    """
+    calculate the 'optimal' threshold of every channel in chan for every pair
+    of negative and positive samples from aproximate f-score calculation
+
+    neg_samples, pos_samples = a sample (array or FCMdata) or lists of paired
+        negative and positive samples
+    chan = a channel or list of channels
+
+    returns an array of thresholds with a row per pair of samples and a
+    column per channel
+    """
+    if hasattr(neg_samples, 'shape'):
+        neg_samples = [neg_samples]
+    if hasattr(pos_samples, 'shape'):
+        pos_samples = [pos_samples]
+    if len(neg_samples) != len(pos_samples):
+        raise ValueError('received %d negative and %d positive samples' %
+                         (len(neg_samples), len(pos_samples)))
+    chan = _chan_list(chan)
+
+    neg_hist = []
+    pos_hist = []
+    xs = []
+    for neg, pos in zip(neg_samples, pos_samples):
+        nh, ph, x = _shared_histograms(numpy.asarray(neg[:, chan]),
+                                       numpy.asarray(pos[:, chan]), bins)
+        neg_hist.append(nh)
+        pos_hist.append(ph)
+        xs.append(x)
+    neg_hist = numpy.concatenate(neg_hist)
+    pos_hist = numpy.concatenate(pos_hist)
+    xs = numpy.concatenate(xs)
+
+    # only thresholds above the mode of the negative sample
+    x0 = numpy.argmax(neg_hist, 1)
+    below = numpy.arange(bins) < x0[:, numpy.newaxis]
+    neg_hist[below] = 0
+    pos_hist[below] = 0
+
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        dfa = diff_pseudo_f1(neg_hist, pos_hist, beta=beta, theta=theta)
+    dfa[below | numpy.isnan(dfa)] = -numpy.inf
+
+    best = numpy.argmax(dfa, 1)
+    cutoffs = xs[numpy.arange(len(best)), best]
+    return cutoffs.reshape(len(neg_samples), len(chan))
+
+
+def _shared_histograms(neg, pos, bins):
+    """
+    histogram every column of neg and pos on bins spanning the column of
+    neg, normalized to sum to one.  returns the histograms of neg and pos
+    and the bin centers, one row per column
+    """
+    lo = neg.min(0).astype('d')
+    hi = neg.max(0).astype('d')
+    flat = lo == hi
+    lo[flat] -= 0.5
+    hi[flat] += 0.5
+    width = (hi - lo) / bins
+    offset = bins * numpy.arange(neg.shape[1])
+
+    def _hist(x):
+        t = x - lo
+        t /= width
+        # events on the upper edge belong to the last bin
+        ok = (t >= 0) & (x <= hi)
+        numpy.minimum(t, bins - 1, t)
+        idx = t.astype(int)
+        idx += offset
+        counts = numpy.bincount(idx[ok], minlength=bins * len(lo))
+        counts = counts.reshape(len(lo), bins).astype('d')
+        counts /= numpy.maximum(counts.sum(1), 1)[:, numpy.newaxis]
+        return counts
+
+    centers = lo[:, numpy.newaxis] + width[:, numpy.newaxis] * \
+        (numpy.arange(bins) + 0.5)
+    return _hist(neg), _hist(pos), centers
+
+
+def _rcumsum(x):
+    """reverse cumulative sum along the last axis, sum(x[..., i:])"""
+    return numpy.cumsum(x[..., ::-1], -1)[..., ::-1]
+
+
 def diff_pseudo_f(neg_pdf, pos_pdf, beta=1, theta=2, full=False):
-    n = len(neg_pdf)
-    c1 = numpy.array([numpy.sum(pos_pdf[i:]) for i in range(n)])
-    c2 = numpy.array([numpy.sum(neg_pdf[i:]) for i in range(n)])
+    neg_pdf = numpy.asarray(neg_pdf, dtype='d')
+    pos_pdf = numpy.asarray(pos_pdf, dtype='d')
+    c1 = _rcumsum(pos_pdf)
+    c2 = _rcumsum(neg_pdf)
+    theta = theta * numpy.ones(pos_pdf.shape[:-1] + (1,))
     c3 = numpy.where(pos_pdf > theta * neg_pdf, pos_pdf - neg_pdf, 0)
-    while numpy.all(c3 == 0):
-        theta -= 0.01
+    empty = numpy.all(c3 == 0, -1)
+    while numpy.any(empty):
+        theta[empty] -= 0.01
         c3 = numpy.where(pos_pdf > theta * neg_pdf, pos_pdf - neg_pdf, 0)
-    c4 = numpy.array([numpy.sum(c3[i:]) for i in range(n)])
+        empty = numpy.all(c3 == 0, -1)
+    c4 = _rcumsum(c3)
     precision = c1 / (c1 + c2)
     # recall = c1/numpy.sum(pos_pdf)
-    recall = c4 / numpy.sum(c3)
+    recall = c4 / c4[..., :1]
     diff = (1 + beta * beta) * (precision * recall) / \
         (beta * beta * precision + recall)
     if full:
@@ -255,15 +632,16 @@ def diff_pseudo_f(neg_pdf, pos_pdf, beta=1, theta=2, full=False):
 
 
 def diff_pseudo_f1(neg_pdf, pos_pdf, beta=1, theta=2, full=False):
-    n = len(neg_pdf)
+    neg_pdf = numpy.asarray(neg_pdf, dtype='d')
+    pos_pdf = numpy.asarray(pos_pdf, dtype='d')
     fpos = numpy.where(pos_pdf > theta * neg_pdf, pos_pdf - neg_pdf, 0)
-    tp = numpy.array([numpy.sum(fpos[i:]) for i in range(n)])
-    fn = numpy.array([numpy.sum(fpos[:i]) for i in range(n)])
-    fp = numpy.array([numpy.sum(neg_pdf[i:]) for i in range(n)])
+    tp = _rcumsum(fpos)
+    fn = numpy.cumsum(fpos, -1) - fpos
+    fp = _rcumsum(neg_pdf)
     precision = tp / (tp + fp)
     precision[tp == 0] = 0
     recall = tp / (tp + fn)
-    recall[recall == 0] = 0
+    recall[tp == 0] = 0
     diff = (1 + beta * beta) * (precision * recall) / \
         (beta * beta * precision + recall)
 
@@ -281,33 +659,61 @@ def scale(k=1):
     return f
 
 
-def points_in_poly(vs, ps):
+def points_in_poly(vs, ps, blocksize=65536, workers=None):
     """Return boolean index of events from ps that are inside polygon with vertices vs.
 
     vs = numpy.array((k, 2))
     ps = numpy.array((n, 2))
+    blocksize = number of events tested at a time
+    workers = number of threads to test blocks of events on
     """
+    vs = numpy.asarray(vs, dtype='double')
+    n = len(ps)
+    inside = numpy.zeros(n, dtype='bool')
+    if n == 0 or len(vs) < 3:
+        return inside
+
+    # edges run from vertex i to vertex i-1
+    x0 = vs[:, 0]
+    y0 = vs[:, 1]
+    dx = numpy.roll(x0, 1) - x0
+    dy = numpy.roll(y0, 1) - y0
+    x1 = x0 + dx
+    lo = vs.min(0)
+    hi = vs.max(0)
+
+    def _block(bounds):
+        start, stop = bounds
+        px = ps[start:stop, 0]
+        py = ps[start:stop, 1]
+        # only events within the bounding box can be inside
+        cand = numpy.flatnonzero((px > lo[0]) & (px <= hi[0]) &
+                                 (py > lo[1]) & (py <= hi[1]))
+        if len(cand) == 0:
+            return
+        px = px[cand]
+        py = py[cand]
+        parity = numpy.zeros(len(cand), dtype='uint8')
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            for i in range(len(vs)):
+                cross = ((x0[i] < px) & (x1[i] >= px)) | \
+                    ((x1[i] < px) & (x0[i] >= px))
+                cross &= y0[i] + (px - x0[i]) / dx[i] * dy[i] < py
+                parity ^= cross
+        inside[start + cand] = parity.view('bool')
+
+    blocks = [(i, min(i + blocksize, n)) for i in range(0, n, blocksize)]
+    if workers is not None and workers > 1 and len(blocks) > 1:
+        pool = ThreadPool(workers)
+        try:
+            pool.map(_block, blocks)
+        finally:
+            pool.close()
+    else:
+        for i in blocks:
+            _block(i)
 
-    # optimization to check only events within bounding box
-    # for polygonal gate - useful if gating region is small
-    # area_ratio_threshold = 0.5
-    # area_gate_bb = numpy.prod(numpy.max(vs, 0) - numpy.min(vs, 0))
-    # area_gate_ps = numpy.prod(numpy.max(ps, 0) - numpy.min(ps, 0))
-    # if area_gate_bb/area_gate_ps < area_ratio_threshold:
-    #     idx = numpy.prod((ps > numpy.min(vs, 0)) & (ps < numpy.max(vs, 0)),1)
-    #     ps = ps[idx.astype('bool'), :]
-
-    j = len(vs) - 1
-    inPoly = numpy.zeros((len(vs), len(ps)), 'bool')
-
-    for i, v in enumerate(vs):
-        inPoly[i, :] |= ((v[0] < ps[:, 0]) & (vs[j, 0] >= ps[:, 0])) | (
-            (vs[j, 0] < ps[:, 0]) & (v[0] >= ps[:, 0]))
-        inPoly[i, :] &= (
-            v[1] + (ps[:, 0] - v[0]) / (vs[j, 0] - v[0]) * (vs[j, 1] - v[1]) < ps[:, 1])
-        j = i
-
-    return numpy.bitwise_or.reduce(inPoly, 0)
+    return inside
 
 if __name__ == '__main__':
     vertices = numpy.array([[5, 5], [10, 5], [10, 10], [5, 10]], 'd')
@@ -0,0 +1,195 @@
+"""
+Compile whole gating hierarchies and evaluate them in a single pass
+"""
+
+import numpy
+from tree import GatingNode, QuadrantNode
+from gate import QuadGate, channel_indices
+
+
+class GatingPlan(object):
+
+    """
+    A compiled gating hierarchy.
+
+    Gates are grouped by the channels they look at so every channel group is
+    pulled out of the data once, each gate is evaluated against the data the
+    plan is applied to, and child populations are formed by and-ing their
+    mask with their parent's.  All gating nodes are then added to the tree
+    at once.
+    """
+
+    def __init__(self, gates):
+        """
+        gates = a list of gates applied directly to the current view, a list
+            of (gate, parent) pairs where parent is None, a gate earlier in the
+            list, or the name of one, or a gate tree: a flowjo population, a
+            flowjo sample (xmlfcsfile) or a FlowjoWorkspace holding a single
+            sample.
+        """
+        self.entries = []  # (gate, parent entry index or None)
+        for g, parent in _flatten(gates):
+            self.entries.append((g, self._find(parent)))
+
+    def _find(self, parent):
+        if parent is None:
+            return None
+        for i, (g, unused) in enumerate(self.entries):
+            if g is parent:
+                return i
+        for i, (g, unused) in enumerate(self.entries):
+            if isinstance(g, QuadGate):
+                continue
+            if g.name == parent:
+                return i
+        for i, (g, unused) in enumerate(self.entries):
+            if isinstance(g, QuadGate) and parent in _quad_names(g):
+                return (i, _quad_names(g).index(parent) + 1)
+        raise KeyError('No gate named %s earlier in the plan' % str(parent))
+
+    def __len__(self):
+        return len(self.entries)
+
+    def masks(self, fcm):
+        """
+        evaluate every gate against the current view of fcm and return a list
+        of boolean indexes into that view, one per gate (quadrant labels for
+        QuadGates), with parent gates already applied
+        """
+        data = fcm.view()
+        groups = {}
+        for g, unused in self.entries:
+            key = tuple(channel_indices(fcm, g.chan))
+            if key not in groups:
+                groups[key] = data[:, list(key)]
+
+        masks = []
+        for g, parent in self.entries:
+            x = groups[tuple(channel_indices(fcm, g.chan))]
+            if isinstance(g, QuadGate):
+                own = g.labels(x)
+                if parent is not None:
+                    own[~_lookup(masks, parent)] = 0
+            else:
+                own = g.mask(x)
+                if parent is not None:
+                    own &= _lookup(masks, parent)
+            masks.append(own)
+        return masks
+
+    def gate(self, fcm):
+        """
+        apply the plan to the current view of fcm, adding a gating node for
+        every gate.  returns fcm with the starting view selected.
+        """
+        self.nodes(fcm)
+        return fcm
+
+    def nodes(self, fcm):
+        """
+        apply the plan to the current view of fcm and return the list of
+        gating nodes created (up to four per QuadGate).  like QuadGate.gate
+        empty quadrants are not added, unless allow_empty is set, and gates
+        below them are skipped.
+        """
+        base = fcm.get_cur_node()
+        masks = self.masks(fcm)
+        created = []
+        for (g, parent), own in zip(self.entries, masks):
+            if parent is None:
+                pnode = base
+                pmask = None
+            else:
+                pnode = _lookup(created, parent)
+                pmask = _lookup(masks, parent)
+            if pnode is None:
+                # the parent quadrant was empty and not added
+                if isinstance(g, QuadGate):
+                    created.append(dict((q, None) for q in range(1, 5)))
+                else:
+                    created.append(None)
+                continue
+            if pmask is not None:
+                own = own[pmask]
+            if isinstance(g, QuadGate):
+                names = _quad_names(g)
+                counts = numpy.bincount(own, minlength=5)
+                quad = {}
+                for q in range(1, 5):
+                    if g.allow_empty or counts[q] > 0:
+                        quad[q] = self._add(fcm, QuadrantNode(
+                            names[q - 1], pnode, own, q))
+                    else:
+                        quad[q] = None
+                created.append(quad)
+            else:
+                created.append(
+                    self._add(fcm, GatingNode(g.name, pnode, own)))
+        fcm.visit(base)
+        return _flat_nodes(created)
+
+    def _add(self, fcm, node):
+        fcm.visit(node.parent)
+        fcm.add_view(node)
+        return node
+
+
+def apply_gates(fcm, gates):
+    """
+    evaluate a gating hierarchy on the current view of fcm in one pass,
+    see GatingPlan for the accepted forms of gates
+    """
+    return GatingPlan(gates).gate(fcm)
+
+
+def _quad_names(g):
+    if g.name:
+        return list(g.name)
+    return ["q%d" % i for i in range(1, 5)]
+
+
+def _lookup(items, idx):
+    if isinstance(idx, tuple):
+        if isinstance(items[idx[0]], dict):
+            return items[idx[0]][idx[1]]
+        return items[idx[0]] == idx[1]
+    return items[idx]
+
+
+def _flat_nodes(created):
+    rslt = []
+    for i in created:
+        if isinstance(i, dict):
+            rslt.extend(i[q] for q in sorted(i) if i[q] is not None)
+        elif i is not None:
+            rslt.append(i)
+    return rslt
+
+
+def _flatten(gates):
+    """yield (gate, parent) pairs, parents before their children"""
+    if hasattr(gates, 'tubes'):  # FlowjoWorkspace
+        if len(gates.tubes) != 1:
+            raise ValueError('workspace holds %d samples, build the plan '
+                             'from one of workspace.tubes' % len(gates.tubes))
+        gates = list(gates.tubes.values())[0]
+    if hasattr(gates, 'pops'):  # flowjo sample
+        gates = [gates.pops[i] for i in gates.pops]
+    elif hasattr(gates, 'subpops'):  # flowjo population
+        gates = [gates]
+
+    for i in gates:
+        if hasattr(i, 'subpops'):
+            for j in _population(i, None):
+                yield j
+        elif isinstance(i, tuple):
+            yield i
+        else:
+            yield i, None
+
+
+def _population(pop, parent):
+    yield pop.gate, parent
+    for i in pop.subpops:
+        for j in _population(pop.subpops[i], pop.gate):
+            yield j
@@ -0,0 +1,151 @@
+"""
+Grid index of events over a pair of channels for fast repeated gating
+"""
+
+import numpy
+from gate import points_in_poly, QuadGate
+
+
+class GridIndex(object):
+
+    """
+    Bins the events of a two channel view into a bins x bins grid once, so
+    that a polygon can be gated by classifying whole cells as inside or
+    outside and only testing the events of cells the polygon edges pass
+    through.
+    """
+
+    def __init__(self, x, bins=256, chan=None):
+        """
+        x = array of events, one column per channel
+        bins = number of cells along each channel
+        chan = indices of the two channels x was taken from, checked by
+            the gates using the index
+        """
+        # the node and data the index was built from (see Node.grid_index)
+        self.source = None
+        self.x = numpy.ascontiguousarray(x, dtype='d')
+        self.bins = bins
+        self.chan = None if chan is None else [int(i) for i in chan]
+        n = self.x.shape[0]
+        if n:
+            self.lo = self.x.min(0)
+            self.width = (self.x.max(0) - self.lo) / bins
+        else:
+            self.lo = numpy.zeros(2)
+            self.width = numpy.ones(2)
+        self.width[self.width <= 0] = 1.0
+        # padding covering rounding of events onto the cell edges
+        self.pad = 1e-9 * self.width
+
+        ij = ((self.x - self.lo) / self.width).astype('int32')
+        numpy.clip(ij, 0, bins - 1, out=ij)
+        self.cells = ij[:, 0] * bins + ij[:, 1]
+        key = self.cells
+        if bins * bins <= 65536:
+            # small keys sort much faster
+            key = key.astype('uint16')
+        self.order = numpy.argsort(key, kind='mergesort').astype('int32')
+        self.counts = numpy.bincount(self.cells, minlength=bins * bins)
+        self.starts = numpy.zeros(bins * bins + 1, dtype='int64')
+        numpy.cumsum(self.counts, out=self.starts[1:])
+
+        edges = [self.lo[k] + self.width[k] * numpy.arange(bins + 1)
+                 for k in range(2)]
+        self.edges = edges
+        self.centers = numpy.column_stack([
+            numpy.repeat(0.5 * (edges[0][1:] + edges[0][:-1]), bins),
+            numpy.tile(0.5 * (edges[1][1:] + edges[1][:-1]), bins)])
+
+    def __len__(self):
+        return self.x.shape[0]
+
+    def members(self, cells):
+        """return the indices of the events in the flat cell indices cells"""
+        cells = numpy.asarray(cells)
+        n = self.counts[cells]
+        total = n.sum()
+        if total == 0:
+            return numpy.zeros(0, dtype='int32')
+        offset = numpy.repeat(self.starts[cells] - (numpy.cumsum(n) - n), n)
+        offset += numpy.arange(total)
+        return self.order[offset]
+
+    def _cell_range(self, k, a, b):
+        i0 = int(numpy.floor((min(a, b) - self.lo[k]) / self.width[k])) - 1
+        i1 = int(numpy.floor((max(a, b) - self.lo[k]) / self.width[k])) + 1
+        return max(i0, 0), min(i1, self.bins - 1)
+
+    def boundary(self, vs):
+        """
+        return a bins x bins boolean array of the cells touched by the edges
+        of the polygon with vertices vs
+        """
+        vs = numpy.asarray(vs, dtype='d')
+        touched = numpy.zeros((self.bins, self.bins), dtype=bool)
+        xe, ye = self.edges
+        px, py = self.pad
+        for k in range(len(vs)):
+            x0, y0 = vs[k - 1]
+            x1, y1 = vs[k]
+            i0, i1 = self._cell_range(0, x0, x1)
+            j0, j1 = self._cell_range(1, y0, y1)
+            if i0 > i1 or j0 > j1:
+                continue
+            dx = x1 - x0
+            dy = y1 - y0
+            # the edge line is (x - x0) * dy - (y - y0) * dx = a(x) - b(y),
+            # a cell is touched if the line passes between its corners
+            a0 = (xe[i0:i1 + 1] - px - x0) * dy
+            a1 = (xe[i0 + 1:i1 + 2] + px - x0) * dy
+            b0 = (ye[j0:j1 + 1] - py - y0) * dx
+            b1 = (ye[j0 + 1:j1 + 2] + py - y0) * dx
+            amin = numpy.minimum(a0, a1)[:, numpy.newaxis]
+            amax = numpy.maximum(a0, a1)[:, numpy.newaxis]
+            bmin = numpy.minimum(b0, b1)
+            bmax = numpy.maximum(b0, b1)
+            touched[i0:i1 + 1, j0:j1 + 1] |= (amin <= bmax) & (amax >= bmin)
+        return touched.ravel()
+
+    def _classify(self, vs):
+        boundary = self.boundary(vs)
+        inside = numpy.zeros(self.bins * self.bins, dtype=bool)
+        interior = numpy.flatnonzero(~boundary & (self.counts > 0))
+        inside[interior] = points_in_poly(vs, self.centers[interior])
+        return inside, self.members(numpy.flatnonzero(boundary))
+
+    def mask(self, vs):
+        """
+        return boolean index of the events inside the polygon with vertices
+        vs, the same as points_in_poly(vs, x)
+        """
+        inside, tested = self._classify(vs)
+        rslt = inside[self.cells]
+        rslt[tested] = points_in_poly(vs, self.x[tested])
+        return rslt
+
+    def count(self, vs):
+        """return the number of events inside the polygon with vertices vs"""
+        inside, tested = self._classify(vs)
+        return int(self.counts[inside].sum() +
+                   points_in_poly(vs, self.x[tested]).sum())
+
+    def quadrant_counts(self, vert):
+        """
+        return the number of events in quadrants I to IV of a quad gate
+        centered at vert
+        """
+        g = QuadGate(vert, None)
+        boundary = numpy.zeros((self.bins, self.bins), dtype=bool)
+        i0, i1 = self._cell_range(0, vert[0], vert[0])
+        j0, j1 = self._cell_range(1, vert[1], vert[1])
+        boundary[i0:i1 + 1, :] = True
+        boundary[:, j0:j1 + 1] = True
+        boundary = boundary.ravel()
+
+        labels = g.labels(self.centers)
+        labels[boundary] = 0
+        counts = numpy.bincount(labels, weights=self.counts, minlength=5)
+        tested = self.members(numpy.flatnonzero(boundary))
+        counts += numpy.bincount(g.labels(self.x[tested]), minlength=5)
+        return counts[1:].astype(int)
@@ -0,0 +1,125 @@
+"""
+Estimate spillover matrices from single stain controls
+"""
+
+from __future__ import division
+import numpy
+from multiprocessing.pool import ThreadPool
+from scipy.stats import trim_mean
+
+
+def _stat_mean(x, trim):
+    return x.mean(0)
+
+
+def _stat_median(x, trim):
+    return numpy.median(x, 0)
+
+
+def _stat_trimmed(x, trim):
+    return trim_mean(x, trim, axis=0)
+
+_STATS = {'mean': _stat_mean,
+          'median': _stat_median,
+          'trimmed': _stat_trimmed}
+
+
+def channel_index(data, name):
+    """
+    find the column of data holding channel name, looking at the channel
+    names first and then at the $PnN/$PnS keywords of the fcs text segment.
+    """
+    try:
+        return data.name_to_index(name)
+    except (ValueError, KeyError, AttributeError):
+        pass
+    try:
+        text = data.notes.text
+        for j in range(1, int(text['par']) + 1):
+            if text.get('p%dn' % j) == name or text.get('p%ds' % j) == name:
+                return j - 1
+    except (KeyError, AttributeError):
+        pass
+    raise ValueError('Cant look up the channel name: %s' % name)
+
+
+def _columns(data, idxs):
+    """
+    gather columns idxs from an array, FCMdata or iterable of chunks.  the
+    chunks are joined in memory, only the columns idxs of each are kept.
+    """
+    if hasattr(data, 'shape'):
+        return numpy.asarray(data[:, idxs])
+    return numpy.concatenate([numpy.asarray(i)[:, idxs] for i in data])
+
+
+def _control_stats(args):
+    data, idxs, k, stat, trim, pos_quantile, neg_quantile, base = args
+    x = _columns(data, idxs)
+    f = _STATS[stat]
+    primary = x[:, k]
+    if base is None:
+        neg = x[primary <= numpy.percentile(primary, 100 * neg_quantile)]
+        base = f(neg, trim)
+    if pos_quantile is not None:
+        x = x[primary >= numpy.percentile(primary, 100 * pos_quantile)]
+    return f(x, trim) - base
+
+
+def estimate_spill(tubes, unstained=None, stat='median', trim=0.1,
+                   pos_quantile=None, neg_quantile=0.5, channels=None,
+                   workers=None):
+    """
+    Estimate a spillover matrix from single stain controls.
+
+    tubes = dictionary of single stain controls keyed by the channel they
+        are stained in.  Each control is a FCMdata object, an array whose
+        columns match the FCMdata objects, or an iterable of such arrays
+        (chunks of a larger file).  Medians and quantiles need every event,
+        so the stained channels of all chunks of a control are held in
+        memory at once.
+    unstained = unstained control used as the negative population.  If None
+        the events of each control at or below the neg_quantile of its own
+        stained channel are used instead.
+    stat = statistic summarising each population: 'median' (default),
+        'trimmed' (trimmed mean cutting trim from each tail) or 'mean'
+    pos_quantile = if given only events at or above this quantile of the
+        stained channel count as the positive population
+    channels = list of channel names of the columns, needed when the
+        controls are plain arrays or chunks
+    workers = number of threads used to summarise the controls
+
+    returns a list of channel names and the spillover matrix, ordered by
+    column, ready to be passed to compensate or CompensationCache
+    """
+    if stat not in _STATS:
+        raise ValueError('stat must be one of %s, received "%s"' %
+                         (str(sorted(_STATS.keys())), str(stat)))
+
+    names = {}
+    for j in tubes:
+        if channels is not None:
+            names[list(channels).index(j)] = j
+        else:
+            names[channel_index(tubes[j], j)] = j
+
+    idxs = sorted(names.keys())
+    if unstained is not None:
+        base = _STATS[stat](_columns(unstained, idxs), trim)
+    else:
+        base = None
+
+    jobs = [(tubes[names[d]], idxs, k, stat, trim, pos_quantile,
+             neg_quantile, base) for k, d in enumerate(idxs)]
+    if workers is not None and workers > 1:
+        pool = ThreadPool(workers)
+        try:
+            rows = pool.map(_control_stats, jobs)
+        finally:
+            pool.close()
+    else:
+        rows = [_control_stats(i) for i in jobs]
+
+    delta = numpy.array(rows)
+    spill = delta / numpy.diag(delta)[:, numpy.newaxis]
+    return [names[i] for i in idxs], spill
@@ -5,9 +5,9 @@ Created on Aug 27, 2009
 """
 from fcm.core.tree import SubsampleNode, DropChannelNode, AddChannelNode
 import fcm
-from fcm.statistics import mixnormpdf
+from fcm.statistics.distributions import compmixnormpdf, _random_state
+from scipy.misc import logsumexp
 import numpy as np
-import numpy.random as npr
 
 
 class Subsample(object):
@@ -47,44 +47,200 @@ SubsampleFactory = _SubsampleFactory()
 class RandomSubsample(Subsample):
 
     """
-    randomly subsample events
+    randomly subsample events without replacement
     """
 
-    def __init__(self, n):
+    def __init__(self, n, seed=None):
         """
-        n = number of events to sample
+        n = number of events to sample, views with fewer events are taken
+            whole
+        seed = seed or numpy RandomState making the sampling repeatable,
+            None uses the global numpy random state
         """
         self.n = n
+        self.rng = _random_state(seed)
 
     def subsample(self, fcs):
-        x = fcs[:]
-        samp = npr.choice(np.arange(x.shape[0]), self.n)
+        """
+        D(<fcmdata>) -> new view of n events of the current view
+        D(<array>) -> array of n events
+        D(<iterable of arrays>) -> array of n events of the stream of chunks
+        """
         if isinstance(fcs, fcm.FCMdata):
+            node = fcs.get_cur_node()
+            samp = sample_indices(node.count(), self.n, self.rng)
+            fcs.add_view(SubsampleNode("", node, samp))
+            return fcs
+        elif hasattr(fcs, 'shape'):
+            return fcs[sample_indices(fcs.shape[0], self.n, self.rng)]
+        else:
+            return reservoir_sample(fcs, self.n, self.rng)[1]
+
+
+class StratifiedSubsample(Subsample):
+
+    """
+    subsample events without replacement separately within strata, such as
+    gated populations or clusters
+    """
+
+    def __init__(self, n, labels, seed=None):
+        """
+        n = number of events to sample from each stratum, or a dictionary of
+            numbers keyed by stratum label.  Strata with fewer events are
+            taken whole and strata missing from the dictionary are skipped.
+        labels = array of stratum labels of the events, a mixture model
+            (anything with a classify method) or a list of gates, where
+            stratum i holds the events in gate i and no earlier gate.
+            Events labelled -1, like those outside every gate, are never
+            sampled.
+        seed = seed or numpy RandomState making the sampling repeatable
+        """
+        self.n = n
+        self.labels = labels
+        self.rng = _random_state(seed)
+
+    def strata(self, x):
+        """return the stratum label of each event of x"""
+        if hasattr(self.labels, 'classify'):
+            return self.labels.classify(x[:])
+        elif isinstance(self.labels, (list, tuple)) and \
+                hasattr(self.labels[0], 'mask'):
+            from gate import channel_indices
+            labels = -np.ones(x.shape[0], dtype='int32')
+            for i, g in enumerate(self.labels):
+                chan = channel_indices(x, g.chan)
+                inside = g.mask(x[:, chan]) & (labels < 0)
+                labels[inside] = i
+            return labels
+        return np.asarray(self.labels)
+
+    def sample(self, labels):
+        """return the sorted positions of events sampled from labels"""
+        order = np.argsort(labels, kind='mergesort')
+        values, starts = np.unique(labels[order], return_index=True)
+        stops = np.append(starts[1:], len(order))
+        samp = []
+        for value, start, stop in zip(values, starts, stops):
+            if value == -1:
+                continue
+            if isinstance(self.n, dict):
+                quota = self.n.get(value, 0)
+            else:
+                quota = self.n
+            quota = min(quota, stop - start)
+            if quota > 0:
+                picked = sample_indices(stop - start, quota, self.rng)
+                samp.append(order[start + picked])
+        if not samp:
+            return np.zeros(0, dtype='int32')
+        samp = np.concatenate(samp)
+        samp.sort()
+        return samp.astype(_index_type(len(labels)))
+
+    def subsample(self, fcs, *args, **kwargs):
+        if isinstance(fcs, fcm.FCMdata):
+            samp = self.sample(self.strata(fcs))
             node = SubsampleNode("", fcs.get_cur_node(), samp)
             fcs.add_view(node)
             return fcs
         else:
-            return x[samp]
+            x = np.asarray(fcs)
+            return x[self.sample(self.strata(x))]
+
+
+def sample_indices(total, n, seed=None):
+    """
+    D(total, n) -> sorted positions of n of total events drawn without
+    replacement, as int32 where possible.  If n > total all positions are
+    returned, like reservoir_sample and StratifiedSubsample do.
+    """
+    n = min(n, total)
+    rng = _random_state(seed)
+    if 4 * n > total:
+        samp = rng.permutation(total)[:n]
+    else:
+        # draw with replacement and redraw the collisions
+        samp = np.unique(rng.randint(0, total, n))
+        while len(samp) < n:
+            samp = np.unique(np.concatenate(
+                [samp, rng.randint(0, total, n - len(samp))]))
+    samp.sort()
+    return samp.astype(_index_type(total))
+
+
+def reservoir_sample(chunks, n, seed=None):
+    """
+    sample n events without replacement in one pass over an iterable of
+    chunks of events, holding at most n events and a chunk in memory.
+
+    returns the sorted positions of the sampled events in the stream and
+    the sampled events.  Streams shorter than n are returned whole.
+    """
+    if n < 1:
+        raise ValueError('n must be positive, received %s' % str(n))
+    rng = _random_state(seed)
+    # the events with the n smallest uniform keys are a uniform sample
+    keys = np.zeros(0)
+    idx = np.zeros(0, dtype='int64')
+    rows = None
+    offset = 0
+    for chunk in chunks:
+        chunk = np.asarray(chunk)
+        k = rng.random_sample(chunk.shape[0])
+        pos = np.arange(offset, offset + chunk.shape[0])
+        offset += chunk.shape[0]
+        if rows is None:
+            rows = chunk[:0]
+        if len(keys) == n:
+            sel = k < keys.max()
+            k = k[sel]
+            pos = pos[sel]
+            chunk = chunk[sel]
+        keys = np.concatenate([keys, k])
+        idx = np.concatenate([idx, pos])
+        rows = np.concatenate([rows, chunk])
+        if len(keys) > n:
+            keep = np.argpartition(keys, n - 1)[:n]
+            keys = keys[keep]
+            idx = idx[keep]
+            rows = rows[keep]
+    if rows is None:
+        return np.zeros(0, dtype='int32'), np.zeros(0)
+    order = np.argsort(idx)
+    return idx[order].astype(_index_type(offset)), rows[order]
+
+
+def _index_type(total):
+    if total < 2 ** 31:
+        return 'int32'
+    return 'int64'
 
 
 class AnomalySubsample(Subsample):
 
-    def __init__(self, n, neg, *args, **kwargs):
+    """
+    subsample events without replacement with probability inversely
+    proportional to their density under a (negative control) mixture model
+    """
+
+    def __init__(self, n, neg, seed=None, chunksize=65536, *args, **kwargs):
+        """
+        n = number of events to sample
+        neg = mixture model of the negative population
+        seed = seed or numpy RandomState making the sampling repeatable
+        chunksize = number of events evaluated at a time
+        """
         self.n = n
         self.neg = neg
+        self.rng = _random_state(seed)
+        self.chunksize = chunksize
 
     def subsample(self, fcs, *args, **kwargs):
         x = fcs[:]
-        p = mixnormpdf(x, self.neg.pis, self.neg.mus, self.neg.sigmas)
-        p = 1 / p
-        p = p / np.sum(p)
-
-        samp = npr.choice(
-            np.arange(
-                x.shape[0]),
-            size=self.n,
-            replace=False,
-            p=p)
+        logp = log_mixture_densities(x, [self.neg], self.chunksize,
+                                     **_density_kwargs(kwargs))
+        samp = weighted_sample(-logp[:, 0], self.n, self.rng)
         if isinstance(fcs, fcm.FCMdata):
             node = SubsampleNode("", fcs.get_cur_node(), samp)
             fcs.add_view(node)
@@ -95,24 +251,30 @@ class AnomalySubsample(Subsample):
 
 class BiasSubsample(Subsample):
 
-    def __init__(self, n, pos, neg):
+    """
+    subsample events without replacement with probability proportional to
+    the ratio of their densities under a positive and a negative mixture
+    model
+    """
+
+    def __init__(self, n, pos, neg, seed=None, chunksize=65536):
+        """
+        n = number of events to sample
+        pos, neg = mixture models of the positive and negative populations
+        seed = seed or numpy RandomState making the sampling repeatable
+        chunksize = number of events evaluated at a time
+        """
         self.n = n
         self.pos = pos
         self.neg = neg
+        self.rng = _random_state(seed)
+        self.chunksize = chunksize
 
     def subsample(self, fcs, *args, **kwargs):
         x = fcs[:]
-        neg_py = mixnormpdf(x, self.neg.pis, self.neg.mus, self.neg.sigmas,
-                            logged=True, *args, **kwargs)
-        pos_py = mixnormpdf(x, self.pos.pis, self.pos.mus, self.pos.sigmas,
-                            logged=True, *args, **kwargs)
-
-        diff = pos_py - neg_py
-
-        probs = np.exp(diff)
-        probs = probs / np.sum(probs)
-        samp = npr.choice(np.arange(x.shape[0]), size=self.n,
-                          replace=False, p=probs)
+        logp = log_mixture_densities(x, [self.pos, self.neg], self.chunksize,
+                                     **_density_kwargs(kwargs))
+        samp = weighted_sample(logp[:, 0] - logp[:, 1], self.n, self.rng)
 
         if isinstance(fcs, fcm.FCMdata):
             node = SubsampleNode("", fcs.get_cur_node(), samp)
@@ -122,6 +284,68 @@ class BiasSubsample(Subsample):
             return x[samp]
 
 
+def log_mixture_densities(x, models, chunksize=65536, **kwargs):
+    """
+    D(x, models) -> array of the log densities of the events of x under each
+    mixture model, one column per model.
+
+    The components of all the models are evaluated together, chunksize events
+    at a time, and summed per model in log space.
+    """
+    sizes = [np.atleast_1d(m.pis).shape[0] for m in models]
+    bounds = np.cumsum([0] + sizes)
+    pis = np.concatenate([np.atleast_1d(m.pis) for m in models])
+    mus = np.concatenate([np.asarray(m.mus).reshape((k, -1))
+                          for m, k in zip(models, sizes)])
+    d = mus.shape[1]
+    sigmas = np.concatenate([np.asarray(m.sigmas).reshape((k, d, d))
+                             for m, k in zip(models, sizes)])
+
+    n = x.shape[0]
+    rslt = np.empty((n, len(models)))
+    for i in range(0, n, chunksize):
+        chunk = x[i:i + chunksize]
+        comp = compmixnormpdf(chunk, pis, mus, sigmas, logged=True, **kwargs)
+        comp = comp.reshape((chunk.shape[0], len(pis)))
+        for j in range(len(models)):
+            rslt[i:i + chunksize, j] = logsumexp(
+                comp[:, bounds[j]:bounds[j + 1]], 1)
+    return rslt
+
+
+def weighted_sample(logw, n, seed=None):
+    """
+    D(logw, n) -> sorted positions of n events drawn without replacement
+    with probability proportional to exp(logw), as int32 where possible.
+
+    Each event gets the key logw plus Gumbel noise and the n largest keys
+    are kept, which draws the same as sequentially sampling proportional to
+    the weights but works in log space with a single partial sort.  If fewer
+    than n events have a non zero weight all of them are returned.
+    """
+    logw = np.asarray(logw, dtype='d')
+    ok = np.isfinite(logw)
+    n = min(n, np.count_nonzero(ok))
+    if n == 0:
+        return np.zeros(0, dtype=_index_type(logw.shape[0]))
+    rng = _random_state(seed)
+    keys = rng.random_sample(logw.shape[0])
+    np.log(keys, keys)
+    np.negative(keys, keys)
+    np.log(keys, keys)
+    np.subtract(logw, keys, keys)
+    keys[~ok] = -np.inf
+    samp = np.argpartition(keys, keys.shape[0] - n)[keys.shape[0] - n:]
+    samp.sort()
+    return samp.astype(_index_type(logw.shape[0]))
+
+
+def _density_kwargs(kwargs):
+    """keyword arguments passed on to the density evaluation"""
+    return dict((i, kwargs[i]) for i in kwargs
+                if i not in ('seed', 'chunksize'))
+
+
 class DropChannel(object):
 
     """
@@ -167,3 +391,4 @@ class AddChannel(object):
         pnts = np.hstack([fcs[:], self.events])
         node = AddChannelNode('', fcs.get_cur_node(), pnts, channels)
         fcs.add_view(node)
+
@@ -21,6 +21,12 @@ class Node(object):
 
         return self.data
 
+    def count(self):
+        """
+        return the number of events of this node
+        """
+        return self.view().shape[0]
+
     def pprint(self, depth, size):
         tmp = "  " * depth + self.name
         if size:
@@ -28,6 +34,48 @@ class Node(object):
 
         return tmp + "\n"
 
+    def grid_index(self, chan, bins=256):
+        """
+        return a GridIndex of the events of this node over the two channel
+        indices chan, built on first use and cached on the node
+        """
+        from gridindex import GridIndex
+        key = (tuple(chan), bins)
+        grids = self.__dict__.setdefault('grids', {})
+        if key not in grids or not self.indexed_by(grids[key]):
+            index = GridIndex(self.view()[:, list(chan)], bins, chan)
+            index.source = self._sources()
+            grids[key] = index
+        return grids[key]
+
+    def indexed_by(self, index):
+        """
+        True if the grid index was built from the current data of this node,
+        and not from another node or data since replaced
+        """
+        source = getattr(index, 'source', None)
+        if source is None:
+            return False
+        current = self._sources()
+        return len(source) == len(current) and \
+            all(i is j for i, j in zip(source, current))
+
+    def _sources(self):
+        """this node and the arrays its view is computed from"""
+        rslt = []
+        node = self
+        while node is not None:
+            rslt.append(node)
+            rslt.append(node.__dict__.get('data'))
+            rslt.append(node.__dict__.get('param'))
+            node = node.__dict__.get('parent')
+        return rslt
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop('grids', None)
+        return state
+
     def __getattr__(self, name):
         if name == 'channels':
             return self.parent.channels
@@ -111,6 +159,14 @@ class SubsampleNode(Node):
         """
         return self.parent.view().__getitem__(self.param)
 
+    def count(self):
+        """
+        return the number of events of this node
+        """
+        if isinstance(self.param, np.ndarray) and self.param.dtype != bool:
+            return len(self.param)
+        return self.view().shape[0]
+
 
 class DropChannelNode(Node):
 
@@ -172,6 +228,15 @@ class GatingNode(Node):
             return np.array([]).reshape(self.parent.view().shape)
         return self.parent.view()[self.data]
 
+    def count(self):
+        """
+        return the number of events of this node
+        """
+        data = self.data
+        if data.dtype == bool:
+            return int(np.count_nonzero(data))
+        return len(data)
+
     def __getattr__(self, name):
         if name == 'channels':
             return self.parent.channels
@@ -183,6 +248,26 @@ class GatingNode(Node):
                     name))
 
 
+class QuadrantNode(GatingNode):
+
+    """
+    Node of one quadrant of a quad gate, the four quadrants share one array
+    of quadrant labels
+    """
+
+    def __init__(self, name, parent, labels, quadrant):
+        self.name = name
+        self.parent = parent
+        self.labels = labels
+        self.quadrant = quadrant
+        self.prefix = 'g'
+
+    @property
+    def data(self):
+        """boolean index of the events in this quadrant"""
+        return self.labels == self.quadrant
+
+
 class Tree(object):
 
     """Tree of data for FCMdata object."""
@@ -1,5 +1,6 @@
+import numpy
 from util import bilinear_interpolate
-from fcm import PolyGate, IntervalGate, ThresholdGate, QuadGate
+from fcm import PolyGate, IntervalGate, ThresholdGate, QuadGate, RectGate
 
 
 def plot_gate(data, gate, ax, chan=None, name=None, **kwargs):
@@ -8,7 +9,7 @@ def plot_gate(data, gate, ax, chan=None, name=None, **kwargs):
     see the wrapped functions plot_ploy_gate, plot_threshold_gate, plot_threshold_hist
     for more information
     """
-    if isinstance(gate, PolyGate):
+    if isinstance(gate, (PolyGate, RectGate)):
         plot_poly_gate(data, gate, ax, chan, name, **kwargs)
     elif isinstance(gate, ThresholdGate):
         if isinstance(chan, int) or chan is None:
@@ -227,13 +228,22 @@ def plot_poly_gate(data, gate, ax, chan=None, name=None, **kwargs):
             alpha=alpha,
             **kwargs)
 
+    vert = _outline(gate)
     ax.fill(
-        gate.vert.T[0],
-        gate.vert.T[1],
+        vert.T[0],
+        vert.T[1],
         edgecolor='black',
         facecolor='none')
 
 
+def _outline(gate):
+    """vertices of the polygon drawn for a PolyGate or RectGate"""
+    if isinstance(gate, RectGate):
+        (x0, y0), (x1, y1) = gate.vert
+        return numpy.array([[x0, y0], [x1, y0], [x1, y1], [x0, y1]])
+    return numpy.asarray(gate.vert)
+
+
 if __name__ == '__main__':
     import fcm
     import numpy
@@ -88,6 +88,10 @@ class Gate(object):
         self.idxs = idxs
         ax.scatter(fcm[:, idxs[0]], fcm[:, idxs[1]],
                    s=1, c='b', edgecolors='none')
+        # bin the events now so the first edit of the gate is quick
+        fcm.grid_index(idxs)
+        self.count = ax.text(0.02, 0.98, '', transform=ax.transAxes,
+                             va='top', animated=True)
 
         self.gate = None
         self.canvas = ax.figure.canvas
@@ -127,11 +131,13 @@ class Gate(object):
                 self.ax.add_patch(self.poly)
             else:
                 self.poly.set_xy(xy)
+            self.count.set_text('%d events' % self.index.count(xy[:-1]))
 
         if self.background is not None:
             self.canvas.restore_region(self.background)
         if self.poly is not None:
             self.ax.draw_artist(self.poly)
+            self.ax.draw_artist(self.count)
         for vertex in self.vertices:
             self.ax.draw_artist(vertex.circle)
 
@@ -139,6 +145,14 @@ class Gate(object):
 
         self.canvas.blit(self.ax.bbox)
 
+    @property
+    def index(self):
+        """
+        binned events of the current view, rebuilt by the node when the
+        view changes, so edits only retest events near the gate edges
+        """
+        return self.fcm.grid_index(self.idxs)
+
     def onclick(self, event):
         xmin, xmax, unused_ymin, unused_ymax = self.ax.axis()
         w = xmax - xmin
@@ -161,7 +175,7 @@ class Gate(object):
     def zoom_to_gate(self, event):
         xy = numpy.array([v.circle.center for v in self.vertices])
         gate = g(xy, self.idxs)
-        gate.gate(self.fcm)
+        gate.gate(self.fcm, index=self.index)
         self.gate = gate
         self.vertices = []
         self.poly = None
@@ -22,6 +22,8 @@ class Gate(object):
         ax.scatter(fcm[:, idxs[0]], fcm[:, idxs[1]],
                    s=1, c='b', edgecolors='none')
 
+        # bin the events now so the first edit of the gate is quick
+        fcm.grid_index(idxs)
         self.canvas = ax.figure.canvas
         self.ax = ax
         self.vertices = []
@@ -37,6 +39,14 @@ class Gate(object):
         self.hline = None
         self.vline = None
 
+    @property
+    def index(self):
+        """
+        binned events of the current view, rebuilt by the node when the
+        view changes, so edits only retest events near the gate edges
+        """
+        return self.fcm.grid_index(self.idxs)
+
     def onclick(self, event):
         xmin, xmax, ymin, ymax = self.ax.axis()
         #h = ymax - ymin
@@ -52,6 +62,8 @@ class Gate(object):
                     [event.xdata, event.xdata], [ymin, ymax], linewidth=.001 * w, c='black')[-1]
                 self.vline = self.ax.plot(
                     [xmin, xmax], [event.ydata, event.ydata], linewidth=.001 * w, c='black')[-1]
+            self.ax.set_title('I: %d  II: %d  III: %d  IV: %d' % tuple(
+                self.index.quadrant_counts([event.xdata, event.ydata])))
 
         if event.button == 1:
             if (time.time() - self.t < self.double_click_t):
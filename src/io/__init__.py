@@ -5,3 +5,4 @@ Objects and methods for read or writing flow cytometry data
 from fcm.io.readfcs import FCSreader, loadFCS, loadMultipleFCS
 from fcm.io.flowjoxml import FlowjoWorkspace, load_flowjo_xml
 from fcm.io.export_to_fcs import export_fcs
+from fcm.io.mixture_io import save_mixture, load_mixture
@@ -6,7 +6,8 @@ Created on Feb 11, 2012
 
 import xml.etree.cElementTree as xml
 import numpy
-from fcm import PolyGate
+from fcm import PolyGate, RectGate
+from fcm.core.gating import GatingPlan
 from fcm.io.readfcs import is_fl_channel
 from fcm.core.transforms import _logicle
 from collections import namedtuple
@@ -45,12 +46,8 @@ class PopulationNode(object):
         return j
 
     def apply_gates(self, file):
-        # print self.gate.name, self.gate.chan
-        self.gate.gate(file)
-        node = file.current_node
-        for i in self.subpops:
-            file.visit(node)
-            self.subpops[i].apply_gates(file)
+        """gate file with this population and all its subpopulations"""
+        GatingPlan(self).gate(file)
 
     def logicle(self, T=262144, m=4.5, r=None, w=0.5, scale_max=1e5):
         """
@@ -116,10 +113,8 @@ class xmlfcsfile(object):
         return j
 
     def apply_gates(self, file):
-        node = file.current_node
-        for i in self.pops:
-            file.visit(node)
-            self.pops[i].apply_gates(file)
+        """gate file with every population of this sample in one pass"""
+        GatingPlan(self).gate(file)
 
     def logicle(self, T=262144, m=4.5, r=None, w=0.5, scale_max=1e5):
         """
@@ -329,7 +324,7 @@ def build_pops(node, prefix=None, suffix=None, name_prefix=None):
         elif i.tag == 'PolygonGate':
             for j in i:
                 if j.tag == 'PolyRect':
-                    g = build_Polygon(j, prefix, suffix, name_prefix)
+                    g = build_Rect(j, prefix, suffix, name_prefix)
 
                 elif j.tag == 'Polygon':
                     g = build_Polygon(j, prefix, suffix, name_prefix)
@@ -369,6 +364,15 @@ def build_Polygon(rect, prefix=None, suffix=None, name_prefix=None):
     return PolyGate(verts, axis, name)
 
 
+def build_Rect(rect, prefix=None, suffix=None, name_prefix=None):
+    poly = build_Polygon(rect, prefix, suffix, name_prefix)
+    xs = sorted(set(i[0] for i in poly.vert))
+    ys = sorted(set(i[1] for i in poly.vert))
+    if len(poly.vert) != 4 or len(xs) != 2 or len(ys) != 2:
+        return poly
+    return RectGate([(xs[0], ys[0]), (xs[1], ys[1])], poly.chan, poly.name)
+
+
 if __name__ == "__main__":
     import fcm
     import sys
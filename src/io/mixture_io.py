@@ -0,0 +1,209 @@
+"""
+Save and load fitted mixture models in a compact binary container
+
+The file is an 8 byte magic string, the length of a JSON header as a little
+endian uint64, the header, and then the raw arrays, each starting on an
+ALIGN byte boundary so they can be memory mapped straight from the file.
+"""
+
+import json
+import struct
+import numpy
+
+MAGIC = b'FCMMIX01'
+ALIGN = 64
+
+
+def _kind(mix):
+    # imported here so loading fcm.io does not need the model fitting code
+    from fcm.statistics.dp_cluster import DPMixture, ModalDPMixture
+    from fcm.statistics.dp_cluster import HDPMixture, ModalHDPMixture
+    for cls in [ModalHDPMixture, HDPMixture, ModalDPMixture, DPMixture]:
+        if isinstance(mix, cls):
+            return cls.__name__
+    raise TypeError('can not save a %s' % type(mix).__name__)
+
+
+def _scale(x, name, arrays):
+    """header value of m or s, arrays are stored with the model arrays"""
+    if x is None or x is False:
+        return None
+    if numpy.ndim(x) == 0:
+        return float(x)
+    arrays[name] = x
+    return name
+
+
+def _unscale(value, arrays):
+    if value is None or isinstance(value, float):
+        return value
+    return arrays[value]
+
+
+def _map_arrays(mapping, name, arrays):
+    """store a dict of int -> list of ints as keys, sizes and members"""
+    keys = sorted(mapping)
+    arrays[name + '_keys'] = numpy.array(keys, dtype='int64')
+    arrays[name + '_sizes'] = numpy.array([len(mapping[i]) for i in keys],
+                                          dtype='int64')
+    members = [numpy.asarray(list(mapping[i]), dtype='int64') for i in keys]
+    if members:
+        arrays[name + '_members'] = numpy.concatenate(members)
+    else:
+        arrays[name + '_members'] = numpy.zeros(0, dtype='int64')
+
+
+def _unmap_arrays(name, arrays):
+    keys = arrays[name + '_keys']
+    ends = numpy.cumsum(arrays[name + '_sizes'])
+    members = arrays[name + '_members']
+    rslt = {}
+    start = 0
+    for k, end in zip(keys, ends):
+        rslt[int(k)] = [int(i) for i in members[start:end]]
+        start = end
+    return rslt
+
+
+def save_mixture(fname, mix):
+    """
+    save a fitted DPMixture, ModalDPMixture, HDPMixture or ModalHDPMixture
+    (or an ordered version of one) to fname
+    """
+    kind = _kind(mix)
+    arrays = {}
+    if kind in ['DPMixture', 'ModalDPMixture']:
+        comps = mix._components
+        arrays['pis'] = comps.pis
+        arrays['mus'] = comps.mus
+        arrays['sigmas'] = comps.sigmas
+        if comps.centered_mus is not None:
+            arrays['centered_mus'] = comps.centered_mus
+        if comps.centered_sigmas is not None:
+            arrays['centered_sigmas'] = comps.centered_sigmas
+    else:
+        arrays['pis'] = mix.pis
+        arrays['mus'] = mix.mus
+        arrays['sigmas'] = mix.sigmas
+
+    header = {'kind': kind,
+              'niter': int(mix.niter),
+              'ident': bool(getattr(mix, 'ident', False)),
+              'm': _scale(mix.m, 'm', arrays),
+              's': _scale(mix.s, 's', arrays)}
+    if kind.startswith('Modal'):
+        _map_arrays(mix.cmap, 'cmap', arrays)
+        keys = sorted(mix.modemap)
+        arrays['modemap_keys'] = numpy.array(keys, dtype='int64')
+        arrays['modes'] = numpy.array([mix.modemap[i] for i in keys],
+                                      dtype='d')
+    lookup = getattr(mix, 'lookup', None)
+    if lookup is not None:
+        _map_arrays(dict((i, [lookup[i]]) for i in lookup), 'lookup', arrays)
+
+    # lay out the arrays after the header
+    names = sorted(arrays)
+    arrays = dict((i, numpy.ascontiguousarray(arrays[i])) for i in names)
+    header['arrays'] = {}
+    for i in names:
+        dtype = arrays[i].dtype
+        if dtype.kind == 'f':
+            dtype = numpy.dtype('<f8')
+        else:
+            dtype = numpy.dtype('<i8')
+        header['arrays'][i] = {'dtype': dtype.str,
+                               'shape': list(arrays[i].shape)}
+    # the offsets change the header length, so size it with room for them
+    for i in names:
+        header['arrays'][i]['offset'] = 2 ** 62
+    start = _aligned(len(MAGIC) + 8 + len(json.dumps(header)))
+    offset = start
+    for i in names:
+        header['arrays'][i]['offset'] = offset
+        offset = _aligned(offset + arrays[i].size * 8)
+    text = json.dumps(header).encode('ascii')
+
+    fh = open(fname, 'wb')
+    try:
+        fh.write(MAGIC)
+        fh.write(struct.pack('<Q', len(text)))
+        fh.write(text)
+        for i in names:
+            info = header['arrays'][i]
+            fh.write(b'\0' * (info['offset'] - fh.tell()))
+            arrays[i].astype(info['dtype']).tofile(fh)
+    finally:
+        fh.close()
+
+
+def _aligned(n):
+    return -(-n // ALIGN) * ALIGN
+
+
+def _read_header(fname):
+    fh = open(fname, 'rb')
+    try:
+        if fh.read(len(MAGIC)) != MAGIC:
+            raise ValueError('%s is not a saved mixture' % fname)
+        size, = struct.unpack('<Q', fh.read(8))
+        return json.loads(fh.read(size).decode('ascii'))
+    finally:
+        fh.close()
+
+
+def load_mixture(fname, mmap=True):
+    """
+    load a mixture saved by save_mixture.  if mmap is True the weights,
+    means and covariances are memory mapped (copy on write) from the file
+    instead of read into memory, so many processes can share one model.
+    """
+    from fcm.statistics.dp_cluster import DPMixture, ModalDPMixture
+    from fcm.statistics.dp_cluster import HDPMixture, ModalHDPMixture
+    header = _read_header(fname)
+    arrays = {}
+    for name, info in header['arrays'].items():
+        shape = tuple(info['shape'])
+        if mmap and numpy.prod(shape) > 0:
+            x = numpy.memmap(fname, dtype=info['dtype'], mode='c',
+                             offset=info['offset'], shape=shape)
+        else:
+            fh = open(fname, 'rb')
+            try:
+                fh.seek(info['offset'])
+                x = numpy.fromfile(fh, dtype=info['dtype'],
+                                   count=int(numpy.prod(shape)))
+            finally:
+                fh.close()
+            x = x.reshape(shape)
+        arrays[str(name)] = x
+
+    kind = header['kind']
+    niter = header['niter']
+    m = _unscale(header['m'], arrays)
+    s = _unscale(header['s'], arrays)
+    ident = header['ident']
+    if kind.startswith('Modal'):
+        cmap = _unmap_arrays('cmap', arrays)
+        modemap = dict((int(k), numpy.array(v)) for k, v in
+                       zip(arrays['modemap_keys'], arrays['modes']))
+
+    if kind in ['DPMixture', 'ModalDPMixture']:
+        comps = tuple(arrays.get(i) for i in
+                      ['pis', 'mus', 'sigmas', 'centered_mus',
+                       'centered_sigmas'])
+        if kind == 'DPMixture':
+            mix = DPMixture(comps, niter, m, s, ident)
+        else:
+            mix = ModalDPMixture(comps, cmap, modemap, niter, m, s, ident)
+    elif kind == 'HDPMixture':
+        mix = HDPMixture(arrays['pis'], arrays['mus'], arrays['sigmas'],
+                         niter, m, s, ident)
+    else:
+        mix = ModalHDPMixture(arrays['pis'], arrays['mus'], arrays['sigmas'],
+                              cmap, modemap, niter, m, s, ident)
+
+    if 'lookup_keys' in arrays:
+        lookup = dict((k, v[0]) for k, v in
+                      _unmap_arrays('lookup', arrays).items())
+        mix = mix.reorder(lookup)
+    return mix
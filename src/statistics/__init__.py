@@ -10,6 +10,10 @@ from fcm.statistics.dp_cluster import OrderedHDPMixture, OrderedModalHDPMixture
 from fcm.statistics.cluster import DPMixtureModel, KMeansModel, HDPMixtureModel
 from fcm.statistics.distributions import mvnormpdf, mixnormpdf, mixnormrnd
 from fcm.statistics.kmeans import KMeans
+from fcm.statistics.pooled import PooledData
+from fcm.statistics.classification import classify_events, iter_classify
+from fcm.statistics.posterior import PosteriorAverage
+from fcm.statistics.fitting import ParallelFit
 
 __all__ = ['Dime',
            'DPCluster',
@@ -26,4 +30,9 @@ __all__ = ['Dime',
            'mvnormpdf',
            'mixnormpdf',
            'mixnormrnd',
-           'KMeans']
+           'KMeans',
+           'PooledData',
+           'classify_events',
+           'iter_classify',
+           'PosteriorAverage',
+           'ParallelFit']
@@ -0,0 +1,122 @@
+"""
+Classify events against a mixture in blocks sized to a memory budget
+"""
+
+import numpy
+from collections import deque
+from multiprocessing.pool import ThreadPool
+from scipy.misc import logsumexp
+
+# bytes the per block score matrices may take by default
+MEMORY = 2 ** 28
+
+
+def _events(x):
+    if hasattr(x, 'view') and not isinstance(x, numpy.ndarray):
+        x = x.view()
+    return numpy.asarray(x)
+
+
+def block_size(ncomp, memory=None, workers=None):
+    """
+    number of events scored at a time against ncomp components so that
+    the blocks in flight on all workers fit in memory bytes
+    """
+    if memory is None:
+        memory = MEMORY
+    workers = max(workers or 1, 1)
+    # the score matrix and about as much again in temporaries
+    return max(1, int(memory // (16 * max(ncomp, 1) * workers)))
+
+
+def _score(args):
+    logprob, block, posterior, entropy, kwargs = args
+    scores = logprob(block, logged=True, **kwargs)
+    scores = scores.reshape(block.shape[0], -1)
+    rslt = [scores.argmax(1)]
+    if posterior or entropy:
+        norm = logsumexp(scores, 1)
+        if posterior:
+            rslt.append(numpy.exp(scores.max(1) - norm))
+        if entropy:
+            scores -= norm[:, numpy.newaxis]
+            p = numpy.exp(scores)
+            # 0 * log(0) counts as 0
+            scores[p == 0] = 0
+            rslt.append(-(p * scores).sum(1))
+    return rslt
+
+
+def _blocks(x, size):
+    if hasattr(x, 'shape') or hasattr(x, 'view'):
+        chunks = [_events(x)]
+    else:
+        chunks = (_events(i) for i in x)
+    for chunk in chunks:
+        for i in range(0, chunk.shape[0], size):
+            yield chunk[i:i + size]
+
+
+def iter_classify(logprob, x, ncomp, posterior=False, entropy=False,
+                  memory=None, workers=None, **kwargs):
+    """
+    classify the rows of x a block at a time.
+
+    logprob = function(block, logged=True, **kwargs) returning the log
+        scores of the rows of block, one column per class
+    x = array, FCMdata object or iterable of arrays (chunks of events)
+    ncomp = number of columns logprob computes internally, used to size
+        the blocks
+    posterior = also yield the posterior probability of the chosen class
+    entropy = also yield the entropy of the posterior over the classes
+    memory = bytes the blocks in flight may take
+    workers = number of threads scoring blocks
+
+    yields the labels of each block in order, or a tuple of the labels,
+    posteriors and entropies asked for
+    """
+    size = block_size(ncomp, memory, workers)
+    jobs = ((logprob, block, posterior, entropy, kwargs)
+            for block in _blocks(x, size))
+    if workers is not None and workers > 1:
+        pool = ThreadPool(workers)
+        # only a few blocks ahead of the one yielded are read from x
+        pending = deque()
+        try:
+            for job in jobs:
+                pending.append(pool.apply_async(_score, (job,)))
+                if len(pending) >= 2 * workers:
+                    yield _unpack(pending.popleft().get())
+            while pending:
+                yield _unpack(pending.popleft().get())
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        for job in jobs:
+            yield _unpack(_score(job))
+
+
+def _unpack(rslt):
+    if len(rslt) == 1:
+        return rslt[0]
+    return tuple(rslt)
+
+
+def classify_events(logprob, x, ncomp, posterior=False, entropy=False,
+                    memory=None, workers=None, **kwargs):
+    """
+    classify the rows of x a block at a time, see iter_classify.  returns
+    the labels, or a tuple of the labels, posteriors and entropies asked
+    for, without forming the full score matrix.
+    """
+    parts = list(iter_classify(logprob, x, ncomp, posterior, entropy,
+                               memory, workers, **kwargs))
+    if not (posterior or entropy):
+        if not parts:
+            return numpy.zeros(0, dtype=int)
+        return numpy.concatenate(parts)
+    if not parts:
+        return tuple(numpy.zeros(0) for unused in range(1 + posterior +
+                                                           entropy))
+    return tuple(numpy.concatenate(i) for i in zip(*parts))
@@ -4,7 +4,7 @@ Created on Oct 30, 2009
 @author: Jacob Frelinger 
 """
 
-from numpy import zeros, outer, sum, eye, array, mean, cov, vstack, std, ones
+from numpy import zeros, outer, sum, eye, array, mean, cov, asarray
 from numpy.random import multivariate_normal as mvn
 from numpy.random import seed
 from scipy.cluster import vq
@@ -13,8 +13,22 @@ import collections
 from dpmix import DPNormalMixture, BEM_DPNormalMixture, HDPNormalMixture
 from fcm.core.fcmcollection import FCMcollection
 
-from dp_cluster import DPCluster, DPMixture, HDPMixture
+from dp_cluster import DPMixture, HDPMixture
 from kmeans import KMeans
+from pooled import PooledData
+from posterior import PosteriorAverage
+from fitting import ParallelFit
+
+
+def _sampler_callback(callback):
+    """
+    keyword arguments giving callback to a dpmix sampler.  dpmix 0.3 takes
+    none, so one is only passed when given, and a PosteriorAverage reads
+    the draws the sampler stores instead.
+    """
+    if callback is None or isinstance(callback, PosteriorAverage):
+        return {}
+    return {'callback': callback}
 
 
 class DPMixtureModel(object):
@@ -159,6 +173,7 @@ class DPMixtureModel(object):
         self._ref = ref
 
     def _load_ref_at_fit(self, pnts):
+        # pnts are standardized, the priors are set on the scale of the data
         if isinstance(self._ref, DPMixture):
             self.prior_mu = self._ref.mus
             self.prior_sigma = self._ref.sigmas
@@ -169,8 +184,10 @@ class DPMixtureModel(object):
                 (self.nclusts, pnts.shape[1], pnts.shape[1]))
             for i in range(self.nclusts):
                 try:
-                    self.prior_mu[i] = mean(pnts[self._ref == i], 0)
-                    self.prior_sigma[i] = cov(pnts[self._ref == i], rowvar=0)
+                    self.prior_mu[i] = mean(
+                        pnts[self._ref == i], 0, dtype='d') * self.s + self.m
+                    self.prior_sigma[i] = cov(
+                        pnts[self._ref == i], rowvar=0) * outer(self.s, self.s)
                 except:
                     self.prior_mu[i] = zeros(pnts.shape[1])
                     self.prior_sigma[i] = eye(pnts.shape[1])
@@ -179,34 +196,58 @@ class DPMixtureModel(object):
             self.prior_pi = array(
                 [pnts[self._ref == i].shape[0] / tot for i in range(self.nclusts)])
 
-    def fit(self, fcmdata, verbose=False, normed=False, callback=None):
+    def fit(self, fcmdata, verbose=False, normed=False, callback=None,
+            workers=None, index=None):
+        """
+        fit the mixture model to fcmdata, a FCMdata object, or a list or
+        FCMcollection of them fitted one by one (returned in the order of
+        the sorted sample names of a collection), or a PooledData object
+        fitted jointly.  callback is passed to the mcmc sampler, except a
+        PosteriorAverage which averages the draws after sampling.  if
+        workers is given the datasets of a list or FCMcollection are fitted
+        on that many processes (see ParallelFit), each with the seed of the
+        model as when fitted one by one; a callback can not be used with
+        workers.  index selects the events of a single dataset to fit, such
+        as a subsample index.
+        """
+        if index is not None:
+            if isinstance(fcmdata, (FCMcollection, list, tuple)):
+                raise ValueError('index only applies to a single dataset')
+            return self._fit(fcmdata, verbose, normed, callback, index)
+        if workers is not None and \
+                isinstance(fcmdata, (FCMcollection, list, tuple)):
+            if callback is not None:
+                raise ValueError('a callback can not be used with workers, '
+                                 'the fits run in other processes')
+            # every sample is fitted with self.seed, as without workers
+            return ParallelFit(self, workers=workers).fit(
+                fcmdata, verbose, normed)
         if isinstance(fcmdata, FCMcollection):
+            # in the order of the sample names, as with workers
             return [self._fit(fcmdata[i], verbose, normed, callback)
-                    for i in fcmdata]
+                    for i in sorted(fcmdata.keys())]
         elif isinstance(fcmdata, list) or isinstance(fcmdata, tuple):
             return [self._fit(i, verbose, normed, callback) for i in fcmdata]
         else:
             return self._fit(fcmdata, verbose, normed, callback)
 
-    def _fit(self, fcmdata, verbose=False, normed=False, callback=None):
+    def _fit(self, fcmdata, verbose=False, normed=False, callback=None,
+             index=None):
         """
         fit the mixture model to the data
         use get_results() to get the fitted model
         """
-        pnts = fcmdata.view().copy().astype('double')
-        if normed:
-            self.data = pnts
-            self.m = zeros(self.data.shape[1])
-            self.s = ones(self.data.shape[1])
+        if isinstance(fcmdata, PooledData):
+            # already standardized in one buffer
+            pooled = fcmdata
         else:
-            self.m = pnts.mean(0)
-            self.s = pnts.std(0)
-            # incase any of the std's are zero
-            self.s[self.s == 0] = 1
-            self.data = (pnts - self.m) / self.s
-
-        if len(self.data.shape) == 1:
-            self.data = self.data.reshape((self.data.shape[0], 1))
+            # standardized a block at a time into a single buffer, the
+            # events of index gathered as they are copied in
+            pooled = PooledData([fcmdata], normed=normed, index=index)
+        # the sampler's kernels take doubles
+        self.data = asarray(pooled.data, dtype='d')
+        self.m = pooled.m
+        self.s = pooled.s
 
         if len(self.data.shape) != 2:
             raise ValueError("pnts is the wrong shape")
@@ -214,7 +255,12 @@ class DPMixtureModel(object):
 
         if self._ref is not None:
             self.ident = True
-            self._load_ref_at_fit(pnts)
+            self._load_ref_at_fit(self.data)
+        if isinstance(callback, PosteriorAverage):
+            if self.type.lower() == 'bem':
+                raise ValueError('a PosteriorAverage averages mcmc draws, '
+                                 'BEM makes none')
+            callback.scale(self.m, self.s, self.ident)
 
         if self.prior_mu is not None:
             self._load_mu_at_fit()
@@ -262,12 +308,18 @@ class DPMixtureModel(object):
                 alpha0=self.alpha0,
                 gpu=self.device,
                 parallel=self.parallel,
-                verbose=verbose, callback=callback)
+                verbose=verbose,
+                **_sampler_callback(callback))
             self.cdp.sample(
                 niter=self.niter,
                 nburn=self.burnin,
                 thin=1,
                 ident=self.ident)
+            if isinstance(callback, PosteriorAverage):
+                callback.add_sampler(self.cdp)
+        # the sampler keeps its own reference to the buffer, so it can be
+        # sampled further, this only stops the model holding another one
+        self.data = None
 
         if self.last is None:
             self.last = self.niter
@@ -286,42 +338,24 @@ class DPMixtureModel(object):
 
         if self._run:
             if self.type.lower() == 'bem':
-                rslts = []
-                for j in range(self.nclusts):
-                    tmp = DPCluster(
-                        self.cdp.weights[j],
-                        (self.cdp.mu[j] *
-                         self.s) +
-                        self.m,
-                        self.cdp.Sigma[j] *
-                        outer(
-                            self.s,
-                            self.s),
-                        self.cdp.mu[j],
-                        self.cdp.Sigma[j])
-                    rslts.append(tmp)
-                tmp = DPMixture(rslts, self.m, self.s)
+                mu = self.cdp.mu[:self.nclusts]
+                sigma = self.cdp.Sigma[:self.nclusts]
+                tmp = DPMixture((self.cdp.weights[:self.nclusts],
+                                 mu * self.s + self.m,
+                                 sigma * outer(self.s, self.s), mu, sigma),
+                                self.m, self.s)
             else:
-                # pi = self.cdp.weights[-self.last] / sum(self.cdp.weight[-self.last])
-                rslts = []
-                for i in range(self.last):
-                    for j in range(self.nclusts):
-                        tmp = DPCluster(self.cdp.weights[-
-                                                         (i +
-                                                          1), j], (self.cdp.mu[-
-                                                                               (i +
-                                                                                1), j] *
-                                                                   self.s) +
-                                        self.m, self.cdp.Sigma[-
-                                                               (i +
-                                                                1), j] *
-                                        outer(self.s, self.s), self.cdp.mu[-
-                                                                           (i +
-                                                                            1), j], self.cdp.Sigma[-
-                                                                                                   (i +
-                                                                                                    1), j])
-                        rslts.append(tmp)
-                tmp = DPMixture(rslts, self.last, self.m, self.s, self.ident)
+                # draws from the last back, one block of nclusts per draw
+                k = self.nclusts
+                pis = self.cdp.weights[::-1][:self.last, :k]
+                mu = self.cdp.mu[::-1][:self.last, :k]
+                sigma = self.cdp.Sigma[::-1][:self.last, :k]
+                d = mu.shape[-1]
+                mu = mu.reshape(-1, d)
+                sigma = sigma.reshape(-1, d, d)
+                tmp = DPMixture((pis.ravel(), mu * self.s + self.m,
+                                 sigma * outer(self.s, self.s), mu, sigma),
+                                self.last, self.m, self.s, self.ident)
             return tmp
         else:
             return None  # TODO raise exception
@@ -353,21 +387,26 @@ class HDPMixtureModel(DPMixtureModel):
         self.g0 = 0.1
         self.h0 = 0.1
 
-    def fit(self, datasets, verbose=False, tune_interval=100):
-        if isinstance(datasets, FCMcollection):
-            datasets = datasets.to_list()
-        self.d = datasets[0].shape[1]
-
-        datasets = [i.copy().astype('double') for i in datasets]
+    def fit(self, datasets, verbose=False, tune_interval=100, callback=None):
+        """
+        fit the mixture model jointly to datasets, a FCMcollection, a list
+        of FCMdata objects or arrays, or a PooledData object.  callback is
+        passed to the sampler, which needs a dpmix whose HDPNormalMixture
+        takes one, except a PosteriorAverage which averages the stored
+        draws after sampling.
+        """
+        if not isinstance(datasets, PooledData):
+            try:
+                datasets = PooledData(datasets)
+            except ValueError as e:
+                raise RuntimeError(str(e))
+        self.d = datasets.d
         self.ndatasets = len(datasets)
-        total_data = vstack(datasets)
-        self.m = mean(total_data, 0)
-        self.s = std(total_data, 0)
-        standardized = []
-        for i in datasets:
-            if i.shape[1] != self.d:
-                raise RuntimeError("Datasets shape do not match")
-            standardized.append(((i - self.m) / self.s))
+        self.m = datasets.m
+        self.s = datasets.s
+        standardized = [asarray(x, dtype='d') for x in datasets]
+        if isinstance(callback, PosteriorAverage):
+            callback.scale(self.m, self.s, self.ident)
 
         if self.prior_mu is not None:
             self._load_mu_at_fit()
@@ -396,13 +435,16 @@ class HDPMixtureModel(DPMixtureModel):
             alpha0=self.alpha0,
             gpu=self.device,
             parallel=self.parallel,
-            verbose=verbose)
+            verbose=verbose,
+            **_sampler_callback(callback))
         self.hdp.sample(
             niter=self.niter,
             nburn=self.burnin,
             thin=1,
             ident=self.ident,
             tune_interval=tune_interval)
+        if isinstance(callback, PosteriorAverage):
+            callback.add_sampler(self.hdp)
 
         self._run = True  # we've fit the mixture model
 
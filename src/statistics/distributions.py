@@ -2,9 +2,12 @@
 Distributions used in FCS analysis
 """
 
-from numpy import array, sum, cumsum, reshape, exp, ones, ndarray
-from numpy.random import random, multivariate_normal
+from numpy import array, sum, reshape, exp, ones, ndarray, log, pi
+from numpy import dot, empty, einsum, diagonal, errstate
+from numpy.linalg import cholesky, inv
+import numpy.random as npr
 from scipy.misc import logsumexp
+from copy import copy
 
 try:
     from gpustats import mvnpdf_multi
@@ -16,6 +19,77 @@ except ImportError:
 from dpmix.utils import mvn_weighted_logged
 
 
+class MixtureFactors(object):
+
+    """
+    Cholesky factors, log determinants and log weights of the components of
+    a normal mixture, computed once so the densities of many points can be
+    evaluated without refactorizing the covariances.
+    """
+
+    def __init__(self, prop, mu, Sigma):
+        prop = array(prop, dtype='d').reshape(-1)
+        k = prop.shape[0]
+        mu = array(mu, dtype='d').reshape(k, -1)
+        d = mu.shape[1]
+        Sigma = array(Sigma, dtype='d').reshape(k, d, d)
+        self.k = k
+        self.d = d
+        self.chol = cholesky(Sigma)
+        self.logdet = 2 * log(diagonal(self.chol, axis1=1, axis2=2)).sum(1)
+        # z = inv(L) (x - mu) for all components is one product of x with the
+        # stacked inv(L).T less the stacked inv(L) mu
+        inv_t = inv(self.chol).transpose(0, 2, 1)
+        self.w = inv_t.transpose(1, 0, 2).reshape(d, k * d)
+        self.offset = einsum('ja,jab->jb', mu, inv_t).ravel()
+        self._norm = -0.5 * (d * log(2 * pi) + self.logdet)
+        self.reweight(prop)
+
+    def reweight(self, prop):
+        """set the component weights"""
+        with errstate(divide='ignore'):
+            self.logpi = log(array(prop, dtype='d').reshape(-1))
+        self.const = self.logpi + self._norm
+
+    def reweighted(self, prop):
+        """return factors sharing these covariance factors with new weights"""
+        rslt = copy(self)
+        rslt.reweight(prop)
+        return rslt
+
+    def take(self, i):
+        """return the factors of component i alone"""
+        rslt = copy(self)
+        rslt.k = 1
+        rslt.chol = self.chol[i:i + 1]
+        rslt.logdet = self.logdet[i:i + 1]
+        rslt.w = self.w[:, i * self.d:(i + 1) * self.d]
+        rslt.offset = self.offset[i * self.d:(i + 1) * self.d]
+        rslt._norm = self._norm[i:i + 1]
+        rslt.logpi = self.logpi[i:i + 1]
+        rslt.const = self.const[i:i + 1]
+        return rslt
+
+    def logpdf(self, x, blocksize=None):
+        """
+        D(x) -> array of the log weighted densities of the rows of x under
+        each component, one column per component
+        """
+        x = x.reshape(-1, self.d)
+        n = x.shape[0]
+        if blocksize is None:
+            blocksize = max(1, 2 ** 20 // (self.k * self.d))
+        out = empty((n, self.k))
+        for i in range(0, n, blocksize):
+            z = dot(x[i:i + blocksize], self.w)
+            z -= self.offset
+            z *= z
+            out[i:i + blocksize] = z.reshape(-1, self.k, self.d).sum(2)
+        out *= -0.5
+        out += self.const
+        return out
+
+
 def _mvnpdf(x, mu, va, n=1, logged=False, use_gpu=True, **kwargs):
     if len(x.shape) == 1:
         x = x.reshape((1, x.shape[0]))
@@ -45,7 +119,8 @@ def _mvnpdf(x, mu, va, n=1, logged=False, use_gpu=True, **kwargs):
             return exp(mvn_weighted_logged(x, mu, va, ones(mu.shape[0])))
 
 
-def _wmvnpdf(x, pi, mu, va, d=1, logged=False, use_gpu=True, **kwargs):
+def _wmvnpdf(x, pi, mu, va, d=1, logged=False, use_gpu=True, factors=None,
+             **kwargs):
     if len(x.shape) == 1:
         x = x.reshape((1, x.shape))
     if len(mu.shape) == 1:
@@ -75,6 +150,11 @@ def _wmvnpdf(x, pi, mu, va, d=1, logged=False, use_gpu=True, **kwargs):
             weights=pi,
             logged=logged,
             order='C').astype('float64')
+    elif factors is not None:
+        if logged:
+            return factors.logpdf(x)
+        else:
+            return exp(factors.logpdf(x))
     else:
         if logged:
             return mvn_weighted_logged(x, mu, va, pi)
@@ -102,8 +182,18 @@ def mvnormpdf(x, mu, va, **kwargs):
     return results.squeeze()
 
 
+def uses_factors(use_gpu=True, **kwargs):
+    """True if densities are computed on the cpu from MixtureFactors"""
+    return not (has_gpu and use_gpu)
+
+
 def compmixnormpdf(x, prop, mu, Sigma, **kwargs):
-    """Component mixture multivariate normal pdfs"""
+    """
+    Component mixture multivariate normal pdfs
+
+    factors = MixtureFactors of the mixture, used instead of factorizing
+        Sigma when computing on the cpu
+    """
     try:
         n, d = x.shape
     except ValueError:
@@ -160,13 +250,53 @@ def mixnormpdf(x, prop, mu, Sigma, **kwargs):
             return sum(tmp, 0)
 
 
-def mixnormrnd(pi, mu, sigma, k):
-    """Generate random variables from mixture of Guassians"""
-    xs = []
-    for unused in range(k):
-        j = sum(random() > cumsum(pi))
-        xs.append(multivariate_normal(mu[j], sigma[j]))
-    return array(xs)
+def _random_state(seed):
+    """
+    the numpy.random functions when seed is None, so numpy.random.seed makes
+    draws repeatable, else a RandomState seeded by seed
+    """
+    if seed is None or seed is npr:
+        return npr
+    if isinstance(seed, npr.RandomState):
+        return seed
+    return npr.RandomState(seed)
+
+
+def draw_components(pi, mu, chol, n, seed=None):
+    """
+    draw n points from a mixture of Guassians given the cholesky factors
+    of its covariances, grouped by component.
+
+    returns the points and the number drawn from each component
+    """
+    rs = _random_state(seed)
+    pi = array(pi, dtype='d').reshape(-1)
+    mu = array(mu, dtype='d').reshape(pi.shape[0], -1)
+    counts = rs.multinomial(n, pi / pi.sum())
+    x = rs.standard_normal((n, mu.shape[1]))
+    start = 0
+    for j, count in enumerate(counts):
+        if count > 0:
+            block = x[start:start + count]
+            block[:] = dot(block, chol[j].T)
+            block += mu[j]
+            start += count
+    return x, counts
+
+
+def mixnormrnd(pi, mu, sigma, k, seed=None, chol=None):
+    """
+    Generate random variables from mixture of Guassians
+
+    seed = None, int or RandomState the draws are made from
+    chol = cholesky factors of sigma if already known
+    """
+    rs = _random_state(seed)
+    if chol is None:
+        d = array(mu).reshape(len(pi), -1).shape[1]
+        chol = cholesky(array(sigma, dtype='d').reshape(len(pi), d, d))
+    x, unused_counts = draw_components(pi, mu, chol, k, rs)
+    return x[rs.permutation(k)]
 
 if __name__ == '__main__':
     x = array([1, 0])
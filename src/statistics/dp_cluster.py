@@ -4,18 +4,17 @@ Created on Oct 30, 2009
 @author: Jacob Frelinger
 """
 
-from fcm.statistics.distributions import compmixnormpdf
+from fcm.statistics.distributions import compmixnormpdf, MixtureFactors
+from fcm.statistics.distributions import uses_factors, draw_components
+from fcm.statistics.classification import classify_events
 from fcm.statistics.component import Component
-from numpy import array, log, sum, zeros, concatenate, mean, exp, ndarray, dot
+from numpy import array, log, sum, zeros, exp, ndarray, dot
 from numpy import outer
 import numpy as np
-from scipy.misc import logsumexp
 from numpy.random import multivariate_normal as mvn
-from numpy.random import multinomial
 from numbers import Number
 from util import modesearch
 from warnings import warn
-from copy import deepcopy
 
 from modelresult import ModelResult
 
@@ -24,6 +23,9 @@ class DPCluster(Component):
 
     """
     Single component cluster in mixture model
+
+    A cluster is a view of one row of the component arrays of a mixture, a
+    cluster created on its own holds a mixture of one component.
     """
 
     __array_priority__ = 10
@@ -35,39 +37,80 @@ class DPCluster(Component):
         mu = cluster mean
         sigma = cluster variance/covariance
         """
-        self.pi = pi
-        self.mu = mu
-        self.sigma = sig
         if centered_mu is not None:
-            self._centered_mu = centered_mu
-        else:
-            self._centered_mu = None
+            centered_mu = [centered_mu]
         if centered_sigma is not None:
-            self._centered_sigma = centered_sigma
+            centered_sigma = [centered_sigma]
+        self._bind(_Components([pi], [mu], [sig], centered_mu,
+                               centered_sigma), 0)
+
+    def __setstate__(self, state):
+        if '_components' in state:
+            self.__dict__.update(state)
         else:
-            self._centered_sigma = None
+            # pickled before the components were stored as arrays
+            self.__init__(state['pi'], state['mu'], state['sigma'],
+                          state.get('_centered_mu'),
+                          state.get('_centered_sigma'))
+
+    def _bind(self, components, i):
+        self._components = components
+        self._i = i
+        self._pi = None
+        self._mu = None
+        self._sigma = None
+
+    @property
+    def pi(self):
+        if self._pi is None:
+            self._pi = self._components.pis[self._i]
+        return self._pi
+
+    @pi.setter
+    def pi(self, x):
+        self._components.write('pis', self._i, x)
+
+    @property
+    def mu(self):
+        if self._mu is None:
+            self._mu = self._components.mus[self._i]
+        return self._mu
+
+    @mu.setter
+    def mu(self, x):
+        self._components.write('mus', self._i, x)
+
+    @property
+    def sigma(self):
+        if self._sigma is None:
+            self._sigma = self._components.sigmas[self._i]
+        return self._sigma
+
+    @sigma.setter
+    def sigma(self, s):
+        self._components.write('sigmas', self._i, s)
 
     @property
     def centered_mu(self):
-        if self._centered_mu is None:
+        if self._components.centered_mus is None:
             raise AttributeError
         else:
-            return self._centered_mu
+            return self._components.centered_mus[self._i]
 
     @centered_mu.setter
     def centered_mu(self, x):
-        self._centered_mu = x
+        self._components.write('centered_mus', self._i, x)
 
     @property
     def centered_sigma(self):
-        if self._centered_sigma is None:
+        if self._components.centered_sigmas is None:
             raise AttributeError
         else:
-            return self._centered_sigma
+            return self._components.centered_sigmas[self._i]
 
     @centered_sigma.setter
     def centered_sigma(self, s):
-        self._centered_sigma = s
+        self._components.write('centered_sigmas', self._i, s)
 
     def prob(self, x, logged=False, **kwargs):
         """
@@ -76,6 +119,8 @@ class DPCluster(Component):
         """
         # return self.pi * mvnormpdf(x, self.mu, self.sigma)
         d = self.mu.shape[0]
+        if uses_factors(**kwargs):
+            kwargs['factors'] = self._components.factors().take(self._i)
         return compmixnormpdf(x, self.pi, self.mu.reshape(
             1, -1), self.sigma.reshape(1, d, d), logged=logged, **kwargs)
 
@@ -129,10 +174,183 @@ class DPCluster(Component):
         return DPCluster(self.pi, new_mu, new_sigma)
 
 
+def _frozen(x):
+    """read only float copy of x, arrays mapped from a file are shared"""
+    if isinstance(x, np.memmap) and x.dtype == np.float64:
+        x = x.view()
+    else:
+        x = np.array(x, dtype='d')
+    x.flags.writeable = False
+    return x
+
+
+def _copied(x):
+    """copy of x, arrays mapped from a file are shared (copy on write)"""
+    if isinstance(x, np.memmap):
+        return x.view()
+    return x.copy()
+
+
+class _Components(object):
+
+    """
+    weights, means and covariances (and their centered versions) of the
+    components of a mixture, each stored as one contiguous read only array
+    with a row per component.  Rows are only changed through write so that
+    the cached MixtureFactors can be kept up to date.
+    """
+
+    def __init__(self, pis, mus, sigmas, centered_mus=None,
+                 centered_sigmas=None):
+        self.pis = _frozen(pis)
+        self.mus = _frozen(mus)
+        self.sigmas = _frozen(sigmas)
+        self.centered_mus = None
+        self.centered_sigmas = None
+        if centered_mus is not None:
+            self.centered_mus = _frozen(centered_mus)
+        if centered_sigmas is not None:
+            self.centered_sigmas = _frozen(centered_sigmas)
+        self._views = [None] * len(self)
+        self._factors = None
+
+    @classmethod
+    def stack(cls, clusters):
+        """stack the rows of a list of DPClusters"""
+        try:
+            centered_mus = [i.centered_mu for i in clusters]
+        except AttributeError:
+            centered_mus = None
+        try:
+            centered_sigmas = [i.centered_sigma for i in clusters]
+        except AttributeError:
+            centered_sigmas = None
+        return cls([i.pi for i in clusters],
+                   [i.mu for i in clusters],
+                   [i.sigma for i in clusters],
+                   centered_mus, centered_sigmas)
+
+    def __len__(self):
+        return self.pis.shape[0]
+
+    def __getstate__(self):
+        d = self.__dict__.copy()
+        d['_views'] = [None] * len(self)
+        d['_factors'] = None
+        return d
+
+    def factors(self):
+        """return the (cached) MixtureFactors of the components"""
+        if self._factors is None:
+            self._factors = MixtureFactors(self.pis, self.mus, self.sigmas)
+        return self._factors
+
+    def density_kwargs(self, kwargs):
+        """add the cached factors to the kwargs of compmixnormpdf if used"""
+        if uses_factors(**kwargs):
+            kwargs['factors'] = self.factors()
+        return kwargs
+
+    def view(self, i):
+        """return the DPCluster viewing row i"""
+        if i < 0:
+            i += len(self)
+        v = self._views[i]
+        if v is None:
+            v = DPCluster.__new__(DPCluster)
+            v._bind(self, i)
+            self._views[i] = v
+        return v
+
+    def views(self):
+        return [self.view(i) for i in range(len(self))]
+
+    def write(self, name, idx, value):
+        """set row(s) idx of the array name to value"""
+        x = getattr(self, name)
+        if x is None:
+            # rows not yet given are unknown
+            shape = getattr(self, name[len('centered_'):]).shape
+            x = np.empty(shape)
+            x.fill(np.nan)
+            setattr(self, name, x)
+        x.flags.writeable = True
+        try:
+            x[idx] = value
+        finally:
+            x.flags.writeable = False
+        for v in self._views:
+            if v is not None:
+                v._pi = None
+        if name == 'pis' and self._factors is not None:
+            self._factors.reweight(self.pis)
+        elif name in ['mus', 'sigmas']:
+            self._factors = None
+
+    def take(self, idxs):
+        """return new components holding the rows idxs"""
+        centered_mus = self.centered_mus
+        centered_sigmas = self.centered_sigmas
+        if centered_mus is not None:
+            centered_mus = centered_mus[idxs]
+        if centered_sigmas is not None:
+            centered_sigmas = centered_sigmas[idxs]
+        return _Components(self.pis[idxs], self.mus[idxs],
+                           self.sigmas[idxs], centered_mus, centered_sigmas)
+
+    def moved(self, mus):
+        """return components with the same weights and covariances at mus"""
+        return _Components(self.pis, mus, self.sigmas)
+
+    def transformed(self, k, right=True):
+        """
+        return the components of x * k (or k * x if not right) for every
+        component x
+        """
+        if isinstance(k, Number):
+            return _Components(self.pis, self.mus * k, self.sigmas * k * k)
+        elif not isinstance(k, ndarray):
+            raise TypeError('unsupported type: %s' % type(k))
+
+        # mu -> dot(mu, a) and sigma -> dot(dot(a.T, sigma), a)
+        if right:
+            a = k
+        else:
+            a = k.T
+        flat = a.ndim == 1
+        if flat:
+            a = a[:, np.newaxis]
+        mus = dot(self.mus, a)
+        sigmas = np.einsum('ji,njk,kl->nil', a, self.sigmas, a)
+        if flat:
+            mus = mus[:, 0]
+            sigmas = sigmas[:, 0, 0]
+        return _Components(self.pis, mus, sigmas)
+
+
+def _components(clusters):
+    """
+    return the component arrays of a list of DPClusters, a DPMixture (shared
+    with it) or a tuple of arrays (pis, mus, sigmas[, centered_mus,
+    centered_sigmas])
+    """
+    if isinstance(clusters, _Components):
+        return clusters
+    if isinstance(clusters, DPMixture):
+        return clusters._components
+    if isinstance(clusters, tuple) and len(clusters) and \
+            not isinstance(clusters[0], DPCluster):
+        return _Components(*clusters)
+    return _Components.stack(clusters)
+
+
 class DPMixture(ModelResult):
 
     """
     collection of components that describe a mixture model
+
+    The weights, means and covariances of all components are held in
+    contiguous arrays, mixture[i] is a DPCluster view of component i.
     """
 
     __array_priority__ = 10
@@ -140,46 +358,78 @@ class DPMixture(ModelResult):
     def __init__(self, clusters, niter=1, m=None, s=None, identified=False):
         """
         DPMixture(clusters)
-        cluster = list of DPCluster objects
+        cluster = list of DPCluster objects, a DPMixture whose components
+            are shared, or a tuple of arrays (pis, mus, sigmas) optionally
+            followed by (centered_mus, centered_sigmas)
         """
-        self.clusters = clusters
+        self._components = _components(clusters)
         self.niter = niter
         self.ident = identified
         self.m = m
         self.s = s
 
+    def __setstate__(self, state):
+        state = dict(state)
+        if '_components' not in state:
+            # pickled before the components were stored as arrays
+            state['_components'] = _components(state.pop('clusters'))
+        self.__dict__.update(state)
+
+    @property
+    def clusters(self):
+        """list of DPCluster views of the components"""
+        return self._components.views()
+
     def __add__(self, k):
-        new_clusters = [i + k for i in self.clusters]
-        return DPMixture(new_clusters, self.niter, self.m, self.s, self.ident)
+        return DPMixture(self._components.moved(self.mus + k), self.niter,
+                         self.m, self.s, self.ident)
 
     def __radd__(self, k):
-        new_clusters = [k + i for i in self.clusters]
-        return DPMixture(new_clusters, self.niter, self.m, self.s, self.ident)
+        return DPMixture(self._components.moved(k + self.mus), self.niter,
+                         self.m, self.s, self.ident)
 
     def __sub__(self, k):
-        new_clusters = [i - k for i in self.clusters]
-        return DPMixture(new_clusters, self.niter, self.m, self.s, self.ident)
+        return DPMixture(self._components.moved(self.mus - k), self.niter,
+                         self.m, self.s, self.ident)
 
     def __rsub__(self, k):
-        new_clusters = [k - i for i in self.clusters]
-        return DPMixture(new_clusters, self.niter, self.m, self.s, self.ident)
+        return DPMixture(self._components.moved(k - self.mus), self.niter,
+                         self.m, self.s, self.ident)
 
     def __mul__(self, a):
-        new_clusters = [i * a for i in self.clusters]
-        return DPMixture(new_clusters, self.niter, self.m, self.s, self.ident)
+        return DPMixture(self._components.transformed(a), self.niter, self.m,
+                         self.s, self.ident)
 
     def __rmul__(self, a):
-        new_clusters = [a * i for i in self.clusters]
-        return DPMixture(new_clusters, self.niter, self.m, self.s, self.ident)
+        return DPMixture(self._components.transformed(a, False), self.niter,
+                         self.m, self.s, self.ident)
 
     def __len__(self):
-        return len(self.clusters)
+        return len(self._components)
 
     def __getitem__(self, s):
-        return self.clusters.__getitem__(s)
+        if isinstance(s, slice):
+            return [self._components.view(i)
+                    for i in range(*s.indices(len(self._components)))]
+        return self._components.view(s)
 
     def __setitem__(self, s, values):
-        return self.clusters.__setitem__(s, values)
+        if isinstance(s, slice):
+            idxs = range(*s.indices(len(self._components)))
+        else:
+            idxs = [s]
+            values = [values]
+        for i, c in zip(idxs, values):
+            comps = self._components
+            comps.write('pis', i, c.pi)
+            comps.write('mus', i, c.mu)
+            comps.write('sigmas', i, c.sigma)
+            for name in ['centered_mu', 'centered_sigma']:
+                try:
+                    comps.write(name + 's', i, getattr(c, name))
+                except AttributeError:
+                    if getattr(comps, name + 's') is not None:
+                        comps.write(name + 's', i, np.nan)
 
     def prob(self, x, logged=False, **kwargs):
         """
@@ -193,20 +443,39 @@ class DPMixture(ModelResult):
             self.mus,
             self.sigmas,
             logged=logged,
-            **kwargs)
+            **self._components.density_kwargs(kwargs))
 
-    def classify(self, x, **kwargs):
+    def classify(self, x, posterior=False, entropy=False, memory=None,
+                 workers=None, **kwargs):
         """
         DPMixture.classify(x):
         returns the classification (which mixture) x is a member of
+
+        x is scored a block of events at a time, see classify_events.
+        posterior = also return the posterior probability of the class
+        entropy = also return the entropy of the posterior over the classes
+        memory = bytes the blocks in flight may take
+        workers = number of threads scoring blocks
         """
-        probs = self.prob(x, logged=True, **kwargs)
-        try:
-            unused_n, unused_j = x.shape
-            # return array([i.argmax(0) for i in probs])
-            return probs.argmax(1)
-        except ValueError:
-            return probs.argmax(0)
+        x, single = self._events(x)
+        rslt = classify_events(self.prob, x, len(self._components),
+                               posterior, entropy, memory, workers, **kwargs)
+        if single:
+            if isinstance(rslt, tuple):
+                return tuple(i[0] for i in rslt)
+            return rslt[0]
+        return rslt
+
+    def _events(self, x):
+        """
+        return x as rows of events and whether x was a single event, a one
+        dimensional x is one event unless the mixture is one dimensional
+        """
+        if isinstance(x, ndarray) and x.ndim == 1:
+            if self.mus.ndim > 1 and self.mus.shape[1] > 1:
+                return x.reshape(1, -1), True
+            return x.reshape(-1, 1), False
+        return x, False
 
     @property
     def mus(self):
@@ -214,11 +483,13 @@ class DPMixture(ModelResult):
         DPMixture.mus():
         returns an array of all cluster means
         """
-        return array([i.mu for i in self.clusters])
+        return self._components.mus
 
     @property
     def centered_mus(self):
-        return array([i.centered_mu for i in self.clusters])
+        if self._components.centered_mus is None:
+            raise AttributeError
+        return self._components.centered_mus
 
     @property
     def sigmas(self):
@@ -226,11 +497,13 @@ class DPMixture(ModelResult):
         DPMixture.sigmas():
         returns an array of all cluster variance/covariances
         """
-        return array([i.sigma for i in self.clusters])
+        return self._components.sigmas
 
     @property
     def centered_sigmas(self):
-        return array([i.centered_sigma for i in self.clusters])
+        if self._components.centered_sigmas is None:
+            raise AttributeError
+        return self._components.centered_sigmas
 
     @property
     def pis(self):
@@ -238,7 +511,7 @@ class DPMixture(ModelResult):
         DPMixture.pis()
         return an array of all cluster weights/proportions
         """
-        return array([i.pi for i in self.clusters])
+        return self._components.pis
 
     def make_modal(self, **kwargs):
         """
@@ -248,7 +521,7 @@ class DPMixture(ModelResult):
             modes, cmap = modesearch(
                 self.pis, self.centered_mus, self.centered_sigmas, **kwargs)
             return ModalDPMixture(
-                self.clusters,
+                self,
                 cmap,
                 modes,
                 self.niter,
@@ -259,7 +532,7 @@ class DPMixture(ModelResult):
         except AttributeError:
             modes, cmap = modesearch(self.pis, self.mus, self.sigmas, **kwargs)
             return ModalDPMixture(
-                self.clusters,
+                self,
                 cmap,
                 modes,
                 self.niter,
@@ -273,22 +546,14 @@ class DPMixture(ModelResult):
 
         return sum(log(sum(self.prob(x), axis=0)))
 
-    def draw(self, n):
+    def draw(self, n, seed=None):
         """
-        draw n samples from the represented mixture model
+        draw n samples from the represented mixture model, grouped by
+        component.  seed = None, int or RandomState the draws are made from
         """
-
-        d = multinomial(n, self.pis)
-        results = None
-        for index, count in enumerate(d):
-            if count > 0:
-                try:
-                    results = concatenate(
-                        (results, self.clusters[index].draw(count)), 0)
-                except ValueError:
-                    results = self.clusters[index].draw(count)
-
-        return results
+        x, unused_counts = draw_components(
+            self.pis, self.mus, self._components.factors().chol, int(n), seed)
+        return x
 
     def average(self):
         """
@@ -299,8 +564,7 @@ class DPMixture(ModelResult):
             warn("model wasn't run with ident=True, therefor these averages "
                  "are likely meaningless")
 
-        k = len(self.clusters) / self.niter
-        rslts = []
+        k = len(self._components) // self.niter
         if self.m is None:
             m = 0
         else:
@@ -309,32 +573,15 @@ class DPMixture(ModelResult):
             s = 1
         else:
             s = self.s
-        for i in range(k):
-            mu_avg = []
-            sig_avg = []
-            pi_avg = []
-            for j in range(self.niter):
-                mu_avg.append(self.clusters[j * k + i].mu)
-                sig_avg.append(self.clusters[j * k + i].sigma)
-                pi_avg.append(self.clusters[j * k + i].pi)
-            new_pi = mean(pi_avg, 0)
-            new_mu = mean(mu_avg, 0)
-            new_sig = mean(sig_avg, 0)
-
-            rslts.append(
-                DPCluster(
-                    new_pi,
-                    new_mu,
-                    new_sig,
-                    (new_mu -
-                     m) /
-                    s,
-                    new_sig /
-                    outer(
-                        s,
-                        s)))
-
-        return DPMixture(rslts, 1, m, s)
+
+        def avg(x):
+            return x.reshape((self.niter, k) + x.shape[1:]).mean(0)
+
+        new_pi = avg(self.pis)
+        new_mu = avg(self.mus)
+        new_sig = avg(self.sigmas)
+        return DPMixture((new_pi, new_mu, new_sig, (new_mu - m) / s,
+                          new_sig / outer(s, s)), 1, m, s)
 
     def last(self, n=1):
         """
@@ -344,13 +591,9 @@ class DPMixture(ModelResult):
             raise ValueError(
                 'n=%d is larger than niter (%d)' %
                 (n, self.niter))
-        rslts = []
-        k = len(self.clusters) / self.niter
-        for j in range(n):
-            for i in range(k):
-                rslts.append(self.clusters[-1 * ((i + (j * k)) + 1)])
-
-        return DPMixture(rslts[::-1])
+        k = len(self._components) // self.niter
+        total = len(self._components)
+        return DPMixture(self._components.take(slice(total - n * k, total)))
 
     def get_submodel(self, idxs):
         """
@@ -358,11 +601,9 @@ class DPMixture(ModelResult):
         """
         if isinstance(idxs, Number):
             idxs = [idxs]
-        rslts = [deepcopy(self.clusters[i]) for i in idxs]
-        norm = sum([i.pi for i in rslts])
-        for i in rslts:
-            i.pi = i.pi / norm
-        return DPMixture(rslts, 1, self.m, self.s, self.ident)
+        rslt = self._components.take(list(idxs))
+        rslt.write('pis', slice(None), rslt.pis / rslt.pis.sum())
+        return DPMixture(rslt, 1, self.m, self.s, self.ident)
 
     def get_iteration(self, iters):
         """
@@ -373,23 +614,20 @@ class DPMixture(ModelResult):
         """
         if isinstance(iters, Number):
             iters = [iters]
-        for i, j in enumerate(iters):
+        iters = list(iters)
+        for j, i in enumerate(iters):
             if abs(i) > self.niter:
                 raise IndexError('index error out of range: %d' % i)
             if i < 0:
-                iters[j] = self.niter - i
-
-        stride = len(self.clusters) / self.niter
-        keep = []
-        for i in iters:
-            for j in range(stride):
-                keep.append(deepcopy(self.clusters[(i * stride) + j]))
+                iters[j] = self.niter + i
 
-        pi_adjust = sum(i.pi for i in keep)
-        for i in keep:
-            i.pi = i.pi / pi_adjust
+        stride = len(self._components) // self.niter
+        keep = (stride * np.array(iters, dtype=int)[:, np.newaxis] +
+                np.arange(stride)).ravel()
+        rslt = self._components.take(keep)
+        rslt.write('pis', slice(None), rslt.pis / rslt.pis.sum())
 
-        return DPMixture(keep, len(iters), self.m, self.s, self.ident)
+        return DPMixture(rslt, len(iters), self.m, self.s, self.ident)
 
     def get_marginal(self, margin):
         if isinstance(margin, Number):
@@ -401,64 +639,52 @@ class DPMixture(ModelResult):
         except:
             d = 1
 
-        newd = margin.shape[0]
-        rslts = []
         x = zeros(d, dtype=np.bool)
 
         for i in margin:
             x[i] = True
 
-        y = outer(x, x)
-
-        for i in self.clusters:
-            try:
-                rslts.append(
-                    DPCluster(
-                        i.pi, i.mu[x], i.sigma[y].reshape(
-                            newd, newd), i.centered_mu[x], i.centered_sigma[y].reshape(
-                            newd, newd)))
-            except AttributeError:
-                rslts.append(
-                    DPCluster(
-                        i.pi,
-                        i.mu[x],
-                        i.sigma[y].reshape(
-                            newd,
-                            newd)))
+        idx = np.flatnonzero(x)
+        comps = self._components
+        sub = (comps.pis, comps.mus[:, idx], comps.sigmas[:, idx][:, :, idx])
+        if comps.centered_mus is not None and \
+                comps.centered_sigmas is not None:
+            sub += (comps.centered_mus[:, idx],
+                    comps.centered_sigmas[:, idx][:, :, idx])
 
-        return DPMixture(rslts, self.niter, self.m, self.s, self.ident)
+        return DPMixture(sub, self.niter, self.m, self.s, self.ident)
 
     def enumerate_clusters(self):
         """
         enumerate through clusters
         """
-        for i in range(len(self.clusters)):
-            yield i, self.clusters[i]
+        for i in range(len(self._components)):
+            yield i, self[i]
 
     def enumerate_pis(self):
-        for i in range(len(self.clusters)):
-            yield i, self.clusters[i].pi
+        for i in range(len(self._components)):
+            yield i, self[i].pi
 
     def enumerate_mus(self):
         """
         enumerate through the clusters means
         """
-        for i in range(len(self.clusters)):
-            yield i, self.clusters[i].mu
+        for i in range(len(self._components)):
+            yield i, self[i].mu
 
     def enumerate_sigmas(self):
         """
         enumerate through the cluster covariances
         """
-        for i in range(len(self.clusters)):
-            yield i, self.clusters[i].sigma
+        for i in range(len(self._components)):
+            yield i, self[i].sigma
 
     def reorder(self, lookup):
         """
         add an order to a DPMixture
         """
         return OrderedDPMixture(
-            self.clusters,
+            self,
             lookup,
             self.niter,
             self.m,
@@ -512,30 +738,32 @@ class OrderedDPMixture(DPMixture):
         """
         enumerate through clusters
         """
-        for i in range(len(self.clusters)):
-            yield self.lookup[i], self.clusters[i]
+        for i in range(len(self._components)):
+            yield self.lookup[i], self[i]
 
     def enumerate_pis(self):
-        for i in range(len(self.clusters)):
-            yield self.lookup[i], self.clusters[i].pi
+        for i in range(len(self._components)):
+            yield self.lookup[i], self[i].pi
 
     def enumerate_mus(self):
         """
         enumerate through the clusters means
         """
-        for i in range(len(self.clusters)):
-            yield self.lookup[i], self.clusters[i].mu
+        for i in range(len(self._components)):
+            yield self.lookup[i], self[i].mu
 
     def enumerate_sigmas(self):
         """
         enumerate through the cluster covariances
         """
-        for i in range(len(self.clusters)):
-            yield self.lookup[i], self.clusters[i].sigma
+        for i in range(len(self._components)):
+            yield self.lookup[i], self[i].sigma
 
     def classify(self, x, **kwargs):
         z = super(OrderedDPMixture, self).classify(x, **kwargs)
         lut = np.array([self.lookup[i] for i in range(len(self))])
+        if isinstance(z, tuple):
+            return (lut[z[0]],) + z[1:]
         return lut[z]
 
 
@@ -560,7 +788,7 @@ class ModalDPMixture(DPMixture):
         cmap = map of modal clusters to component clusters
         modes = array of mode locations
         """
-        self.clusters = clusters
+        self._components = _components(clusters)
         self.cmap = cmap
         self.modemap = modes
         self.niter = niter
@@ -576,7 +804,7 @@ class ModalDPMixture(DPMixture):
             self.s = 1
 
     def __add__(self, k):
-        new_clusters = [i + k for i in self.clusters]
+        new_clusters = self._components.moved(self.mus + k)
         new_modes = {}
         for i in self.modemap:
             new_modes[i] = self.modemap[i] + k
@@ -590,7 +818,7 @@ class ModalDPMixture(DPMixture):
             self.ident)
 
     def __radd__(self, k):
-        new_clusters = [k + i for i in self.clusters]
+        new_clusters = self._components.moved(k + self.mus)
         new_modes = {}
         for i in self.modemap:
             new_modes[i] = k + self.modemap[i]
@@ -604,7 +832,7 @@ class ModalDPMixture(DPMixture):
             self.ident)
 
     def __sub__(self, k):
-        new_clusters = [i - k for i in self.clusters]
+        new_clusters = self._components.moved(self.mus - k)
         new_modes = {}
         for i in self.modemap:
             new_modes[i] = self.modemap[i] - k
@@ -618,7 +846,7 @@ class ModalDPMixture(DPMixture):
             self.ident)
 
     def __rsub__(self, k):
-        new_clusters = [k - i for i in self.clusters]
+        new_clusters = self._components.moved(k - self.mus)
         new_modes = {}
         for i in self.modemap:
             new_modes[i] = k - self.modemap[i]
@@ -632,7 +860,7 @@ class ModalDPMixture(DPMixture):
             self.ident)
 
     def __mul__(self, a):
-        new_clusters = [i * a for i in self.clusters]
+        new_clusters = self._components.transformed(a)
         new_modes = {}
         for i in self.modemap:
             if isinstance(a, Number):
@@ -649,7 +877,7 @@ class ModalDPMixture(DPMixture):
             self.ident)
 
     def __rmul__(self, a):
-        new_clusters = [a * i for i in self.clusters]
+        new_clusters = self._components.transformed(a, False)
         new_modes = {}
         for i in self.modemap:
             if isinstance(a, Number):
@@ -674,40 +902,51 @@ class ModalDPMixture(DPMixture):
         returns  an array of probabilities of x being in each mode of the modal
         mixture
         """
+        x, single = self._events(x)
         probs = compmixnormpdf(
             x,
             self.pis,
             self.mus,
             self.sigmas,
             logged=logged,
-            **kwargs)
-
-        # can't sum in log prob space
-
-        try:
-            n, j = x.shape  # check we're more then 1 point
-            rslt = zeros((n, len(self.cmap.keys())))
-            for j in self.cmap.keys():
-                if logged:
-                    rslt[:, j] = logsumexp([probs[:, i]
-                                            for i in list(self.cmap[j])], 0)
-                else:
-                    rslt[:, j] = sum([probs[:, list(i)]
-                                      for i in self.cmap[j]], 0)
-        except ValueError as e:
-            print ">>>", e
-            # single point
-            rslt = zeros((len(self.cmap.keys())))
-            for j in self.cmap.keys():
-                if logged:
-                    rslt[j] = logsumexp(
-                        [self.clusters[i].prob(x, logged=logged) for i in self.cmap[j]])
-                else:
-                    rslt[j] = sum([self.clusters[i].prob(x)
-                                   for i in list(self.cmap[j])])
+            **self._components.density_kwargs(kwargs))
+        probs = probs.reshape(x.shape[0], -1)
+
+        # components sorted by mode, summed over each run of a mode
+        order, starts, cols = self._mode_index()
+        probs = np.take(probs, order, axis=1)
+        if logged:
+            # can't sum in log prob space
+            top = np.maximum.reduceat(probs, starts, axis=1)
+            top[~np.isfinite(top)] = 0
+            probs -= np.repeat(top, np.diff(np.append(starts, len(order))),
+                               axis=1)
+            modal = log(np.add.reduceat(exp(probs), starts, axis=1)) + top
+        else:
+            modal = np.add.reduceat(probs, starts, axis=1)
 
+        rslt = zeros((x.shape[0], len(self.cmap)))
+        rslt[:, cols] = modal
+        if single:
+            return rslt[0]
         return rslt
 
+    def _mode_index(self):
+        """
+        return the components ordered by mode, where each mode's run starts
+        and the mode of each run, recomputed only if cmap is replaced
+        """
+        cached = self.__dict__.get('_cached_modes')
+        if cached is None or cached[0] is not self.cmap:
+            cols = sorted(self.cmap.keys())
+            order = np.concatenate(
+                [np.asarray(list(self.cmap[j]), dtype=int) for j in cols])
+            sizes = [len(self.cmap[j]) for j in cols]
+            starts = np.cumsum([0] + sizes[:-1])
+            cached = (self.cmap, (order, starts, np.array(cols, dtype=int)))
+            self._cached_modes = cached
+        return cached[1]
+
     @property
     def modes(self):
         """
@@ -730,22 +969,9 @@ class ModalDPMixture(DPMixture):
         for i in range(len(self.modes)):
             yield i, self.modes[i]
 
-    def classify(self, x, **kwargs):
-        """
-        ModalDPMixture.classify(x):
-        returns the classification (which mixture) x is a member of
-        """
-        probs = self.prob(x, logged=True, **kwargs)
-        try:
-            unused_n, unused_j = x.shape
-            # return array([i.argmax(0) for i in probs])
-            return probs.argmax(1)
-        except ValueError:
-            return probs.argmax(0)
-
     def reorder(self, lookup):
         return OrderedModalDPMixture(
-            self.clusters,
+            self,
             self.cmap,
             self.modemap,
             lookup,
@@ -826,6 +1052,8 @@ class OrderedModalDPMixture(ModalDPMixture):
     def classify(self, x, **kwargs):
         z = super(OrderedModalDPMixture, self).classify(x, **kwargs)
         lut = np.array([self.lookup[i] for i in range(len(self))])
+        if isinstance(z, tuple):
+            return (lut[z[0]],) + z[1:]
         return lut[z]
 
 
@@ -862,12 +1090,26 @@ class HDPMixture(Component):
         else:
             raise TypeError("Invalid argument type.")
 
+    def _factors(self):
+        """
+        MixtureFactors of the shared components, computed once for all
+        datasets unless the means or covariances were replaced
+        """
+        cached = self.__dict__.get('_cached_factors')
+        if cached is None or cached[0] is not self.mus or \
+                cached[1] is not self.sigmas:
+            cached = (self.mus, self.sigmas,
+                      MixtureFactors(np.ones(len(self.mus)), self.mus,
+                                     self.sigmas))
+            self._cached_factors = cached
+        return cached[2]
+
     def _getData(self, key):
         pis = self.pis[key, :]
         mus = (self.mus - self.m) / self.s
         sigmas = (self.sigmas) / outer(self.s, self.s)
-        clsts = [DPCluster(i, j, k, l, m) for i, j, k, l, m in
-                 zip(pis, self.mus, self.sigmas, mus, sigmas)]
+        clsts = _Components(pis, self.mus, self.sigmas, mus, sigmas)
+        clsts._factors = self._factors().reweighted(pis)
         return DPMixture(clsts, self.niter, self.m, self.s, self.ident)
 
     def __add__(self, x):
@@ -983,8 +1225,7 @@ class HDPMixture(Component):
         r_consensus = self._getData(0)
         pis = sum(self.pis, 0)
         pis /= sum(pis)
-        for i in range(len(r_consensus.clusters)):
-            r_consensus.clusters[i].pi = pis[i]
+        r_consensus._components.write('pis', slice(None), pis)
 
         # merge aggressively
         c_consensus = r_consensus.make_modal(**kwargs)
@@ -999,7 +1240,8 @@ class HDPMixture(Component):
             ref_modemap,
             self.niter,
             self.m,
-            self.s)
+            self.s,
+            self.ident)
 
     def reorder(self, lookup):
         return OrderedHDPMixture(
@@ -1069,6 +1311,9 @@ class OrderedHDPMixture(HDPMixture):
 
 class ModalHDPMixture(HDPMixture):
 
+    # mixtures pickled before ident was kept
+    ident = False
+
     def __init__(
             self,
             pis,
@@ -1078,19 +1323,21 @@ class ModalHDPMixture(HDPMixture):
             modemap,
             niter=1,
             m=None,
-            s=None):
+            s=None,
+            identified=False):
         """
         ModalHDPMixture(clusters)
         cluster = HDPMixture object
         cmap = map of modal clusters to component clusters
         modes = array of mode locations
         """
-        self.pis = pis.copy()
-        self.mus = mus.copy()
-        self.sigmas = sigmas.copy()
+        self.pis = _copied(pis)
+        self.mus = _copied(mus)
+        self.sigmas = _copied(sigmas)
         self.cmap = cmap
         self.modemap = modemap
         self.niter = niter
+        self.ident = identified
 
         if m is not None:
             self.m = m
@@ -1110,7 +1357,8 @@ class ModalHDPMixture(HDPMixture):
             self.modemap,
             self.niter,
             self.m,
-            self.s)
+            self.s,
+            self.ident)
 
     def __radd__(self, k):
         return ModalHDPMixture(
@@ -1121,7 +1369,8 @@ class ModalHDPMixture(HDPMixture):
             self.modemap,
             self.niter,
             self.m,
-            self.s)
+            self.s,
+            self.ident)
 
     def __sub__(self, k):
         return ModalHDPMixture(
@@ -1132,7 +1381,8 @@ class ModalHDPMixture(HDPMixture):
             self.modemap,
             self.niter,
             self.m,
-            self.s)
+            self.s,
+            self.ident)
 
     def __rsub__(self, k):
         return ModalHDPMixture(
@@ -1143,7 +1393,8 @@ class ModalHDPMixture(HDPMixture):
             self.modemap,
             self.niter,
             self.m,
-            self.s)
+            self.s,
+            self.ident)
 
     def __mul__(self, k):
         if isinstance(k, Number):
@@ -1163,7 +1414,8 @@ class ModalHDPMixture(HDPMixture):
             self.modemap,
             self.niter,
             self.m,
-            self.s)
+            self.s,
+            self.ident)
 
     def __rmul__(self, k):
         if isinstance(k, Number):
@@ -1183,21 +1435,23 @@ class ModalHDPMixture(HDPMixture):
             self.modemap,
             self.niter,
             self.m,
-            self.s)
+            self.s,
+            self.ident)
 
     def _getData(self, key):
         pis = self.pis[key, :]
         mus = (self.mus - self.m) / self.s
         sigmas = (self.sigmas) / outer(self.s, self.s)
-        clsts = [DPCluster(i, j, k, l, m) for i, j, k, l, m in
-                 zip(pis, self.mus, self.sigmas, mus, sigmas)]
+        clsts = _Components(pis, self.mus, self.sigmas, mus, sigmas)
+        clsts._factors = self._factors().reweighted(pis)
         return ModalDPMixture(
             clsts,
             self.cmap,
             self.modemap,
             self.niter,
             self.m,
-            self.s)
+            self.s,
+            self.ident)
 
     @property
     def modes(self):
@@ -1229,7 +1483,8 @@ class ModalHDPMixture(HDPMixture):
             lookup,
             self.niter,
             self.m,
-            self.s)
+            self.s,
+            self.ident)
 
     def enumerate_modes(self):
         for i in range(len(self.modes)):
@@ -1248,7 +1503,8 @@ class OrderedModalHDPMixture(ModalHDPMixture):
             lookup,
             niter,
             m=None,
-            s=None):
+            s=None,
+            identified=False):
         super(
             OrderedModalHDPMixture,
             self).__init__(
@@ -1259,7 +1515,8 @@ class OrderedModalHDPMixture(ModalHDPMixture):
             modemap,
             niter,
             m,
-            s)
+            s,
+            identified)
         self.lookup = lookup
 
     def __add__(self, k):
@@ -0,0 +1,169 @@
+"""
+Run independent mixture model fits, per sample and per chain, on a pool of
+processes
+"""
+
+import copy
+import threading
+from multiprocessing import Pool, cpu_count
+from fcm.core.fcmcollection import FCMcollection
+from distributions import _random_state
+
+# state left on a model by a previous fit, not sent to the workers
+_FITTED = ['cdp', 'data', '_run']
+
+
+def _template(model):
+    """copy of model without the state of any previous fit"""
+    model = copy.copy(model)
+    for i in _FITTED:
+        model.__dict__.pop(i, None)
+    return model
+
+
+def _events(x):
+    # FCMdata objects are sent to the workers as their current view
+    if hasattr(x, 'view') and hasattr(x, 'channels'):
+        return x.view()
+    return x
+
+
+def _run(args):
+    """fit one (sample, chain) job on its own copy of the model"""
+    model, x, seed, verbose, normed = args
+    model = copy.deepcopy(model)
+    model.seed = seed
+    return model._fit(x, verbose, normed)
+
+
+class ParallelFit(object):
+
+    """
+    Fits copies of a DPMixtureModel to several samples, and several chains
+    per sample, on a process pool.  Every fit runs on its own copy of the
+    model with its own seed, drawn from one RandomState so a run can be
+    reproduced whatever the number of workers.  Samples are sent to the
+    workers a few at a time, so a LazyFCMcollection is never loaded whole.
+
+    fitter = ParallelFit(DPMixtureModel(16, 1000, 100), chains=4, seed=1)
+    results = fitter.fit(collection, progress=report)
+    """
+
+    def __init__(self, model, chains=1, workers=None, seed=None):
+        """
+        model = DPMixtureModel with its priors and options set
+        chains = number of chains fitted to each sample
+        workers = number of processes, None for one per cpu and 1 to fit
+            in this process
+        seed = int or RandomState the seeds of the fits are drawn from.
+            None with chains=1 fits every sample with the seed of the
+            model, as fitting them one by one with model.fit does.
+        """
+        self.model = model
+        self.chains = chains
+        self.workers = workers
+        self.seed = seed
+        self.cancelled = False
+        self._cancel = threading.Event()
+
+    def cancel(self):
+        """
+        stop a running fit (from another thread or the progress callback),
+        fits not yet finished are returned as None
+        """
+        self._cancel.set()
+
+    def seeds(self, njobs):
+        """return the seeds of njobs fits"""
+        if self.seed is None and self.chains == 1:
+            return [self.model.seed] * njobs
+        rs = _random_state(self.seed)
+        return [int(i) for i in rs.randint(0, 2 ** 31 - 1, njobs)]
+
+    def fit(self, datasets, verbose=False, normed=False, progress=None):
+        """
+        fit every chain to every sample in datasets, a FCMdata object or
+        array, or a list or FCMcollection of them.
+
+        progress = function(done, total) called as fits are gathered
+
+        returns the fitted DPMixture of each sample, in the order of the
+        list or of the sorted sample names of a collection, or a list of
+        one per chain if chains > 1.  a single sample gives a single result.
+        """
+        single = False
+        if isinstance(datasets, FCMcollection):
+            keys = sorted(datasets.keys())
+            batches = datasets._batches
+        else:
+            if not isinstance(datasets, (list, tuple)):
+                datasets = [datasets]
+                single = True
+            keys = range(len(datasets))
+            batches = _batches
+
+        template = _template(self.model)
+        seeds = self.seeds(len(keys) * self.chains)
+        njobs = len(seeds)
+
+        self.cancelled = False
+        self._cancel.clear()
+        rslts = []
+        if self.workers == 1:
+            pool = None
+            size = 1
+        else:
+            pool = Pool(self.workers)
+            size = self.workers or cpu_count()
+        finished = False
+        try:
+            # a batch of samples at a time, so only those are in memory
+            for batch in batches(keys, size):
+                jobs = []
+                for key in batch:
+                    x = _events(datasets[key])
+                    for j in range(self.chains):
+                        k = len(rslts) + len(jobs)
+                        jobs.append((template, x, seeds[k], verbose, normed))
+                if pool is None:
+                    pending = jobs
+                else:
+                    pending = [pool.apply_async(_run, (job,)) for job in jobs]
+                for r in pending:
+                    if pool is not None:
+                        while not r.ready() and not self._cancel.is_set():
+                            r.wait(0.1)
+                    if self._cancel.is_set():
+                        break
+                    if pool is None:
+                        rslts.append(_run(r))
+                    else:
+                        rslts.append(r.get())
+                    if progress is not None:
+                        progress(len(rslts), njobs)
+                if self._cancel.is_set():
+                    break
+            finished = not self._cancel.is_set()
+        finally:
+            # stop fits still running after a cancel or an error
+            if pool is not None:
+                if finished:
+                    pool.close()
+                else:
+                    pool.terminate()
+                pool.join()
+        self.cancelled = self._cancel.is_set()
+        rslts.extend([None] * (njobs - len(rslts)))
+
+        if self.chains > 1:
+            rslts = [rslts[i:i + self.chains]
+                     for i in range(0, len(rslts), self.chains)]
+        if single:
+            return rslts[0]
+        return rslts
+
+
+def _batches(keys, size):
+    """yield the keys in groups of size"""
+    for i in range(0, len(keys), size):
+        yield keys[i:i + size]
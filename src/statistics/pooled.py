@@ -0,0 +1,138 @@
+"""
+Datasets pooled into one standardized buffer for joint model fitting
+"""
+
+import numpy
+from fcm.core.fcmcollection import FCMcollection
+
+
+class PooledData(object):
+
+    """
+    The events of several datasets standardized by their pooled mean and
+    standard deviation, stored back to back in one contiguous buffer.
+
+    pooled.data = the whole buffer
+    pooled[i] = the standardized events of dataset i (a view of the buffer)
+    pooled.m, pooled.s = pooled mean and standard deviation
+    """
+
+    def __init__(self, datasets, dtype='double', normed=False,
+                 blocksize=65536, index=None):
+        """
+        datasets = FCMcollection, or list of FCMdata objects or arrays
+        dtype = type of the buffer, 'float32' halves its size
+        normed = if True the data is already standardized and only copied
+        blocksize = number of events summarized and standardized at a time
+        index = events of each dataset used, such as a subsample index,
+            gathered a block at a time instead of copied out first
+        """
+        if isinstance(datasets, FCMcollection):
+            # looked up in each pass so a LazyFCMcollection only holds the
+            # samples its memory budget allows
+            self.names = sorted(datasets.keys())
+            samples = datasets
+        else:
+            self.names = range(len(datasets))
+            samples = datasets
+
+        # one pass over blocks accumulating counts, means and sums of
+        # squared deviations, only counting the events of normed data
+        counts = []
+        m = None
+        m2 = None
+        total = 0
+        for name in self.names:
+            x = _events(samples[name])
+            if m is None:
+                d = x.shape[1]
+                m = numpy.zeros(d)
+                m2 = numpy.zeros(d)
+            elif x.shape[1] != d:
+                raise ValueError("Datasets shape do not match")
+            rows = _rows(x, index)
+            counts.append(x.shape[0] if rows is None else len(rows))
+            if normed:
+                continue
+            for i in range(0, counts[-1], blocksize):
+                block = _block(x, rows, i, blocksize)
+                n = block.shape[0]
+                bm = block.mean(0, dtype='d')
+                delta = bm - m
+                total += n
+                m += delta * n / total
+                m2 += ((block - bm) ** 2).sum(0) + \
+                    delta ** 2 * n * (total - n) / total
+        if m is None:
+            raise ValueError("No datasets to pool")
+
+        self.d = d
+        self.offsets = numpy.zeros(len(counts) + 1, dtype=int)
+        numpy.cumsum(counts, out=self.offsets[1:])
+        if normed:
+            self.m = numpy.zeros(d)
+            self.s = numpy.ones(d)
+        else:
+            self.m = m
+            self.s = numpy.sqrt(m2 / max(total, 1))
+            # incase any of the std's are zero
+            self.s[self.s == 0] = 1
+
+        self.data = numpy.empty((self.offsets[-1], d), dtype=dtype)
+        for k, name in enumerate(self.names):
+            x = _events(samples[name])
+            rows = _rows(x, index)
+            out = self[k]
+            for i in range(0, len(out), blocksize):
+                out[i:i + blocksize] = \
+                    (_block(x, rows, i, blocksize) - self.m) / self.s
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return self.data[self.offsets[i]:self.offsets[i + 1]]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    @property
+    def shape(self):
+        return self.data.shape
+
+    def datasets(self):
+        """return the list of standardized datasets"""
+        return list(self)
+
+    def restore(self, i=None):
+        """return dataset i (all data if None) on its original scale"""
+        if i is None:
+            return self.data * self.s + self.m
+        return self[i] * self.s + self.m
+
+
+def _events(x):
+    if hasattr(x, 'view') and not isinstance(x, numpy.ndarray):
+        x = x.view()
+    x = numpy.asarray(x)
+    if x.ndim == 1:
+        x = x.reshape((x.shape[0], 1))
+    return x
+
+
+def _rows(x, index):
+    """positions of the rows of x selected by index, None for all"""
+    if index is None:
+        return None
+    rows = numpy.arange(x.shape[0])[index]
+    if rows.ndim != 1:
+        raise ValueError("index should select rows of the datasets")
+    return rows
+
+
+def _block(x, rows, i, blocksize):
+    """blocksize of the selected rows of x, starting with the i'th"""
+    if rows is None:
+        return x[i:i + blocksize]
+    return x[rows[i:i + blocksize]]
@@ -0,0 +1,142 @@
+"""
+Running averages of MCMC draws of mixture models
+"""
+
+import numpy
+from numpy import outer
+from dp_cluster import DPMixture, HDPMixture
+
+
+class PosteriorAverage(object):
+
+    """
+    Running means, and optionally variances, of the weights, means and
+    covariances of the draws of a mixture model, kept as the draws are made
+    so a long chain can be averaged without storing every draw.
+
+    Pass it as the callback of DPMixtureModel.fit or HDPMixtureModel.fit
+    and the draws the sampler stores are averaged when it finishes (see
+    add_sampler), on the scale of the data.  Draws can also be added one
+    at a time by calling it with the weights, means and covariances of
+    each.
+    """
+
+    def __init__(self, skip=0, thin=1, variance=False):
+        """
+        skip = number of draws ignored first (burn in)
+        thin = only every thin'th draw after those is used
+        variance = also keep the variances of the draws
+        """
+        self.skip = skip
+        self.thin = thin
+        self.variance = variance
+        self.m = None
+        self.s = None
+        self.ident = False
+        self.reset()
+
+    def reset(self):
+        """forget all draws seen"""
+        self.seen = 0
+        self.count = 0
+        self.means = None
+        self.m2 = None
+
+    def scale(self, m, s, ident=False):
+        """set the mean and standard deviation the draws are standardized by"""
+        self.m = m
+        self.s = s
+        self.ident = ident
+
+    def add_sampler(self, sampler):
+        """
+        add the draws stored by a dpmix (0.3) DPNormalMixture or
+        HDPNormalMixture after sampling, its weights, mu and Sigma
+        attributes holding one draw per row
+        """
+        try:
+            draws = [sampler.weights, sampler.mu, sampler.Sigma]
+        except AttributeError:
+            raise ValueError('%s does not hold the weights, mu and Sigma '
+                             'of its draws' % type(sampler).__name__)
+        if len(set(len(i) for i in draws)) != 1:
+            raise ValueError('the sampler holds %d weights, %d means and %d '
+                             'covariances' % tuple(len(i) for i in draws))
+        for pis, mus, sigmas in zip(*draws):
+            self(pis, mus, sigmas)
+
+    def __call__(self, pis, mus, sigmas):
+        """
+        add one draw of the weights (k, or datasets x k), means (k x d) and
+        covariances (k x d x d), raising ValueError if they do not match
+        """
+        self.seen += 1
+        if self.seen <= self.skip or (self.seen - self.skip - 1) % self.thin:
+            return
+        draw = [numpy.array(i, dtype='d') for i in [pis, mus, sigmas]]
+        _check_draw(draw, self.means)
+        self.count += 1
+        if self.means is None:
+            self.means = draw
+            if self.variance:
+                self.m2 = [numpy.zeros_like(i) for i in draw]
+            return
+        for i, x in enumerate(draw):
+            delta = x - self.means[i]
+            self.means[i] += delta / self.count
+            if self.variance:
+                self.m2[i] += delta * (x - self.means[i])
+
+    def _scales(self):
+        d = self.means[1].shape[-1]
+        m = numpy.zeros(d) if self.m is None else self.m
+        s = numpy.ones(d) if self.s is None else self.s
+        return m, s
+
+    def results(self):
+        """
+        return the averaged model, a DPMixture, or a HDPMixture if the
+        weights of a draw are per dataset
+        """
+        if not self.count:
+            raise ValueError('no draws have been averaged')
+        pis, mus, sigmas = self.means
+        m, s = self._scales()
+        new_mus = mus * s + m
+        new_sigmas = sigmas * outer(s, s)
+        if pis.ndim > 1:
+            return HDPMixture(pis, new_mus, new_sigmas, 1, m, s, self.ident)
+        return DPMixture((pis, new_mus, new_sigmas, mus, sigmas), 1, m, s,
+                         self.ident)
+
+    def variances(self):
+        """
+        return the variances of the weights, means and covariances of the
+        draws, on the scale of the data
+        """
+        if not self.variance:
+            raise ValueError('variances are not being kept, '
+                             'use PosteriorAverage(variance=True)')
+        if not self.count:
+            raise ValueError('no draws have been averaged')
+        unused_m, s = self._scales()
+        pis, mus, sigmas = [i / self.count for i in self.m2]
+        return pis, mus * s ** 2, sigmas * outer(s, s) ** 2
+
+
+def _check_draw(draw, means):
+    """raise ValueError if draw is not the weights, means and covariances"""
+    pis, mus, sigmas = draw
+    if mus.ndim != 2 or pis.ndim not in (1, 2) or sigmas.ndim != 3:
+        raise ValueError('expected weights, means and covariances, got '
+                         'arrays of shape %s, %s and %s' %
+                         (pis.shape, mus.shape, sigmas.shape))
+    k, d = mus.shape
+    if pis.shape[-1] != k or sigmas.shape != (k, d, d):
+        raise ValueError('weights %s and covariances %s do not match means %s'
+                         % (pis.shape, sigmas.shape, mus.shape))
+    shapes = [pis.shape, mus.shape, sigmas.shape]
+    if means is not None and shapes != [i.shape for i in means]:
+        raise ValueError('draw of shape %s, %s and %s does not match the '
+                         'draws averaged so far' %
+                         (pis.shape, mus.shape, sigmas.shape))
@@ -6,64 +6,16 @@ Created on Nov 5, 2009
 
 from __future__ import division
 from numpy.linalg import solve, inv
-from collections import deque
-from itertools import chain
 import numpy as np
 import numpy.random as npr
 from scipy.spatial.distance import pdist as _pdist, squareform
+from scipy.spatial import cKDTree
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
 
-from fcm.statistics.distributions import compmixnormpdf, mixnormpdf, mvnormpdf, mixnormrnd
+from multiprocessing.pool import ThreadPool
 
-
-def bfs(g, start):
-    """BFS generator from start node"""
-    queue, enqueued = deque([(None, start)]), set([start])
-    while queue:
-        parent, n = queue.popleft()
-        yield parent, n
-        new = set(g[n]) - enqueued
-        enqueued |= new
-        queue.extend([(n, child) for child in new])
-
-
-def dfs(g, start):
-    """DFS generator from start node"""
-    stack, enqueued = [(None, start)], set([start])
-    while stack:
-        parent, n = stack.pop()
-        yield parent, n
-        new = set(g[n]) - enqueued
-        enqueued |= new
-        stack.extend([(n, child) for child in new])
-
-
-def flatten(listOfLists):
-    "Flatten one level of nesting"
-    return chain.from_iterable(listOfLists)
-
-
-def nodes(collection):
-    """Return unique nodes"""
-    return frozenset(node for node in flatten(collection) if node is not None)
-
-
-def find_components(g):
-    """Find connected components in graph g"""
-    z = []
-    for i in range(len(g)):
-        j = nodes(bfs(g, i))
-        if j not in z:
-            z.append(j)
-    return [list(i) for i in z]
-    # return np.unique([nodes(bfs(g, i)) for i in range(len(g))])
-
-
-def matrix_to_graph(m):
-    """Convert adjacency matrix to dictionary form of graph"""
-    graph = {}
-    for i, row in enumerate(m):
-        graph[i] = np.nonzero(m[i, :])[0]
-    return graph
+from fcm.statistics.distributions import mvnormpdf, mixnormrnd, MixtureFactors
 
 
 def pdist(x, w=None, scale=False):
@@ -74,10 +26,7 @@ def pdist(x, w=None, scale=False):
     n, p = x.shape
     if w is not None:
         w = np.sqrt(w)
-        print w
-        print x
         x = x * w
-        print x
     if scale:
         return (1.0 / np.sqrt(p)) * squareform(_pdist(x, 'euclidean'))
     else:
@@ -92,86 +41,140 @@ def modesearch(
         maxiter=20,
         delta=0.1,
         w=None,
-        scale=False):
+        scale=False,
+        workers=None):
     """find the modes of a mixture of guassians"""
 
-    mdict, sm, unused_spm = _mode_search(
-        pis, mus, sigmas, nk=0, tol=tol, maxiter=maxiter)
+    mdict, unused_sm, unused_spm = _mode_search(
+        pis, mus, sigmas, nk=0, tol=tol, maxiter=maxiter, workers=workers)
 
-    m = np.array([i[0] for i in mdict.values()])
-    sm = np.array(sm)
-    xs = np.zeros((len(mdict.keys()), mus.shape[1]))
+    xs = np.zeros((len(mdict), mus.shape[1]))
     # use stored index as dict items are not ordered
-    for j, key in enumerate(mdict):
-        cur_mode = tuple(m[j, :].tolist())
-        xs[key[0], :] = cur_mode
+    for key, value in mdict.items():
+        xs[key[0], :] = value[0]
 
-    dm = pdist(xs, scale=scale, w=w) < delta  # , w=np.array([1,1,1,1]))
-    cs = find_components(matrix_to_graph(dm))
-    cs = sorted(cs, key=len, reverse=True)
+    return merge_modes(xs, delta, w, scale)
 
-    cs = [list(j) for j in cs]
-    rslt = {}
-    modes = {}
 
-    for i, j in enumerate(cs):
+def merge_modes(xs, delta=0.1, w=None, scale=False):
+    """
+    group the points xs closer than delta (see pdist for w and scale) into
+    connected clusters, largest first.
 
-        modes[i] = np.mean(np.vstack([xs[k, :] for k in j]), 0)
-        rslt[i] = tuple(list(j))
+    returns a dictionary of the mean of each cluster and a dictionary of
+    the tuple of rows of xs in each cluster
+    """
+    n, p = xs.shape
+    x = xs
+    if w is not None:
+        x = x * np.sqrt(w)
+    radius = delta
+    if scale:
+        radius = delta * np.sqrt(p)
+    # pairs strictly closer than delta
+    pairs = np.array(sorted(cKDTree(x).query_pairs(np.nextafter(radius, 0))),
+                     dtype=int).reshape(-1, 2)
+    graph = coo_matrix((np.ones(len(pairs)), (pairs[:, 0], pairs[:, 1])),
+                       shape=(n, n))
+    unused_nc, labels = connected_components(graph, directed=False)
+
+    # largest first, ties in order of their first point
+    sizes = np.bincount(labels)
+    order = np.argsort(-sizes, kind='mergesort')
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    labels = rank[labels]
+    sizes = sizes[order]
+    means = np.zeros((len(sizes), p))
+    np.add.at(means, labels, xs)
+    means /= sizes[:, np.newaxis]
+
+    members = np.argsort(labels, kind='mergesort')
+    starts = np.concatenate([[0], np.cumsum(sizes)])
+    rslt = {}
+    modes = {}
+    for i in range(len(sizes)):
+        modes[i] = means[i]
+        rslt[i] = tuple(int(j) for j in members[starts[i]:starts[i + 1]])
 
     return modes, rslt
 
 
-def _mode_search(pi, mu, sigma, nk=0, tol=0.000001, maxiter=20):
-    """Search for modes in mixture of Gaussians"""
+def _mode_search(pi, mu, sigma, nk=0, tol=0.000001, maxiter=20,
+                 workers=None):
+    """
+    Search for modes in mixture of Gaussians, climbing from every starting
+    point at once.  workers = number of threads sharing the starting points
+    """
     k, unused_p = mu.shape
-    omega = np.copy(sigma)
-    a = np.copy(mu)
-
-    for j in range(k):
-        omega[j] = inv(sigma[j])
-        a[j] = solve(sigma[j], mu[j])
+    omega = inv(sigma)
+    a = np.einsum('kij,kj->ki', omega, mu)
+    factors = MixtureFactors(pi, mu, sigma)
 
     if nk > 0:
         allx = np.concatenate([mu, mixnormrnd(pi, mu, sigma, nk)])
     else:
         allx = np.copy(mu)
-    allpx = mixnormpdf(allx, pi, mu, sigma, use_gpu=False)
     nk += k
 
-    mdict = {}  # modes
-    sm = []  # starting point of mode search
-    spm = []  # density at starting points
-
     etol = np.exp(tol)
-    # rnd = int(-1*np.floor(np.log10(tol)))
-    rnd = 1
+    # starting points climbed together, few enough that their weights fit
+    size = max(1, 2 ** 20 // k)
+    if workers is not None and workers > 1:
+        size = min(size, -(-nk // workers))
+    jobs = [(allx[i:i + size], factors, omega, a, etol, maxiter)
+            for i in range(0, nk, size)]
+    if workers is not None and workers > 1 and len(jobs) > 1:
+        pool = ThreadPool(workers)
+        try:
+            done = pool.map(_climb, jobs)
+        finally:
+            pool.close()
+    else:
+        done = [_climb(i) for i in jobs]
+    allpx = np.concatenate([i[0] for i in done])
+    modes = np.concatenate([i[1] for i in done])
+    pmodes = np.concatenate([i[2] for i in done])
 
+    mdict = {}  # modes
+    sm = list(allx)  # starting point of mode search
+    spm = list(allpx)  # density at starting points
     for js in range(nk):
-        x = allx[js]
-        px = allpx[js]
-        sm.append(x)
-        spm.append(px)
-        # w = compmixnormpdf(allx,pi,mu,sigma)
-        h = 0
-        eps = 1 + etol
-
-        while ((h <= maxiter) and (eps > etol)):
-            w = compmixnormpdf(x, pi, mu, sigma, use_gpu=False)
-            Y = np.sum([w[j] * omega[j] for j in range(k)], 0)
-            yy = np.dot(w, a)
-            y = solve(Y, yy)
-            py = mixnormpdf(y, pi, mu, sigma, use_gpu=False)
-            eps = py / px
-            x = y
-            px = py
-            h += 1
-
-        mdict[(js, tuple(x))] = [x, px]  # eliminate duplicates
+        x = modes[js]
+        mdict[(js, tuple(x))] = [x, pmodes[js]]  # eliminate duplicates
 
     return mdict, sm, spm
 
 
+def _climb(args):
+    """
+    fixed point iterations from the rows of x0 until the density stops
+    increasing by more than a factor etol, returns the starting densities,
+    the modes and their densities
+    """
+    x0, factors, omega, a, etol, maxiter = args
+    x = np.array(x0, dtype='d')
+    w = np.exp(factors.logpdf(x))
+    px = w.sum(1)
+    px0 = px.copy()
+    active = np.arange(x.shape[0])
+    h = 0
+    while h <= maxiter and active.size:
+        wa = w[active]
+        Y = np.einsum('nk,kij->nij', wa, omega)
+        yy = np.dot(wa, a)
+        y = solve(Y, yy[:, :, np.newaxis])[:, :, 0]
+        wy = np.exp(factors.logpdf(y))
+        py = wy.sum(1)
+        eps = py / px[active]
+        x[active] = y
+        px[active] = py
+        w[active] = wy
+        active = active[eps > etol]
+        h += 1
+    return px0, x, px
+
+
 def check_mode(m, pm, pi, mu, sigma):
     """Check that modes are local maxima"""
     k, p = mu.shape
@@ -1,10 +1,14 @@
+import os
 import unittest
 from numpy import array, all, equal, sum, log10, where, all, isreal, eye
 from fcm.core.transforms import _log_transform as log
 from random import randint
 
 from fcm import FCMdata
-from fcm import FCMcollection
+from fcm import FCMcollection, CollectionError, LazyFCMcollection
+from fcm import ThresholdGate
+from tempfile import mkdtemp
+from shutil import rmtree
 from numpy.ma.testutils import assert_array_equal, assert_equal
 from fcm import PolyGate
 
@@ -87,6 +91,104 @@ class FCMcollectionTestCase(unittest.TestCase):
         assert_array_equal(cls['test_fcm1'], array([0, 1]), 'Calssify failed')
         assert_array_equal(cls['test_fcm2'], array([0, 1]), 'Calssify failed')
 
+    def testParallel(self):
+        verts = array([[-.1, -.1], [-.1, 1.1], [1.1, 1.1], [1.1, -.1]])
+        g = PolyGate(verts, [0, 1])
+        for executor in ['thread', 'process']:
+            pnts = array([[1, 1, 1], [5, 5, 5]])
+            fcms = FCMcollection(
+                'fcms', [FCMdata('test_fcm%d' % i, pnts,
+                                 [('fsc', 'fsc'), ('ssc', 'ssc'),
+                                  ('cd3', 'cd3')], [0, 1])
+                         for i in range(4)],
+                workers=2, executor=executor)
+            fcm0 = fcms['test_fcm0']
+            fcms.gate(g)
+            self.assertTrue(fcms['test_fcm0'] is fcm0)
+            for i in fcms:
+                assert_array_equal(fcms[i].view(), array([[1, 1, 1]]))
+
+        from fcm.statistics import DPCluster, DPMixture
+        mix = DPMixture([DPCluster(.5, array([0, 0, 0]), eye(3)),
+                         DPCluster(.5, array([5, 5, 5]), eye(3))])
+        for i in fcms:
+            fcms[i].visit('root')
+        cls = fcms.classify(mix, workers=3, executor='thread')
+        assert_equal(list(cls.keys()), sorted(fcms.keys()))
+        assert_array_equal(cls['test_fcm3'], array([0, 1]))
+
+        fcms['test_fcm2'] = FCMdata('test_fcm2', array([[1, 1]]),
+                                    [('fsc', 'fsc'), ('ssc', 'ssc')], [0, 1])
+        try:
+            fcms.classify(mix)
+        except CollectionError as e:
+            assert_equal(list(e.errors.keys()), ['test_fcm2'])
+            assert_equal(len(e.results), 3)
+        else:
+            self.fail('classify did not raise a CollectionError')
+
+    def testLazy(self):
+        loaded = []
+
+        def loader(path, scale=1):
+            loaded.append(path)
+            pnts = scale * array([[1, 1, 1], [5, 5, 5]], 'd')
+            return FCMdata(path, pnts, [('fsc', 'fsc'), ('ssc', 'ssc'),
+                                        ('cd3', 'cd3')], [0, 1])
+
+        cache_dir = mkdtemp()
+        try:
+            fcms = LazyFCMcollection(
+                'lazy', ['/data/a.fcs', '/data/b.fcs', '/data/c.fcs'],
+                memory=50, cache_dir=cache_dir, loader=loader, scale=0.5)
+            assert_equal(sorted(fcms.keys()), ['a', 'b', 'c'])
+            assert_equal(loaded, [])
+
+            fcms.gate(ThresholdGate(1, 'fsc'))
+            assert_equal(len(loaded), 3)
+            assert_equal(list(fcms.fcmdict.keys()), ['c'])
+            assert_equal(sorted(fcms.spilled.keys()), ['a', 'b'])
+
+            # processed samples come back from the cache, not the files
+            assert_array_equal(fcms['a'].view(), array([[2.5, 2.5, 2.5]]))
+            assert_equal(len(loaded), 3)
+            assert_equal(len(fcms.fcmdict), 1)
+            assert isinstance(fcms.summary(), str)
+
+            # unchanged samples are not spilled again, changed ones are
+            spills = []
+            spill = fcms._spill
+            fcms._spill = lambda key, fcm: (spills.append(key),
+                                            spill(key, fcm))
+            fcms['b']
+            fcms['c']
+            assert_equal(spills, [])
+            fcms['c'].visit('root')
+            fcms['a']
+            assert_equal(spills, ['c'])
+            del fcms._spill
+
+            # replaced samples free their spill file, it must not be reused
+            fcms['d'] = loader('/data/d.fcs')
+            fcms['d'].gate(ThresholdGate(2, 'fsc'))
+            fcms['b'] = loader('/data/b.fcs')
+            fcms['c']
+            fcms['a']
+            assert_equal(len(set(fcms.spilled.values())), len(fcms.spilled))
+            assert_array_equal(fcms['d'].view(), array([[5, 5, 5]]))
+            fcms.close()
+            assert_equal(os.listdir(cache_dir), [])
+        finally:
+            rmtree(cache_dir)
+
+        fcms = LazyFCMcollection('lazy', ['/data/a.fcs', '/data/b.fcs'],
+                                 memory=50, loader=loader)
+        fcms.gate(ThresholdGate(1, 'fsc'))
+        cache_dir = fcms.cache_dir
+        assert os.path.isdir(cache_dir)
+        fcms.close()
+        assert not os.path.exists(cache_dir)
+
     def testSummary(self):
         msg = self.fcms.summary()
         assert isinstance(msg, str), "summary failed"
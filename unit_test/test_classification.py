@@ -0,0 +1,71 @@
+import unittest
+from numpy import array, eye, exp, log, vstack, concatenate
+from numpy.random import normal
+from numpy.testing import assert_array_equal, assert_array_almost_equal
+
+from fcm.statistics import DPCluster, DPMixture, classify_events
+from fcm.statistics.classification import iter_classify
+
+
+class ClassificationTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.mix = DPMixture([DPCluster(.25, array([0.0, 0.0]), eye(2)),
+                              DPCluster(.25, array([0.5, 0.0]), eye(2)),
+                              DPCluster(.5, array([4.0, 4.0]), eye(2))])
+        self.pnts = vstack([normal(0, 1, (101, 2)), normal(4, 1, (50, 2))])
+
+    def testBlocks(self):
+        probs = self.mix.prob(self.pnts, logged=True)
+        expected = probs.argmax(1)
+        # 8 events a block
+        for workers in [None, 3]:
+            z = self.mix.classify(self.pnts, memory=8 * 16 * 3,
+                                  workers=workers)
+            assert_array_equal(z, expected)
+
+        z, post, ent = self.mix.classify(self.pnts, posterior=True,
+                                         entropy=True, memory=1000)
+        p = exp(probs)
+        p /= p.sum(1)[:, None]
+        assert_array_equal(z, expected)
+        assert_array_almost_equal(post, p.max(1))
+        assert_array_almost_equal(ent, -(p * log(p)).sum(1))
+
+    def testChunks(self):
+        chunks = [self.pnts[:60], self.pnts[60:]]
+        assert_array_equal(
+            classify_events(self.mix.prob, chunks, 3, memory=500),
+            self.mix.classify(self.pnts))
+
+    def testChunksRead(self):
+        read = []
+
+        def chunks():
+            for i in range(0, 150, 10):
+                read.append(i)
+                yield self.pnts[i:i + 10]
+
+        blocks = iter_classify(self.mix.prob, chunks(), 3, memory=16 * 3 * 20,
+                               workers=2)
+        z = [next(blocks)]
+        # no more than a window of blocks is read ahead
+        self.assertTrue(len(read) <= 5)
+        z.extend(blocks)
+        self.assertEqual(len(read), 15)
+        assert_array_equal(concatenate(z), self.mix.classify(self.pnts[:150]))
+
+    def testModal(self):
+        modal = self.mix.make_modal()
+        z, post = modal.classify(self.pnts, posterior=True, memory=500)
+        self.assertEqual(len(modal), 2)
+        assert_array_equal(z, modal.prob(self.pnts, logged=True).argmax(1))
+        self.assertTrue((post <= 1).all())
+        self.assertEqual(modal.classify(array([4.0, 4.0])),
+                         modal.classify(array([[4.0, 4.0]]))[0])
+
+
+if __name__ == '__main__':
+    suite1 = unittest.makeSuite(ClassificationTestCase, 'test')
+
+    unittest.main()
@@ -1,7 +1,7 @@
 import sys
 # sys.path.append("/home/jolly/MyPython")
 
-from fcm.statistics import DPMixtureModel, DPMixture
+from fcm.statistics import DPMixtureModel, DPMixture, ParallelFit
 import unittest
 from numpy import array, eye, all
 import numpy as np
@@ -31,6 +31,19 @@ gen_corr = {
 
 group_weights = [0.4, 0.3, 0.3]
 
+
+class FirstEvent(DPMixtureModel):
+
+    """a model whose fits return its seed and the first event"""
+
+    def __init__(self, seed=None):
+        DPMixtureModel.__init__(self, 3, 10, 10, 1)
+        self.seed = seed
+
+    def _fit(self, x, verbose=False, normed=False, callback=None,
+             index=None):
+        return self.seed, float(x.view()[0, 0])
+
 # gen_mean = {
 #    0 : [0, 5],
 #    1 : [-10, 0],
@@ -120,6 +133,67 @@ class DPMixtureModel_TestCase(unittest.TestCase):
                 # print i, gen_mean[i], diffs[i], np.vdot(diffs[i],diffs[i])
                 assert(np.vdot(diffs[i], diffs[i]) < 4)
 
+    def testParallelFitting(self):
+        true1, data1 = self.generate_data()
+        true2, data2 = self.generate_data(seed=2)
+
+        model = DPMixtureModel(3, 100, 100, 1)
+        fitter = ParallelFit(model, chains=2, workers=2, seed=1)
+        done = []
+        rs = fitter.fit([data1, data2],
+                        progress=lambda i, n: done.append((i, n)))
+        assert(len(rs) == 2)
+        assert(done[-1] == (4, 4))
+        for r in rs:
+            assert(len(r) == 2)
+            for chain in r:
+                for i in gen_mean:
+                    diffs = np.min(np.abs(chain.mus - gen_mean[i]), 0)
+                    assert(np.vdot(diffs, diffs) < 1)
+
+        # the same seeds give the same fits in one process
+        serial = ParallelFit(model, chains=2, workers=1, seed=1)
+        np.testing.assert_array_equal(serial.fit(data1)[1].mus,
+                                      rs[0][1].mus)
+
+    def testParallelOrder(self):
+        fcms = [FCMdata(name, np.ones((4, 2)) * i, ['fsc', 'ssc'], [0, 1])
+                for i, name in enumerate(['c', 'a', 'd', 'b', 'e'])]
+        c = FCMcollection('fcms', fcms)
+        self.assertNotEqual(list(c), sorted(c))
+        rs_sorted = [(7, 1.0), (7, 3.0), (7, 0.0), (7, 2.0), (7, 4.0)]
+        for workers in [1, 2]:
+            # samples come back in the order of their names, every fit with
+            # the seed of the model
+            rs = ParallelFit(FirstEvent(7), workers=workers).fit(c)
+            self.assertEqual(rs, rs_sorted)
+        rs = ParallelFit(FirstEvent(7), chains=2, workers=2, seed=3).fit(
+            [fcms[0], fcms[1]])
+        seeds = ParallelFit(FirstEvent(7), chains=2, seed=3).seeds(4)
+        self.assertEqual(rs, [[(seeds[0], 0.0), (seeds[1], 0.0)],
+                              [(seeds[2], 1.0), (seeds[3], 1.0)]])
+
+        # the same order with and without workers
+        self.assertEqual(FirstEvent(7).fit(c), rs_sorted)
+        self.assertEqual(FirstEvent(7).fit(c, workers=2), rs_sorted)
+
+        model = DPMixtureModel(3, 100, 100, 1)
+        self.assertRaises(ValueError, model.fit, c, callback=lambda *x: 0,
+                          workers=2)
+
+    def testIndexFitting(self):
+        true, data = self.generate_data()
+        model = DPMixtureModel(3, 100, 100, 1)
+        model.seed = 1
+        r = model.fit(data, index=np.arange(0, data.shape[0], 2))
+        assert(model.data is None)
+        np.testing.assert_array_almost_equal(model.m, data[::2].mean(0))
+        for i in gen_mean:
+            diffs = np.min(np.abs(r.mus - gen_mean[i]), 0)
+            assert(np.vdot(diffs, diffs) < 1)
+        self.assertRaises(ValueError, model.fit, [data, data],
+                          index=np.arange(10))
+
     def testBEMFitting(self):
         print 'starting BEM'
         true, data = self.generate_data()
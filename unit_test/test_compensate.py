@@ -0,0 +1,109 @@
+import unittest
+import pickle
+from multiprocessing.pool import ThreadPool
+from numpy import array, eye, dot, outer, linspace, zeros
+from numpy.linalg import solve
+from numpy.testing import assert_array_almost_equal
+
+from fcm import FCMdata, FCMcollection
+from fcm.core import CompensationCache, compensate, estimate_spill
+
+
+class CompensateTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.pnts = array([[1.0, 2.0, 3.0], [4.0, 5.0, 6.0], [7.0, 8.0, 9.0]])
+        self.spill = array([[1.0, 0.1], [0.2, 1.0]])
+        self.markers = ['fl1', 'fl2']
+        self.channels = [('fsc', 'fsc'), ('fl1', 'fl1'), ('fl2', 'fl2')]
+        self.fcm = FCMdata('test_fcm', self.pnts, self.channels, [0])
+
+    def testCompensate(self):
+        cache = CompensationCache()
+        compensate(self.fcm, self.spill, self.markers, cache=cache)
+        expected = self.pnts.copy()
+        expected[:, 1:] = solve(self.spill.T, self.pnts[:, 1:].T).T
+        assert_array_almost_equal(self.fcm.view(), expected)
+        assert_array_almost_equal(self.fcm.tree.root.data, self.pnts)
+
+    def testCacheReuse(self):
+        cache = CompensationCache()
+        a = cache.get(self.spill, self.markers)
+        b = cache.get(self.spill.copy(), self.markers)
+        self.assertTrue(a is b, 'factorization was not reused')
+        self.assertEqual(len(cache), 1)
+        cache.get(self.spill, self.markers[::-1])
+        self.assertEqual(len(cache), 2)
+
+    def testCacheSize(self):
+        cache = CompensationCache(maxsize=1)
+        cache.get(self.spill)
+        cache.get(eye(2))
+        self.assertEqual(len(cache), 1)
+
+    def testThreads(self):
+        cache = CompensationCache(maxsize=2)
+        spills = [eye(2) * (i + 1) for i in range(4)]
+        pool = ThreadPool(4)
+        try:
+            factors = pool.map(lambda i: cache.get(spills[i % 4]), range(200))
+        finally:
+            pool.close()
+        for i, f in enumerate(factors):
+            assert_array_almost_equal(f, eye(2) / (i % 4 + 1))
+        self.assertEqual(len(cache), 2)
+
+    def testBlocked(self):
+        cache = CompensationCache()
+        out = self.pnts.copy()
+        cache.apply(out, self.spill, cols=[1, 2], blocksize=2)
+        assert_array_almost_equal(
+            out[:, 1:], dot(self.pnts[:, 1:], solve(self.spill, eye(2))))
+
+    def testCollection(self):
+        fcm2 = FCMdata('test_fcm2', self.pnts, self.channels, [0])
+        fcms = FCMcollection('fcms', [self.fcm, fcm2])
+        fcms.compensate(self.markers, self.spill)
+        assert_array_almost_equal(fcms['test_fcm'].view(),
+                                  fcms['test_fcm2'].view())
+
+    def testProcesses(self):
+        # the cache is pickled with each job, without its lock or entries
+        cache = CompensationCache()
+        cache.get(self.spill, self.markers)
+        copy = pickle.loads(pickle.dumps(cache))
+        self.assertEqual(len(copy), 0)
+        self.assertEqual(copy.maxsize, cache.maxsize)
+        copy.get(self.spill, self.markers)
+
+        fcm2 = FCMdata('test_fcm2', self.pnts, self.channels, [0])
+        fcms = FCMcollection('fcms', [self.fcm, fcm2], workers=2,
+                             executor='process')
+        fcms.compensate(self.markers, self.spill)
+        expected = self.pnts.copy()
+        expected[:, 1:] = solve(self.spill.T, self.pnts[:, 1:].T).T
+        assert_array_almost_equal(fcms['test_fcm'].view(), expected)
+        assert_array_almost_equal(fcms['test_fcm2'].view(), expected)
+
+    def testEstimateSpill(self):
+        unstained = zeros((11, 3))
+        amount = linspace(0, 100, 11)
+        tubes = {'fl1': unstained + outer(amount, [0, 1.0, 0.1]),
+                 'fl2': unstained + outer(amount, [0, 0.2, 1.0])}
+        for stat in ['mean', 'median', 'trimmed']:
+            markers, spill = estimate_spill(tubes, unstained, stat=stat,
+                                            channels=['fsc', 'fl1', 'fl2'])
+            self.assertEqual(markers, self.markers)
+            assert_array_almost_equal(spill, array([[1.0, 0.1], [0.2, 1.0]]))
+
+        # chunked controls gated on their brightest events
+        chunks = dict((i, [tubes[i][:5], tubes[i][5:]]) for i in tubes)
+        markers, spill = estimate_spill(chunks, pos_quantile=0.5,
+                                        channels=['fsc', 'fl1', 'fl2'],
+                                        workers=2)
+        assert_array_almost_equal(spill, array([[1.0, 0.1], [0.2, 1.0]]))
+
+if __name__ == '__main__':
+    suite1 = unittest.makeSuite(CompensateTestCase, 'test')
+
+    unittest.main()
@@ -4,9 +4,12 @@ Created on Oct 30, 2009
 @author: Jacob Frelinger
 '''
 import unittest
-from fcm.statistics import DPCluster, DPMixture
-from numpy import array, eye, all, dot
-from numpy.testing import assert_array_equal
+import pickle
+from fcm.statistics import DPCluster, DPMixture, ModalDPMixture
+from fcm.statistics.distributions import compmixnormpdf, mixnormrnd
+from numpy.random import RandomState, seed
+from numpy import array, eye, all, dot, log
+from numpy.testing import assert_array_equal, assert_array_almost_equal
 from numpy.testing.utils import assert_equal
 
 
@@ -123,6 +126,24 @@ class Dp_mixtureTestCase(unittest.TestCase):
         assert x.shape[0] == 10, "Number of drawed rows is wrong"
         assert x.shape[1] == 3, "number of drawed columns is wrong"
 
+    def testDrawSeed(self):
+        x = self.mix.draw(2000, seed=1)
+        assert_array_equal(x, self.mix.draw(2000, seed=RandomState(1)))
+        # half the events around each mean
+        assert_array_almost_equal(x.mean(0), (self.mu1 + self.mu2) / 2., 0)
+        y = mixnormrnd(self.mix.pis, self.mix.mus, self.mix.sigmas, 50, 3)
+        self.assertEqual(y.shape, (50, 3))
+        assert_array_equal(
+            y, mixnormrnd(self.mix.pis, self.mix.mus, self.mix.sigmas, 50, 3))
+        # without a seed the draws follow numpy.random.seed
+        seed(5)
+        x = self.mix.draw(100)
+        y = mixnormrnd(self.mix.pis, self.mix.mus, self.mix.sigmas, 50)
+        seed(5)
+        assert_array_equal(x, self.mix.draw(100))
+        assert_array_equal(
+            y, mixnormrnd(self.mix.pis, self.mix.mus, self.mix.sigmas, 50))
+
     def testarith(self):
         adder = 3
         array_adder = array([1, 2, 3])
@@ -257,6 +278,66 @@ class Dp_mixtureTestCase(unittest.TestCase):
             self.assertIsInstance(i, int)
             self.assertIs(
                 j, self.mix[i].sigma, 'fialed to return the right covariance when enumerating')
+
+    def testArrays(self):
+        mix = DPMixture((self.mix.pis, self.mix.mus, self.mix.sigmas),
+                        niter=3, identified=True)
+        assert_array_equal(mix.mus, self.mix.mus)
+        self.assertEqual(len(mix), 6)
+        self.assertTrue(mix[1].mu.base is mix.mus)
+        self.assertRaises(AttributeError, getattr, mix, 'centered_mus')
+        mix[1].pi = 0.25
+        self.assertEqual(mix.pis[1], 0.25)
+        self.assertEqual(self.mix.pis[1], .5 / 3)
+
+    def testFactors(self):
+        pnts = array([self.mu1, self.mu2, [1, 2, 3]])
+        expected = compmixnormpdf(pnts, self.mix.pis, self.mix.mus,
+                                  self.mix.sigmas, use_gpu=False)
+        assert_array_almost_equal(self.mix.prob(pnts, use_gpu=False),
+                                  expected)
+        factors = self.mix._components.factors()
+        self.mix[0].pi = 0.5
+        self.assertTrue(self.mix._components.factors() is factors)
+        assert_array_almost_equal(factors.logpi, log(self.mix.pis))
+        b = self.mix + 1
+        assert_array_almost_equal(b.prob(pnts + 1, use_gpu=False),
+                                  self.mix.prob(pnts, use_gpu=False))
+        self.mix[0].pi = .5 / 3
+
+    def testLegacyPickle(self):
+        # the state pickled before the components were stored as arrays
+        clusters = []
+        for i in self.mix:
+            c = DPCluster.__new__(DPCluster)
+            c.__dict__.update({'pi': i.pi, 'mu': i.mu.copy(),
+                               'sigma': i.sigma.copy(),
+                               '_centered_mu': None,
+                               '_centered_sigma': None})
+            clusters.append(c)
+        for cls, extra in [(DPMixture, {}),
+                           (ModalDPMixture, {'cmap': {0: [0, 2, 4],
+                                                      1: [1, 3, 5]},
+                                             'modemap': {0: self.mu1,
+                                                         1: self.mu2}})]:
+            legacy = cls.__new__(cls)
+            legacy.__dict__.update({'clusters': clusters, 'niter': 1,
+                                    'ident': False, 'm': None, 's': None})
+            legacy.__dict__.update(extra)
+            mix = pickle.loads(pickle.dumps(legacy, 2))
+            self.assertTrue(isinstance(mix, cls))
+            assert_array_equal(mix.mus, self.mix.mus)
+            assert_array_equal(mix.sigmas, self.mix.sigmas)
+            self.assertEqual(mix[1].pi, self.mix[1].pi)
+        assert_array_equal(mix.classify(array([self.mu1, self.mu2])), [0, 1])
+
+        c = pickle.loads(pickle.dumps(clusters[0], 2))
+        assert_array_equal(c.mu, self.mix[0].mu)
+        self.assertEqual(c.pi, self.mix[0].pi)
+        # and the current layout round trips
+        assert_array_equal(pickle.loads(pickle.dumps(self.mix, 2)).mus,
+                           self.mix.mus)
+
 if __name__ == "__main__":
     # import sys;sys.argv = ['', 'Test.testName']
     unittest.main()
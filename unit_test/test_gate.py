@@ -0,0 +1,245 @@
+import unittest
+from numpy import array, all, dot, vstack, histogram, argmax, where
+from numpy.linalg import inv
+from numpy.random import uniform, normal
+from numpy.testing import assert_array_equal, assert_array_almost_equal
+
+from fcm import FCMdata, points_in_poly
+from fcm import PolyGate, QuadGate, ThresholdGate, GatingPlan, AndGate
+from fcm import BoxGate, RectGate, EllipseGate
+from fcm import generate_f_score_gate, f_score_thresholds
+from fcm.core.gate import diff_pseudo_f1, _take_columns, GateExpression
+from fcm.core.tree import TransformNode
+from fcm.io.flowjoxml import PopulationNode
+
+
+class GateTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.square = array([[5, 5], [10, 5], [10, 10], [5, 10]], 'd')
+        self.pnts = uniform(0, 15, (500, 3))
+        self.fcm = FCMdata('test_fcm', self.pnts,
+                           [('fsc', 'fsc'), ('ssc', 'ssc'), ('fl-1', 'cd3')],
+                           [0, 1])
+
+    def testPointsInPoly(self):
+        pnts = array([[7, 7], [7, 12], [7, 2], [12, 7], [2, 7]], 'd')
+        assert_array_equal(points_in_poly(self.square, pnts),
+                           [True, False, False, False, False])
+
+    def testPointsInConcavePoly(self):
+        verts = array([[0, 0], [10, 0], [10, 10], [5, 2], [0, 10]], 'd')
+        pnts = array([[5, 1], [5, 5], [2, 5], [8, 5]], 'd')
+        assert_array_equal(points_in_poly(verts, pnts),
+                           [True, False, True, True])
+
+    def testPointsInPolyBlocks(self):
+        pnts = uniform(0, 15, (1000, 2))
+        expected = all((pnts > 5) & (pnts < 10), 1)
+        assert_array_equal(points_in_poly(self.square, pnts, blocksize=7),
+                           expected)
+        assert_array_equal(
+            points_in_poly(self.square, pnts, blocksize=100, workers=4),
+            expected)
+
+    def testQuadGate(self):
+        pnts = array([[6, 6], [4, 6], [4, 4], [6, 4], [5, 6], [6, 5]], 'd')
+        g = QuadGate([5, 5], ('fsc', 'ssc'))
+        assert_array_equal(g.labels(pnts), [1, 2, 3, 4, 0, 0])
+
+        nodes = g.gate(self.fcm, _full=True)
+        self.assertEqual(len(nodes), 4)
+        labels = nodes[0].labels
+        self.assertEqual(labels.dtype, 'uint8')
+        for i, node in enumerate(nodes):
+            self.assertTrue(node.labels is labels)
+            self.fcm.visit(node.name)
+            assert_array_equal(self.fcm.view(), self.pnts[labels == i + 1])
+
+    def testGridIndex(self):
+        verts = array([[1, 1], [14, 2], [8, 13], [7, 6], [3, 12]], 'd')
+        index = self.fcm.grid_index(['fsc', 'ssc'], bins=16)
+        self.assertTrue(self.fcm.grid_index([0, 1], bins=16) is index)
+        expected = points_in_poly(verts, self.pnts[:, :2])
+        assert_array_equal(index.mask(verts), expected)
+        self.assertEqual(index.count(verts), expected.sum())
+
+        quad = QuadGate([6, 9], (0, 1)).labels(self.pnts[:, :2])
+        assert_array_equal(index.quadrant_counts([6, 9]),
+                           [(quad == i).sum() for i in range(1, 5)])
+
+        poly = PolyGate(verts, (0, 1), 'poly')
+        self.assertRaises(ValueError, poly.gate, self.fcm, (0, 2),
+                          index=index)
+        poly.gate(self.fcm, index=index)
+        assert_array_equal(self.fcm.view(), self.pnts[expected])
+        # an index of the parent population is rebuilt for the gated one
+        gated = self.pnts[expected]
+        poly.gate(self.fcm, name='again', index=index)
+        assert_array_equal(self.fcm.view(),
+                           gated[points_in_poly(verts, gated[:, :2])])
+
+        # a transform keeps the number of events but moves them
+        self.fcm.visit('root')
+        self.fcm.add_view(TransformNode('', self.fcm.get_cur_node(),
+                                        self.pnts * 0.5))
+        self.assertFalse(self.fcm.current_node.indexed_by(index))
+        poly.gate(self.fcm, name='moved', index=index)
+        assert_array_equal(
+            self.fcm.view(),
+            self.pnts[points_in_poly(verts, self.pnts[:, :2] * 0.5)] * 0.5)
+        # the node's own index is rebuilt when its data is replaced
+        self.fcm.visit('root')
+        self.fcm.current_node.data = self.pnts * 2
+        fresh = self.fcm.grid_index([0, 1], bins=16)
+        self.assertFalse(fresh is index)
+        assert_array_equal(fresh.mask(verts),
+                           points_in_poly(verts, self.pnts[:, :2] * 2))
+
+    def testShapeGates(self):
+        x = self.pnts
+        RectGate([(10, 10), (5, 5)], ['fsc', 'ssc'], 'rect').gate(self.fcm)
+        assert_array_equal(self.fcm.view(),
+                           x[all((x[:, :2] > 5) & (x[:, :2] < 10), 1)])
+
+        self.fcm.visit('root')
+        box = BoxGate([(2, 3, 4), (12, 11, 10)], [0, 1, 2])
+        expected = all((x > [2, 3, 4]) & (x < [12, 11, 10]), 1)
+        assert_array_equal(box.mask(x), expected)
+        # events on the boundary are outside, as for the other gates
+        edge = array([[2, 5, 5], [5, 11, 5], [5, 5, 5]], 'd')
+        assert_array_equal(box.mask(edge), [False, False, True])
+        self.assertRaises(ValueError, BoxGate, [(2, 3), (12, 11)], [0, 1, 2])
+
+        cov = array([[4.0, 1.0], [1.0, 2.0]])
+        ellipse = EllipseGate([7, 8], cov, ['ssc', 'cd3'], distance=2,
+                              name='ellipse')
+        d = x[:, 1:] - [7, 8]
+        dist = (dot(d, inv(cov)) * d).sum(1)
+        assert_array_equal(ellipse.mask(x[:, 1:], blocksize=7), dist < 4)
+        self.fcm.gate(ellipse)
+        assert_array_equal(self.fcm.view(), x[dist < 4])
+        circle = EllipseGate([0, 0], [[1, 0], [0, 1]], [0, 1], distance=2)
+        assert_array_equal(circle.mask(array([[2, 0], [0, -1.5]], 'd')),
+                           [False, True])
+
+    def testGateExpression(self):
+        cd3 = ThresholdGate(5, 'cd3')
+        fsc = ThresholdGate(10, 0, 'l')
+        poly = PolyGate(self.square, ['fsc', 'ssc'])
+        expr = cd3 & ~fsc | poly & cd3
+        self.assertEqual(expr.chan, ['cd3', 0, 'fsc', 'ssc'])
+        self.assertTrue(isinstance(expr.gates[0], AndGate))
+        self.assertTrue(~~fsc is fsc)
+        self.assertEqual(len((cd3 & fsc & poly).gates), 3)
+
+        x = self.pnts
+        expected = (x[:, 2] > 5) & ~(x[:, 0] < 10) | \
+            (all((x[:, :2] > 5) & (x[:, :2] < 10), 1) & (x[:, 2] > 5))
+        self.fcm.gate(expr)
+        self.assertEqual(len(self.fcm.tree.nodes), 2)
+        assert_array_equal(self.fcm.view(), x[expected])
+
+    def testGateExpressionGates(self):
+        # quadrant gates have no single region to combine
+        quad = QuadGate([5, 5], ('fsc', 'ssc'))
+        cd3 = ThresholdGate(5, 'cd3')
+        self.assertRaises(TypeError, lambda: quad & cd3)
+        self.assertRaises(TypeError, lambda: cd3 | quad)
+        self.assertRaises(TypeError, lambda: ~quad)
+        self.assertRaises(TypeError, GateExpression, [cd3])
+
+        x = self.pnts
+        self.assertTrue(_take_columns(x, [1, 2]).base is x)
+        assert_array_equal(_take_columns(x, range(1, 3)), x[:, 1:3])
+        assert_array_equal(_take_columns(x, [2, 0]), x[:, [2, 0]])
+
+    def testFScoreThresholds(self):
+        neg = normal(0, 1, (2000, 2))
+        pos = vstack([normal(0, 1, (1000, 2)), normal(4, 1, (1000, 2))])
+
+        # reference: the quadratic sums over normalized histograms
+        neg_hist, bins = histogram(neg[:, 1], 1000)
+        pos_hist, bins = histogram(pos[:, 1], bins)
+        neg_hist = neg_hist / float(neg_hist.sum())
+        pos_hist = pos_hist / float(pos_hist.sum())
+        x0 = argmax(neg_hist)
+        n = 1000 - x0
+        fpos = where(pos_hist[x0:] > 2 * neg_hist[x0:],
+                     pos_hist[x0:] - neg_hist[x0:], 0)
+        tp = array([fpos[i:].sum() for i in range(n)])
+        fn = array([fpos[:i].sum() for i in range(n)])
+        fp = array([neg_hist[x0 + i:].sum() for i in range(n)])
+        assert_array_almost_equal(
+            diff_pseudo_f1(neg_hist[x0:], pos_hist[x0:]),
+            2 * tp * tp / (2 * tp * tp + tp * fp + tp * fn))
+
+        g = generate_f_score_gate(neg, pos, 1)
+        self.assertEqual(g.chan, 1)
+        self.assertEqual(g.op, 'g')
+        self.assertTrue(1 < g.vert < 4)
+
+        cutoffs = f_score_thresholds([neg, neg[::2]], [pos, pos[::2]], [0, 1])
+        self.assertEqual(cutoffs.shape, (2, 2))
+        self.assertAlmostEqual(cutoffs[0, 1], g.vert)
+        self.assertAlmostEqual(
+            cutoffs[1, 0], f_score_thresholds(neg[::2], pos[::2], 0)[0, 0])
+
+    def testGatingPlan(self):
+        poly = PolyGate(self.square, ['fsc', 'ssc'], 'lymph')
+        cd3 = ThresholdGate(7.5, ['cd3'], 'g', 'cd3')
+        quad = QuadGate([7.5, 7.5], [0, 2], 'abcd')
+        plan = GatingPlan([poly, (cd3, poly), (quad, 'lymph')])
+        nodes = plan.nodes(self.fcm)
+        self.assertEqual(len(nodes), 6)
+        self.assertTrue(self.fcm.current_node is self.fcm.tree.root)
+
+        inside = all((self.pnts[:, :2] > 5) & (self.pnts[:, :2] < 10), 1)
+        self.fcm.visit('lymph')
+        assert_array_equal(self.fcm.view(), self.pnts[inside])
+        self.fcm.visit('cd3')
+        assert_array_equal(self.fcm.view(),
+                           self.pnts[inside & (self.pnts[:, 2] > 7.5)])
+        self.assertTrue(self.fcm.current_node.parent.name == 'lymph')
+
+        # same populations as gating one gate at a time
+        other = FCMdata('other', self.pnts, self.fcm.tree.root.channels,
+                        [0, 1])
+        poly.gate(other)
+        quad.gate(other)
+        for name in 'abcd':
+            self.fcm.visit(name)
+            other.visit(name)
+            assert_array_equal(self.fcm.view(), other.view())
+
+    def testGatingPlanEmptyQuadrant(self):
+        # nothing is in the (-,-) quadrant so the gate below it is skipped
+        quad = QuadGate([-1, 7.5], [0, 1], 'abcd', allow_empty=False)
+        cd3 = ThresholdGate(7.5, ['cd3'], 'g', 'cd3')
+        poly = PolyGate(self.square, ['fsc', 'ssc'], 'lymph')
+        plan = GatingPlan([quad, (cd3, 'c'), (poly, 'a')])
+        nodes = plan.nodes(self.fcm)
+        self.assertEqual([i.name for i in nodes], ['a', 'd', 'lymph'])
+
+        other = FCMdata('other', self.pnts, self.fcm.tree.root.channels,
+                        [0, 1])
+        other.gate(plan)
+        other.visit('lymph')
+        self.fcm.visit('lymph')
+        assert_array_equal(other.view(), self.fcm.view())
+
+    def testGatingPlanFlowjo(self):
+        child = PopulationNode(
+            'cd3', ThresholdGate(7.5, ['cd3'], 'g', 'cd3'))
+        pop = PopulationNode('lymph', PolyGate(self.square, ['fsc', 'ssc'],
+                                               'lymph'), {'cd3': child})
+        pop.apply_gates(self.fcm)
+        self.fcm.visit('cd3')
+        inside = all((self.pnts[:, :2] > 5) & (self.pnts[:, :2] < 10), 1)
+        assert_array_equal(self.fcm.view(),
+                           self.pnts[inside & (self.pnts[:, 2] > 7.5)])
+
+if __name__ == '__main__':
+    suite1 = unittest.makeSuite(GateTestCase, 'test')
+
+    unittest.main()
@@ -1,7 +1,7 @@
 import unittest
 from fcm.statistics import DPCluster, ModalDPMixture
 from numpy import array, eye, all, ndarray, dot
-from numpy.testing import assert_array_equal
+from numpy.testing import assert_array_equal, assert_array_almost_equal
 from numpy.testing.utils import assert_equal
 from scipy.misc import logsumexp
 
@@ -56,6 +56,18 @@ class ModalDp_clusterTestCase(unittest.TestCase):
         assert self.mix.prob(pnt)[1] == self.clst3.prob(
             pnt), 'mixture generates different prob then compoent 2'
 
+    def testScatteredModes(self):
+        mix = ModalDPMixture([self.clst3, self.clst1, self.clst2],
+                             {1: [2, 1], 0: [0]}, {0: self.mu2, 1: self.mu1})
+        pnts = array([self.mu1, self.mu2, [1, 2, 3]])
+        for logged in [False, True]:
+            probs = mix.prob(pnts, logged=logged)
+            self.assertEqual(probs.shape, (3, 2))
+            assert_array_almost_equal(
+                probs[:, ::-1], self.mix.prob(pnts, logged=logged))
+            assert_array_almost_equal(mix.prob(pnts[2], logged=logged),
+                                      probs[2])
+
     def testclassify(self):
         pnt = array([self.mu1, self.mu2])
         assert self.mix.classify(array([self.mu1, self.mu2, self.mu1, self.mu2, self.mu1, self.mu2])).tolist(
@@ -0,0 +1,103 @@
+import os
+import tempfile
+import unittest
+from numpy import array, eye, memmap
+from numpy.random import normal
+from numpy.testing import assert_array_equal
+
+from fcm.statistics import DPCluster, DPMixture, ModalDPMixture, HDPMixture
+from fcm.statistics import ModalHDPMixture
+from fcm.io import save_mixture, load_mixture
+
+
+class MixtureIOTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.mix = DPMixture([DPCluster(.25, array([0.0, 0.0]), eye(2)),
+                              DPCluster(.25, array([0.5, 0.0]), eye(2)),
+                              DPCluster(.5, array([4.0, 4.0]), 2 * eye(2))],
+                             niter=1, m=array([1.0, 2.0]),
+                             s=array([2.0, 2.0]))
+        fd, self.fname = tempfile.mkstemp(suffix='.mix')
+        os.close(fd)
+        self.pnts = normal(0, 2, (50, 2))
+
+    def tearDown(self):
+        os.remove(self.fname)
+
+    def testDPMixture(self):
+        save_mixture(self.fname, self.mix)
+        for mmap in [True, False]:
+            r = load_mixture(self.fname, mmap=mmap)
+            self.assertTrue(isinstance(r, DPMixture))
+            self.assertEqual(isinstance(r.mus, memmap), mmap)
+            assert_array_equal(r.pis, self.mix.pis)
+            assert_array_equal(r.mus, self.mix.mus)
+            assert_array_equal(r.sigmas, self.mix.sigmas)
+            assert_array_equal(r.m, self.mix.m)
+            assert_array_equal(r.classify(self.pnts),
+                               self.mix.classify(self.pnts))
+        # loaded models can still be changed
+        r[0] = DPCluster(.25, array([1.0, 1.0]), eye(2))
+        assert_array_equal(r[0].mu, [1.0, 1.0])
+        assert_array_equal(load_mixture(self.fname)[0].mu, [0.0, 0.0])
+
+    def testModal(self):
+        modal = ModalDPMixture(self.mix, {0: [0, 1], 1: [2]},
+                               {0: array([0.2, 0.0]), 1: array([4.0, 4.0])})
+        save_mixture(self.fname, modal)
+        r = load_mixture(self.fname)
+        self.assertTrue(isinstance(r, ModalDPMixture))
+        self.assertEqual(r.cmap, modal.cmap)
+        assert_array_equal(r.modes, modal.modes)
+        assert_array_equal(r.prob(self.pnts), modal.prob(self.pnts))
+
+    def testHDP(self):
+        mix = HDPMixture(array([[.1, .1, .8], [.1, .8, .1]]),
+                         array([[2.0, 2], [3, 3], [4, 4]]),
+                         array([eye(2), eye(2), eye(2)]))
+        save_mixture(self.fname, mix)
+        r = load_mixture(self.fname)
+        self.assertTrue(isinstance(r, HDPMixture))
+        assert_array_equal(r.pis, mix.pis)
+        assert_array_equal(r.mus, mix.mus)
+        self.assertEqual(r.m, 0)
+
+    def testModalHDP(self):
+        mix = ModalHDPMixture(array([[.1, .1, .8], [.1, .8, .1]]),
+                              array([[2.0, 2], [2.2, 2], [6, 6]]),
+                              array([eye(2), eye(2), eye(2)]),
+                              {0: [0, 1], 1: [2]},
+                              {0: array([2.1, 2.0]), 1: array([6.0, 6.0])},
+                              identified=True)
+        save_mixture(self.fname, mix)
+        for mmap in [True, False]:
+            r = load_mixture(self.fname, mmap=mmap)
+            self.assertTrue(isinstance(r, ModalHDPMixture))
+            # the arrays stay mapped from the file, not copied
+            for x in [r.pis, r.mus, r.sigmas]:
+                self.assertEqual(getattr(x, 'filename', None) is not None,
+                                 mmap)
+            self.assertTrue(r.ident)
+            self.assertEqual(r.cmap, mix.cmap)
+            assert_array_equal(r.pis, mix.pis)
+            assert_array_equal(r.modes, mix.modes)
+            assert_array_equal(r.classify(self.pnts),
+                               mix.classify(self.pnts))
+        save_mixture(self.fname, mix.reorder({0: 1, 1: 0}))
+        r = load_mixture(self.fname)
+        self.assertEqual(r.lookup, {0: 1, 1: 0})
+        self.assertTrue(r.ident)
+
+    def testOrdered(self):
+        save_mixture(self.fname, self.mix.reorder({0: 2, 1: 0, 2: 1}))
+        r = load_mixture(self.fname)
+        self.assertEqual(r.lookup, {0: 2, 1: 0, 2: 1})
+
+    def testBadFile(self):
+        open(self.fname, 'wb').write(b'not a mixture')
+        self.assertRaises(ValueError, load_mixture, self.fname)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+import unittest
+from fcm.statistics.util import _mode_search, _climb, merge_modes
+from fcm.statistics.distributions import MixtureFactors
+from numpy import array, eye, exp, dot, concatenate
+from numpy.linalg import inv
+from numpy.testing import assert_array_almost_equal
+
+
+class ModeSearchTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.pi = array([0.3, 0.2, 0.2, 0.15, 0.1, 0.05])
+        self.mu = array([[0, 0], [0.5, 0.2], [4, 4],
+                         [4.3, 3.8], [-3, 2], [8, -1]], 'd')
+        self.sigma = array([eye(2), 0.5 * eye(2), eye(2),
+                            2 * eye(2), eye(2), 0.3 * eye(2)])
+
+    def _single(self, starts, tol=1e-6, maxiter=20):
+        """climb from each starting point on its own"""
+        factors = MixtureFactors(self.pi, self.mu, self.sigma)
+        omega = inv(self.sigma)
+        a = array([dot(i, j) for i, j in zip(omega, self.mu)])
+        done = [_climb((array([x]), factors, omega, a, exp(tol), maxiter))
+                for x in starts]
+        return (concatenate([i[1] for i in done]),
+                concatenate([i[2] for i in done]))
+
+    def _modes(self, mdict):
+        x = array([v[0] for k, v in sorted(mdict.items())])
+        px = array([v[1] for k, v in sorted(mdict.items())])
+        return x, px
+
+    def testBatched(self):
+        mdict, sm, spm = _mode_search(self.pi, self.mu, self.sigma, nk=20)
+        self.assertEqual(len(mdict), 26)
+        x, px = self._modes(mdict)
+        sx, spx = self._single(sm)
+        assert_array_almost_equal(x, sx)
+        assert_array_almost_equal(px, spx)
+
+    def testThreaded(self):
+        # enough starting points for every thread to climb from a few
+        mdict, sm, spm = _mode_search(self.pi, self.mu, self.sigma, nk=20,
+                                      workers=4)
+        self.assertEqual(len(mdict), 26)
+        x, px = self._modes(mdict)
+        sx, spx = self._single(sm)
+        assert_array_almost_equal(x, sx)
+        assert_array_almost_equal(px, spx)
+
+    def testMixtureMeans(self):
+        # without sampled points the starts are the means, so both agree
+        mdict, sm, spm = _mode_search(self.pi, self.mu, self.sigma)
+        tdict, tsm, tspm = _mode_search(self.pi, self.mu, self.sigma,
+                                        workers=3)
+        assert_array_almost_equal(array(sm), self.mu)
+        assert_array_almost_equal(array(tsm), self.mu)
+        assert_array_almost_equal(array(spm), array(tspm))
+        x, px = self._modes(mdict)
+        tx, tpx = self._modes(tdict)
+        assert_array_almost_equal(x, tx)
+        assert_array_almost_equal(px, tpx)
+
+
+    def testMergeChain(self):
+        # 2, 5, 3, 6 are each within delta of the next but the ends are not
+        xs = array([[5, 0], [10, 0], [0, 0], [0.16, 0],
+                    [10.05, 0], [0.08, 0], [0.24, 0]])
+        modes, rslt = merge_modes(xs, 0.1)
+        self.assertEqual(rslt, {0: (2, 3, 5, 6), 1: (1, 4), 2: (0,)})
+        assert_array_almost_equal(modes[0], [0.12, 0])
+        assert_array_almost_equal(modes[1], [10.025, 0])
+        assert_array_almost_equal(modes[2], [5, 0])
+
+    def testMergeDistance(self):
+        # points exactly delta apart are not merged, ties keep their order
+        xs = array([[0, 0], [0, 0.5], [3, 0], [3, 0.25]])
+        modes, rslt = merge_modes(xs, 0.5)
+        self.assertEqual(rslt, {0: (2, 3), 1: (0,), 2: (1,)})
+        modes, rslt = merge_modes(xs, 0.4, scale=True)
+        self.assertEqual(rslt, {0: (0, 1), 1: (2, 3)})
+        modes, rslt = merge_modes(xs, 0.4, w=array([1, 4]))
+        self.assertEqual(rslt, {0: (0,), 1: (1,), 2: (2,), 3: (3,)})
+        modes, rslt = merge_modes(xs, 1.1, w=array([1, 4]))
+        self.assertEqual(rslt, {0: (0, 1), 1: (2, 3)})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import unittest
+from numpy import vstack, float32, arange
+from numpy.random import normal
+from numpy.testing import assert_array_almost_equal
+
+from fcm import FCMdata, FCMcollection, LazyFCMcollection
+from fcm.statistics import PooledData
+
+
+class PooledDataTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.pnts = [normal(i, i + 1, (50 * (i + 1), 3)) for i in range(3)]
+        self.fcms = FCMcollection(
+            'fcms', [FCMdata('fcm%d' % i, x,
+                             [('fsc', 'fsc'), ('ssc', 'ssc'), ('cd3', 'cd3')],
+                             [0, 1])
+                     for i, x in enumerate(self.pnts)])
+
+    def testPooled(self):
+        pooled = PooledData(self.fcms, blocksize=16)
+        total = vstack(self.pnts)
+        assert_array_almost_equal(pooled.m, total.mean(0))
+        assert_array_almost_equal(pooled.s, total.std(0))
+        self.assertEqual(len(pooled), 3)
+        self.assertEqual(pooled.shape, total.shape)
+        for i, x in enumerate(self.pnts):
+            assert_array_almost_equal(pooled[i],
+                                      (x - total.mean(0)) / total.std(0))
+            self.assertTrue(pooled[i].base is pooled.data)
+            assert_array_almost_equal(pooled.restore(i), x)
+
+    def testNormed(self):
+        pooled = PooledData(self.pnts, normed=True, index=arange(40))
+        assert_array_almost_equal(pooled.m, [0, 0, 0])
+        assert_array_almost_equal(pooled.s, [1, 1, 1])
+        self.assertEqual(pooled.shape, (120, 3))
+        for i, x in enumerate(self.pnts):
+            assert_array_almost_equal(pooled[i], x[:40])
+
+    def testLazy(self):
+        loaded = []
+
+        def loader(path):
+            loaded.append(path)
+            return self.fcms['fcm%s' % path[-1]]
+
+        fcms = LazyFCMcollection('lazy', dict(('fcm%d' % i, 'path%d' % i)
+                                              for i in range(3)),
+                                 memory=1, loader=loader)
+        pooled = PooledData(fcms)
+        total = vstack(self.pnts)
+        assert_array_almost_equal(pooled.m, total.mean(0))
+        assert_array_almost_equal(pooled.restore(2), self.pnts[2])
+        # samples are let go between the two passes
+        self.assertEqual(len(loaded), 6)
+        self.assertEqual(len(fcms.fcmdict), 1)
+
+    def testIndex(self):
+        x = self.pnts[2]
+        for index in [arange(0, 150, 3), x[:, 0] > 2, slice(10, 100)]:
+            # gathered a block at a time as if selected first
+            pooled = PooledData([self.fcms['fcm2']], index=index,
+                                blocksize=16)
+            assert_array_almost_equal(pooled.m, x[index].mean(0))
+            assert_array_almost_equal(pooled.s, x[index].std(0))
+            assert_array_almost_equal(pooled.restore(), x[index])
+
+    def testFloat32(self):
+        pooled = PooledData(self.pnts, dtype='float32')
+        self.assertEqual(pooled.data.dtype, float32)
+        assert_array_almost_equal(pooled.restore(1), self.pnts[1], 4)
+        self.assertRaises(ValueError, PooledData,
+                          [self.pnts[0], self.pnts[1][:, :2]])
+
+
+if __name__ == '__main__':
+    suite1 = unittest.makeSuite(PooledDataTestCase, 'test')
+
+    unittest.main()
@@ -0,0 +1,105 @@
+import unittest
+from numpy import array, eye, outer
+from numpy.random import uniform, normal
+from numpy.testing import assert_array_almost_equal
+
+from fcm.statistics import DPMixture, HDPMixture, PosteriorAverage
+
+
+class PosteriorAverageTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.pis = uniform(size=(20, 3))
+        self.mus = normal(size=(20, 3, 2))
+        self.sigmas = array([[eye(2) * uniform(1, 2) for j in range(3)]
+                             for i in range(20)])
+
+    def feed(self, avg, pis=None):
+        if pis is None:
+            pis = self.pis
+        for i in range(20):
+            avg(pis[i], self.mus[i], self.sigmas[i])
+
+    def testMeans(self):
+        avg = PosteriorAverage(variance=True)
+        self.feed(avg)
+        r = avg.results()
+        self.assertTrue(isinstance(r, DPMixture))
+        assert_array_almost_equal(r.pis, self.pis.mean(0))
+        assert_array_almost_equal(r.mus, self.mus.mean(0))
+        assert_array_almost_equal(r.sigmas, self.sigmas.mean(0))
+        pis, mus, sigmas = avg.variances()
+        assert_array_almost_equal(pis, self.pis.var(0))
+        assert_array_almost_equal(mus, self.mus.var(0))
+        assert_array_almost_equal(sigmas, self.sigmas.var(0))
+
+    def testScale(self):
+        m = array([1.0, -2.0])
+        s = array([2.0, 3.0])
+        avg = PosteriorAverage(variance=True)
+        avg.scale(m, s)
+        self.feed(avg)
+        r = avg.results()
+        assert_array_almost_equal(r.mus, self.mus.mean(0) * s + m)
+        assert_array_almost_equal(r.sigmas,
+                                  self.sigmas.mean(0) * outer(s, s))
+        assert_array_almost_equal(r.m, m)
+        assert_array_almost_equal(avg.variances()[1],
+                                  self.mus.var(0) * s ** 2)
+
+    def testSkipThin(self):
+        avg = PosteriorAverage(skip=5, thin=3)
+        self.feed(avg)
+        self.assertEqual(avg.count, 5)
+        assert_array_almost_equal(avg.results().mus,
+                                  self.mus[5::3].mean(0))
+        self.assertRaises(ValueError, avg.variances)
+        avg.reset()
+        self.assertRaises(ValueError, avg.results)
+
+    def testHDP(self):
+        pis = uniform(size=(20, 4, 3))
+        avg = PosteriorAverage()
+        self.feed(avg, pis)
+        r = avg.results()
+        self.assertTrue(isinstance(r, HDPMixture))
+        assert_array_almost_equal(r.pis, pis.mean(0))
+        assert_array_almost_equal(r.mus, self.mus.mean(0))
+
+
+    def testShapes(self):
+        avg = PosteriorAverage()
+        # too few arguments, or in the wrong order
+        self.assertRaises(TypeError, avg, self.pis[0], self.mus[0])
+        self.assertRaises(ValueError, avg, self.mus[0], self.pis[0],
+                          self.sigmas[0])
+        self.assertRaises(ValueError, avg, self.pis[0], self.mus[0],
+                          self.sigmas[0, :2])
+        self.assertEqual(avg.count, 0)
+        avg(self.pis[0], self.mus[0], self.sigmas[0])
+        # a draw of a different size than the first
+        self.assertRaises(ValueError, avg, self.pis[1, :2], self.mus[1, :2],
+                          self.sigmas[1, :2])
+        self.assertEqual(avg.count, 1)
+
+    def testSampler(self):
+        # the draws a dpmix sampler stores, one per row
+        sampler = Draws()
+        sampler.weights = self.pis
+        sampler.mu = self.mus
+        sampler.Sigma = self.sigmas
+        avg = PosteriorAverage(skip=2)
+        avg.add_sampler(sampler)
+        self.assertEqual(avg.count, 18)
+        assert_array_almost_equal(avg.results().mus, self.mus[2:].mean(0))
+
+        sampler.Sigma = self.sigmas[:10]
+        self.assertRaises(ValueError, avg.add_sampler, sampler)
+        self.assertRaises(ValueError, avg.add_sampler, Draws())
+
+
+class Draws(object):
+    pass
+
+if __name__ == '__main__':
+    unittest.main()
@@ -5,9 +5,15 @@ Created on Aug 27, 2009
 '''
 import unittest
 from fcm import FCMdata
-from fcm import PolyGate
-from fcm.core import SubsampleFactory
-from numpy import array
+from fcm import PolyGate, ThresholdGate
+from fcm.core import SubsampleFactory, RandomSubsample, StratifiedSubsample
+from fcm.core import reservoir_sample, AnomalySubsample, BiasSubsample
+from fcm.core.subsample import weighted_sample, log_mixture_densities
+from fcm.statistics import DPCluster, DPMixture, mixnormpdf
+from numpy import array, arange, unique, all, bincount, inf, ones, zeros, eye
+from numpy import log
+from numpy.random import uniform, seed
+from numpy.testing import assert_array_equal, assert_array_almost_equal
 
 
 class SubsampleTestCase(unittest.TestCase):
@@ -33,6 +39,88 @@ class SubsampleTestCase(unittest.TestCase):
         self.fcm.subsample(self.samp).subsample(sam2)
         assert self.fcm.view() == 1, 'subsample chaining failed'
 
+    def testRandomSubsample(self):
+        pnts = uniform(0, 1, (1000, 2))
+        fcm = FCMdata('test_fcm', pnts, [('fsc', 'fsc'), ('ssc', 'ssc')], [0])
+        fcm.subsample(100, seed=3)
+        node = fcm.get_cur_node()
+        self.assertEqual(node.param.dtype, 'int32')
+        self.assertEqual(len(unique(node.param)), 100)
+        self.assertEqual(node.count(), 100)
+        fcm.visit('root')
+        fcm.subsample(RandomSubsample(100, seed=3))
+        assert_array_equal(fcm.get_cur_node().param, node.param)
+
+        fcm.visit('root')
+        ThresholdGate(0.5, 0).gate(fcm)
+        fcm.subsample(50, seed=1)
+        x = fcm.view()
+        self.assertEqual(len(unique(x[:, 0])), 50)
+        self.assertTrue(all(x[:, 0] > 0.5))
+        # oversized requests take the whole view
+        n = fcm.get_cur_node().count()
+        fcm.subsample(RandomSubsample(10 ** 4))
+        assert_array_equal(fcm.get_cur_node().param, arange(n))
+
+        # without a seed the global numpy state is used
+        seed(5)
+        a = RandomSubsample(10).subsample(pnts)
+        seed(5)
+        assert_array_equal(RandomSubsample(10).subsample(pnts), a)
+
+    def testReservoirSample(self):
+        pnts = arange(1000).reshape((500, 2))
+        chunks = (pnts[i:i + 64] for i in range(0, 500, 64))
+        idx, events = reservoir_sample(chunks, 40, seed=2)
+        self.assertEqual(idx.dtype, 'int32')
+        self.assertEqual(len(unique(idx)), 40)
+        assert_array_equal(events, pnts[idx])
+        idx, events = reservoir_sample([pnts[:10], pnts[10:20]], 40)
+        assert_array_equal(idx, arange(20))
+
+    def testStratifiedSubsample(self):
+        labels = array([0] * 50 + [1] * 30 + [2] * 5 + [-1] * 15)
+        pnts = uniform(0, 1, (100, 2))
+        strat = StratifiedSubsample(10, labels, seed=0)
+        counts = bincount(labels[strat.sample(labels)] + 1)
+        assert_array_equal(counts, [0, 10, 10, 5])
+        strat = StratifiedSubsample({1: 20, 2: 2}, labels, seed=0)
+        x = strat.subsample(pnts)
+        self.assertEqual(x.shape, (22, 2))
+
+        fcm = FCMdata('test_fcm', pnts, [('fsc', 'fsc'), ('ssc', 'ssc')], [0])
+        gates = [ThresholdGate(0.5, 'fsc'), ThresholdGate(0.5, 'ssc')]
+        fcm.subsample(4, 'stratified', gates, seed=1)
+        x = fcm.view()
+        self.assertEqual(x.shape, (8, 2))
+        self.assertEqual(sum(x[:, 0] > 0.5), 4)
+
+    def testWeightedSample(self):
+        logw = array([0, -inf, 0, 0, -inf])
+        assert_array_equal(weighted_sample(logw, 3), [0, 2, 3])
+        assert_array_equal(weighted_sample(logw, 4), [0, 2, 3])
+        logw = -1000 * ones(100)
+        logw[[7, 42]] = 0
+        assert_array_equal(weighted_sample(logw, 2, seed=0), [7, 42])
+
+    def testBiasSubsample(self):
+        neg = DPMixture([DPCluster(1.0, zeros(2), eye(2))])
+        pos = DPMixture([DPCluster(0.5, array([4.0, 4.0]), eye(2)),
+                         DPCluster(0.5, array([-4.0, 4.0]), eye(2))])
+        pnts = uniform(-6, 6, (2000, 2))
+        logp = log_mixture_densities(pnts, [pos, neg], chunksize=300)
+        assert_array_almost_equal(
+            logp[:, 1], log(mixnormpdf(pnts, neg.pis, neg.mus, neg.sigmas)))
+
+        x = BiasSubsample(100, pos, neg, seed=0).subsample(pnts)
+        self.assertEqual(len(unique(x[:, 0])), 100)
+        self.assertTrue(x[:, 1].mean() > 2)
+
+        fcm = FCMdata('test_fcm', pnts, [('fsc', 'fsc'), ('ssc', 'ssc')], [0])
+        AnomalySubsample(100, neg, seed=0, chunksize=300).subsample(fcm)
+        self.assertEqual(fcm.get_cur_node().param.dtype, 'int32')
+        self.assertTrue(abs(fcm.view()).mean() > 2)
+
 
 if __name__ == "__main__":
     #import sys;sys.argv = ['', 'Test.testSubSample']
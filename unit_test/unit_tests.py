@@ -21,6 +21,13 @@ from test_mhdpmixture import ModalHDp_clusterTestCase
 from test_data_align import DiagAlignTestCase
 from test_ordereddpmixture import OrderedDp_mixtureTestCase
 from test_cluster_align import ClusterAlignTestCase
+from test_compensate import CompensateTestCase
+from test_gate import GateTestCase
+from test_pooled import PooledDataTestCase
+from test_classification import ClassificationTestCase
+from test_posterior import PosteriorAverageTestCase
+from test_mixture_io import MixtureIOTestCase
+from test_modesearch import ModeSearchTestCase
 
 if __name__ == "__main__":
     suite1 = unittest.makeSuite(FCMdataTestCase, 'test')
@@ -41,9 +48,18 @@ if __name__ == "__main__":
     suite16 = unittest.makeSuite(DiagAlignTestCase, 'test')
     suite17 = unittest.makeSuite(OrderedDp_mixtureTestCase, 'test')
     suite18 = unittest.makeSuite(ClusterAlignTestCase, 'test')
+    suite19 = unittest.makeSuite(CompensateTestCase, 'test')
+    suite20 = unittest.makeSuite(GateTestCase, 'test')
+    suite21 = unittest.makeSuite(PooledDataTestCase, 'test')
+    suite22 = unittest.makeSuite(ClassificationTestCase, 'test')
+    suite23 = unittest.makeSuite(PosteriorAverageTestCase, 'test')
+    suite24 = unittest.makeSuite(MixtureIOTestCase, 'test')
+    suite25 = unittest.makeSuite(ModeSearchTestCase, 'test')
     alltests = unittest.TestSuite((suite1, suite2, suite3, suite4, suite5,
                                    suite6, suite7, suite8, suite10, suite11,
                                    suite12, suite13, suite14, suite15,
-                                   suite16, suite17, suite18))
+                                   suite16, suite17, suite18, suite19,
+                                   suite20, suite21,
+                                   suite22, suite23, suite24, suite25))
 
     unittest.main()